@@ -0,0 +1,72 @@
+# bench_combat_ledger.py
+"""
+Memory and query cost of the columnar combat ledger versus keeping every
+damage and kill event as its MessageToDict dict and aggregating in Python.
+
+    python benchmarks/bench_combat_ledger.py
+"""
+import tracemalloc
+from collections import defaultdict
+from fixtures import best_of, match
+from google.protobuf.json_format import MessageToDict
+import combat_ledger
+
+DAMAGED = 'rtech.liveapi.PlayerDamaged'
+
+def traced(fn):
+    """fn()'s result and the bytes it still holds once it returns."""
+    tracemalloc.start()
+    result = fn()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, retained
+
+def main():
+    events = [(t, m) for t, m in match(damage_events=60000) if t in combat_ledger.LEDGER_TYPES]
+    dicts, dict_bytes = traced(lambda: [(t, MessageToDict(m)) for t, m in events])
+
+    def fill_ledger():
+        ledger = combat_ledger.CombatLedger()
+        for type_name, message in events:
+            ledger.apply(type_name, message)
+        return ledger
+
+    ledger, ledger_bytes = traced(fill_ledger)
+    append = best_of(3, fill_ledger) / len(events)
+    print(f"{len(events)} damage and kill events")
+    print(f"memory: dicts {dict_bytes / 1e6:.1f} MB, ledger {ledger_bytes / 1e6:.2f} MB "
+          f"(columns {ledger.memory_usage() / 1e6:.2f} MB); ledger append {append * 1e6:.2f} us/event")
+
+    def dict_damage_by_weapon():
+        totals = defaultdict(int)
+        for type_name, data in dicts:
+            if type_name == DAMAGED:
+                totals[data.get('weapon', '')] += data.get('damageInflicted', 0)
+        return totals
+
+    def dict_player_totals():
+        totals = defaultdict(lambda: defaultdict(int))
+        for type_name, data in dicts:
+            attacker = data.get('attacker', {}).get('nucleusHash')
+            victim = data.get('victim', {}).get('nucleusHash')
+            if type_name == DAMAGED:
+                totals[attacker]['damageDealt'] += data.get('damageInflicted', 0)
+                totals[victim]['damageTaken'] += data.get('damageInflicted', 0)
+            else:
+                totals[attacker]['kills'] += 1
+                totals[victim]['deaths'] += 1
+        return totals
+
+    def dict_window():
+        return sum(data.get('damageInflicted', 0) for type_name, data in dicts
+                   if type_name == DAMAGED and 1000 <= int(data['timestamp']) < 20000)
+
+    for name, with_dicts, with_ledger in (
+            ("damage by weapon", dict_damage_by_weapon, ledger.damage_by_weapon),
+            ("per-player totals", dict_player_totals, ledger.player_totals),
+            ("damage in a window", dict_window, lambda: ledger.damage_by_weapon(1000, 20000))):
+        print(f"{name}: dicts {best_of(10, with_dicts) * 1e3:.2f} ms, ledger {best_of(10, with_ledger) * 1e3:.2f} ms")
+    print(f"damage timeline, 30 s buckets: ledger {best_of(10, lambda: ledger.damage_timeline(30)) * 1e3:.2f} ms")
+
+if __name__ == '__main__':
+    main()
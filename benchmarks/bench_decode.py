@@ -0,0 +1,38 @@
+# bench_decode.py
+"""
+Decode throughput of LiveAPI frames: the symbol_database lookup and unpack
+the server used to do per frame versus websocket_server.decode_frame with
+its prebuilt type-URL table (DECODERS). decode_frame leaves the payload to
+be parsed by the first sink that reads it; no sinks are registered here.
+
+    python benchmarks/bench_decode.py
+"""
+import asyncio
+from fixtures import best_of, burst
+from google.protobuf import symbol_database
+import events_pb2
+import websocket_server
+
+def main():
+    frames = burst()
+
+    def symbol_database_lookup():
+        for frame in frames:
+            event = events_pb2.LiveAPIEvent()
+            event.ParseFromString(frame)
+            message = symbol_database.Default().GetSymbol(event.gameMessage.TypeName())()
+            event.gameMessage.Unpack(message)
+
+    async def decode_all():
+        for frame in frames:
+            await websocket_server.decode_frame(frame)
+
+    def decode_frame():
+        asyncio.run(decode_all())
+
+    for fn in (symbol_database_lookup, decode_frame):
+        seconds = best_of(5, fn)
+        print(f"{fn.__name__}: {len(frames) / seconds:,.0f} events/sec")
+
+if __name__ == '__main__':
+    main()
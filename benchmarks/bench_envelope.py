@@ -0,0 +1,59 @@
+# bench_envelope.py
+"""
+Cost per event of feeding the Pub/Sub and Redis sinks: building the dict and
+JSON separately for each sink (as before the shared envelope) versus one
+lazily built EventEnvelope whose JSON bytes both sinks reuse. Allocations
+still held after each run are measured with tracemalloc.
+
+    python benchmarks/bench_envelope.py
+"""
+import json
+import tracemalloc
+from fixtures import best_of, burst
+from google.protobuf.json_format import MessageToDict
+import events_pb2
+import event_registry
+from event_envelope import EventEnvelope
+
+async def _ignore(envelope):
+    pass
+
+def main():
+    table = event_registry.build_decoder_table(_ignore)
+    anys = []
+    for frame in burst(5000):
+        event = events_pb2.LiveAPIEvent()
+        event.ParseFromString(frame)
+        anys.append(event.gameMessage)
+    kept = []
+
+    def per_sink_copies():
+        for any_msg in anys:
+            entry = table[any_msg.type_url]
+            message = entry.message_class()
+            message.ParseFromString(any_msg.value)
+            data = MessageToDict(message)
+            kept.append(json.dumps(data).encode("utf-8"))  # Pub/Sub
+            kept.append(json.dumps(data))                  # Redis
+
+    def shared_envelope():
+        for any_msg in anys:
+            entry = table[any_msg.type_url]
+            envelope = EventEnvelope(entry.type_name, raw=any_msg.value, message_class=entry.message_class)
+            if envelope.data:
+                kept.append(envelope.json_bytes)
+                kept.append(envelope.json_bytes)
+
+    for fn in (per_sink_copies, shared_envelope):
+        seconds = best_of(3, lambda: (kept.clear(), fn()))
+        kept.clear()
+        tracemalloc.start()
+        fn()
+        retained = tracemalloc.get_traced_memory()[0]
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        tracemalloc.stop()
+        print(f"{fn.__name__}: {seconds / len(anys) * 1e6:.1f} us/event, "
+              f"retained {retained / len(anys):.0f} B/event in {blocks / len(anys):.1f} blocks/event")
+
+if __name__ == '__main__':
+    main()
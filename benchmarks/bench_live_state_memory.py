@@ -0,0 +1,82 @@
+# bench_live_state_memory.py
+"""
+Memory retained by the live state (match state, position table, roster and
+the player registry they share) after a whole match re-parsed from wire
+bytes plus 50 lobby updates, measured with tracemalloc. The same run with
+string interning switched off, and the per-event dicts the match would
+take if kept as MessageToDict output, are printed for comparison.
+
+    python benchmarks/bench_live_state_memory.py
+"""
+import asyncio
+import gc
+import tracemalloc
+from fixtures import match
+from google.protobuf.json_format import MessageToDict
+import events_pb2
+import match_state
+import models
+import positions
+import roster
+from event_envelope import EventEnvelope
+
+LOBBY_UPDATES = 50
+
+def lobby_from(events):
+    lobby = events_pb2.CustomMatch_LobbyPlayers()
+    seen = set()
+    for type_name, message in events:
+        if type_name != 'rtech.liveapi.PlayerDamaged':
+            continue
+        for player in (message.attacker, message.victim):
+            if player.nucleusHash not in seen:
+                seen.add(player.nucleusHash)
+                lobby.players.add(name=player.name, teamId=player.teamId, nucleusHash=player.nucleusHash,
+                                  hardwareName=player.hardwareName)
+    return lobby
+
+def live_state_bytes(wire, lobby):
+    """Replays the lobby updates and the match into fresh live state; returns the bytes it retains."""
+    async def run():
+        models.registry.reset()
+        match_state.state = match_state.MatchState()
+        positions.table = positions.PositionTable()
+        roster.roster = roster.RosterIndex()
+        gc.collect()
+        tracemalloc.start()
+        for _ in range(LOBBY_UPDATES):
+            await roster.roster_sink(EventEnvelope(roster.LOBBY_PLAYERS_TYPE, data=MessageToDict(lobby)))
+        for type_name, message_class, raw in wire:
+            envelope = EventEnvelope(type_name, raw=raw, message_class=message_class)
+            match_state.state.apply(type_name, envelope.message)
+            if type_name in positions.SINK_TYPES:
+                await positions.position_sink(envelope)
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return retained
+
+    return asyncio.run(run())
+
+def main():
+    events = match(damage_events=60000)
+    # Frames arrive as bytes, so every string in a parsed message is a new object
+    wire = [(type_name, type(message), message.SerializeToString()) for type_name, message in events]
+    lobby = lobby_from(events)
+    print(f"{len(wire)} events, {len(lobby.players)} lobby players")
+    print(f"live state: {live_state_bytes(wire, lobby) / 1024:.1f} KiB")
+    interned = models.intern_str
+    models.intern_str = lambda value: value
+    try:
+        print(f"live state without interning: {live_state_bytes(wire, lobby) / 1024:.1f} KiB")
+    finally:
+        models.intern_str = interned
+    gc.collect()
+    tracemalloc.start()
+    kept = [MessageToDict(message_class.FromString(raw)) for _, message_class, raw in wire]
+    print(f"per-event dicts for the same match: {tracemalloc.get_traced_memory()[0] / 1e6:.1f} MB")
+    tracemalloc.stop()
+    del kept
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# bench_match_state.py
+"""
+Replay throughput of the live match-state engine over a whole synthetic
+match, and the cost of the team scoreboard on its first read after a
+change versus a repeated read served from the rendered cache.
+
+    python benchmarks/bench_match_state.py
+"""
+import time
+from fixtures import best_of, match
+import match_state
+
+def main():
+    events = match()
+    state = None
+
+    def replay():
+        nonlocal state
+        state = match_state.MatchState()
+        for type_name, message in events:
+            state.apply(type_name, message)
+
+    seconds = best_of(5, replay)
+    print(f"replay: {len(events)} events in {seconds * 1e3:.1f} ms, "
+          f"{len(events) / seconds:,.0f} events/sec, {seconds / len(events) * 1e6:.2f} us/event")
+    started = time.perf_counter()
+    state.team_scoreboard_json()
+    first = time.perf_counter() - started
+    cached = best_of(100, state.team_scoreboard_json)
+    print(f"team scoreboard: first render {first * 1e3:.2f} ms, cached {cached * 1e6:.1f} us")
+
+if __name__ == '__main__':
+    main()
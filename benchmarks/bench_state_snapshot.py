@@ -0,0 +1,65 @@
+# bench_state_snapshot.py
+"""
+Cost of a full state snapshot (/data): the KEYS scan plus one GET per event
+type the server used to do versus a single HGETALL of the state hash.
+Runs against an in-process fakeredis server over a real TCP socket, so
+round-trips are counted the way they would be against Redis.
+
+    python benchmarks/bench_state_snapshot.py
+"""
+import asyncio
+import json
+import statistics
+import threading
+import time
+from fixtures import TYPE_PREFIX
+from fakeredis import TcpFakeServer
+import redis.asyncio as redis
+import config
+import data_store
+
+PORT = 16381
+TYPES = 300
+RUNS = 20
+
+async def keys_and_get(r):
+    keys = await r.keys('*')
+    snapshot = {}
+    for key in keys:
+        if key == config.REDIS_STATE_KEY.encode():
+            continue
+        value = await r.get(key)
+        if value:
+            snapshot[key.decode()] = json.loads(value)
+    return snapshot, 1 + len(keys)
+
+async def hgetall(r):
+    return await data_store.get_data_store(), 1
+
+async def run():
+    r = redis.Redis(host='127.0.0.1', port=PORT)
+    data_store.redis_client = r
+    payload = json.dumps({"timestamp": 1, "category": "x", "player": {"name": "abc", "nucleusHash": "0" * 32}})
+    for i in range(TYPES):
+        await r.set(f"{TYPE_PREFIX}Type{i}", payload)
+        await r.hset(config.REDIS_STATE_KEY, f"{TYPE_PREFIX}Type{i}", payload)
+    for fn in (keys_and_get, hgetall):
+        timings = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            snapshot, round_trips = await fn(r)
+            timings.append(time.perf_counter() - started)
+        print(f"{fn.__name__}: {round_trips} round-trips, median {statistics.median(timings) * 1e3:.1f} ms "
+              f"for {len(snapshot)} types")
+    await r.aclose()
+
+def main():
+    server = TcpFakeServer(('127.0.0.1', PORT), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# fixtures.py
+"""
+Synthetic LiveAPI traffic shared by the benchmarks.
+
+burst() returns serialized LiveAPIEvent frames as they arrive off the
+websocket; match() returns a whole 60-player, 20-team match as decoded
+messages. Both are seeded, so every run replays the same events.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import events_pb2  # noqa: E402
+
+TYPE_PREFIX = 'rtech.liveapi.'
+PLAYERS = 60
+WEAPONS = ("R-301", "Wingman", "Peacekeeper", "Flatline")
+
+def _player(i, with_position=True):
+    player = events_pb2.Player(name=f"Player{i}", teamId=i // 3 + 2, nucleusHash=f"{i:032x}",
+                               hardwareName="PC-STEAM", teamName=f"Team {i // 3}",
+                               character=random.choice(["wraith", "bloodhound", "lifeline"]),
+                               currentHealth=100, maxHealth=100)
+    if with_position:
+        _move(player)
+    return player
+
+def _move(player):
+    player.pos.x = random.uniform(-20000, 20000)
+    player.pos.y = random.uniform(-20000, 20000)
+    player.pos.z = random.uniform(0, 3000)
+    return player
+
+def burst(count=20000, seed=1):
+    """Serialized LiveAPIEvent frames: PlayerDamaged, with every tenth a PlayerKilled."""
+    random.seed(seed)
+    frames = []
+    for k in range(count):
+        attacker, victim = _player(random.randrange(PLAYERS)), _player(random.randrange(PLAYERS))
+        if k % 10 == 9:
+            message = events_pb2.PlayerKilled(timestamp=1000 + k, category="playerKilled", weapon="R-301")
+            message.awardedTo.CopyFrom(attacker)
+        else:
+            message = events_pb2.PlayerDamaged(timestamp=1000 + k, category="damaged", weapon="R-301",
+                                               damageInflicted=random.randrange(1, 40))
+        message.attacker.CopyFrom(attacker)
+        message.victim.CopyFrom(victim)
+        event = events_pb2.LiveAPIEvent()
+        event.gameMessage.Pack(message)
+        frames.append(event.SerializeToString())
+    return frames
+
+def match(seed=7, damage_events=30000):
+    """
+    A full match as (type name, message) pairs: MatchSetup, damage with stat
+    changes, downs, kills and assists until one team is left, squad
+    eliminations and MatchStateEnd.
+    """
+    random.seed(seed)
+    players = [_player(i, with_position=False) for i in range(PLAYERS)]
+    events = [(TYPE_PREFIX + 'MatchSetup', events_pb2.MatchSetup(timestamp=1, map="mp_rr_tropic", serverId="srv"))]
+    alive = set(range(PLAYERS))
+    teams_alive = {team: {team * 3, team * 3 + 1, team * 3 + 2} for team in range(PLAYERS // 3)}
+    kill_every = damage_events // (PLAYERS - 3)
+    timestamp = 2
+    for k in range(damage_events):
+        timestamp += 1
+        a, v = random.sample(sorted(alive), 2) if len(alive) > 1 else (0, 0)
+        if players[a].teamId == players[v].teamId:
+            continue
+        damaged = events_pb2.PlayerDamaged(timestamp=timestamp, weapon=random.choice(WEAPONS),
+                                           damageInflicted=random.randrange(5, 45))
+        damaged.attacker.CopyFrom(_move(players[a]))
+        damaged.victim.CopyFrom(_move(players[v]))
+        events.append((TYPE_PREFIX + 'PlayerDamaged', damaged))
+        if k % 7 == 0:
+            stat = events_pb2.PlayerStatChanged(timestamp=timestamp, statName="damageDealt", newValue=k)
+            stat.player.CopyFrom(_move(players[a]))
+            events.append((TYPE_PREFIX + 'PlayerStatChanged', stat))
+        if k % kill_every != 0 or len(teams_alive) <= 1:
+            continue
+        downed = events_pb2.PlayerDowned(timestamp=timestamp, weapon=damaged.weapon)
+        downed.attacker.CopyFrom(players[a])
+        downed.victim.CopyFrom(players[v])
+        events.append((TYPE_PREFIX + 'PlayerDowned', downed))
+        killed = events_pb2.PlayerKilled(timestamp=timestamp, weapon=damaged.weapon)
+        killed.attacker.CopyFrom(players[a])
+        killed.victim.CopyFrom(players[v])
+        killed.awardedTo.CopyFrom(players[a])
+        events.append((TYPE_PREFIX + 'PlayerKilled', killed))
+        helper = (players[a].teamId - 2) * 3 + (a + 1) % 3
+        assist = events_pb2.PlayerAssist(timestamp=timestamp, weapon=damaged.weapon)
+        assist.assistant.CopyFrom(players[helper])
+        assist.victim.CopyFrom(players[v])
+        events.append((TYPE_PREFIX + 'PlayerAssist', assist))
+        alive.discard(v)
+        team = players[v].teamId - 2
+        teams_alive[team].discard(v)
+        if not teams_alive[team]:
+            del teams_alive[team]
+            eliminated = events_pb2.SquadEliminated(timestamp=timestamp)
+            for i in range(team * 3, team * 3 + 3):
+                eliminated.players.add().CopyFrom(players[i])
+            events.append((TYPE_PREFIX + 'SquadEliminated', eliminated))
+    end = events_pb2.MatchStateEnd(timestamp=timestamp, state="WinnerDetermined")
+    for i in alive:
+        end.winners.add().CopyFrom(players[i])
+    events.append((TYPE_PREFIX + 'MatchStateEnd', end))
+    return events
+
+def best_of(runs, fn):
+    """Fastest of several timed runs of fn(), in seconds."""
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
@@ -1,11 +1,15 @@
 # apex_events.py
-import asyncio
 import logging
 import json
 import os
 import sys
+from google.protobuf import json_format
 from google.protobuf.json_format import MessageToJson
-from data_store import update_data_store, get_data_store, get_data_by_type, wait_for_data_update
+from data_store import get_data_by_type
+import pending_requests
+import command_trace
+import command_queue
+import command_scheduler
 
 # Respect the original file structure for path
 current_script_directory = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +19,9 @@ import events_pb2
 
 logger = logging.getLogger('websocket_server')
 
+# Request fields that carry a command, e.g. 'customMatch_SetTeamName'
+COMMAND_FIELDS = {field.name: field for field in events_pb2.Request.DESCRIPTOR.oneofs_by_name['actions'].fields}
+
 def create_lobby():
     request = events_pb2.Request()
     request.customMatch_CreateLobby.CopyFrom(events_pb2.CustomMatch_CreateLobby())
@@ -22,8 +29,8 @@ def create_lobby():
 
     logger.info("Sent request to create a custom match lobby.")
 
-    # Send to all connected websockets using proper async mechanism
-    asyncio.create_task(send_request_to_connected_clients(request))
+    # Queue on every connected game client
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -34,28 +41,37 @@ def get_lobby_players():
 
     logger.info(f"Pulling player info. {request}")
 
-    # Send to all connected websockets using proper async mechanism
-    asyncio.create_task(send_request_to_connected_clients(request))
+    # Queue on every connected game client
+    send_request_to_connected_clients(request)
 
     return request
 
-async def send_request_to_connected_clients(request):
+def send_request_to_connected_clients(request):
     """
-    Send a request to all connected websocket clients.
-    
+    Queue a request on every connected websocket client's command queue.
+
     Args:
         request: The protobuf Request message to send
+
+    Returns:
+        command_trace.Trace: Settles once the game acks the request, see command_trace.wait_for_acks
     """
-    from websocket_server import send_request_to_game
-    await send_request_to_game(request)
+    return command_queue.submit([request])[0]
 
 async def fetch_lobby_players(timeout=5):
-    get_lobby_players()
-    success = await wait_for_data_update(timeout)
-    if not success:
+    lobby_players = await pending_requests.request('rtech.liveapi.CustomMatch_LobbyPlayers', get_lobby_players, timeout)
+    if lobby_players is None:
         logger.error("Fetching lobby players timed out.")
         return {}
-    return await get_data_by_type('rtech.liveapi.CustomMatch_LobbyPlayers')
+    return lobby_players
+
+async def fetch_settings(timeout=2):
+    """Request the current custom match settings and wait for the game's answer."""
+    return await pending_requests.request('rtech.liveapi.CustomMatch_SetSettings', get_settings, timeout)
+
+async def fetch_legend_ban_status(timeout=2):
+    """Request the legend ban status and wait for the game's answer."""
+    return await pending_requests.request('rtech.liveapi.CustomMatch_LegendBanStatus', get_legend_ban_status, timeout)
 
 def message_to_json(message):
     return MessageToJson(message)
@@ -74,7 +90,8 @@ def change_camera(poi=None, name=None):
 
     logger.info("Sent request to change camera.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    # Only the newest of a burst of camera moves is sent
+    command_scheduler.submit(command_scheduler.CAMERA, request)
 
     return request
 
@@ -85,7 +102,7 @@ def pause_toggle(pre_timer):
 
     logger.info("Sent request to toggle pause.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -96,7 +113,7 @@ def set_ready(is_ready):
 
     logger.info("Sent request to set ready state.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -107,7 +124,7 @@ def set_matchmaking(enabled):
 
     logger.info("Sent request to set matchmaking state.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -120,7 +137,7 @@ def set_team(team_id, target_hardware_name, target_nucleus_hash):
 
     logger.info("Sent request to set team.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -132,7 +149,7 @@ def kick_player(target_hardware_name, target_nucleus_hash):
 
     logger.info("Sent request to kick player.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -160,7 +177,7 @@ def set_settings(settings_data: dict): # Type hint for clarity
 
     request.withAck = True
     # logger.info(f"Prepared set_settings request: {request}") # Uncomment for deep debugging if needed
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
     return request
 
 def send_chat(text):
@@ -170,7 +187,7 @@ def send_chat(text):
 
     logger.info("Sent request to send chat.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -183,7 +200,7 @@ def get_settings():
 
     logger.info("Sent request to get settings.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -196,7 +213,7 @@ def set_team_name(team_id, team_name):
 
     logger.info("Sent request to set team name.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -209,7 +226,7 @@ def set_spawn_point(team_id, spawn_point):
 
     logger.info("Sent request to set spawn point.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -221,7 +238,7 @@ def set_end_ring_exclusion(section_to_exclude):
 
     logger.info("Sent request to set end ring exclusion.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -233,7 +250,7 @@ def get_legend_ban_status():
 
     logger.info("Sent request to get legend ban status.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -245,7 +262,7 @@ def set_legend_ban(legend_refs):
 
     logger.info("Sent request to set legend ban.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    send_request_to_connected_clients(request)
 
     return request
 
@@ -257,13 +274,15 @@ def change_camera_by_nucleus_hash(nucleus_hash):
 
     logger.info("Sent request to change camera by nucleus hash.")
 
-    asyncio.create_task(send_request_to_connected_clients(request))
+    command_scheduler.submit(command_scheduler.CAMERA, request)
 
     return request
 
 async def get_lobby_token():
-    request = get_lobby_players()
-    # Assuming get_lobby_players will somehow obtain a lobby token
+    # The lobby players result carries the playerToken
+    lobby_players = await fetch_lobby_players()
+    if lobby_players:
+        return lobby_players
     return await get_data_by_type('rtech.liveapi.CustomMatch_LobbyPlayers')
 
 def set_camera_position(x: float, y: float, z: float):
@@ -275,5 +294,48 @@ def set_camera_position(x: float, y: float, z: float):
     request.withAck = True
 
     logger.info(f"Sent request to set camera position to x={x}, y={y}, z={z}.")
-    asyncio.create_task(send_request_to_connected_clients(request))
+    command_scheduler.submit(command_scheduler.CAMERA, request)
     return request
+
+def build_request(command, params=None, with_ack=True):
+    """
+    Builds the Request for one command, validating params against its message descriptor.
+
+    Args:
+        command: Name of the Request field to set, e.g. 'customMatch_SetTeamName'
+        params: dict of the command's fields, in JSON (camelCase) or proto field names
+        with_ack: Whether the game should answer with a Response
+
+    Raises:
+        ValueError: If the command is unknown, params don't fit its message or with_ack isn't a bool
+    """
+    if not isinstance(command, str) or command not in COMMAND_FIELDS:
+        raise ValueError(f"unknown command {command!r}")
+    if params is not None and not isinstance(params, dict):
+        raise ValueError("params must be an object")
+    if not isinstance(with_ack, bool):
+        raise ValueError("withAck must be true or false")
+    request = events_pb2.Request()
+    action = getattr(request, command)
+    try:
+        json_format.ParseDict(params or {}, action)
+    except json_format.ParseError as e:
+        raise ValueError(str(e))
+    # Commands without fields still have to be selected in the oneof
+    action.SetInParent()
+    request.withAck = with_ack
+    return request
+
+async def send_batch(requests, timeout, clients=None):
+    """
+    Sends requests back-to-back on every game connection, or only on the
+    given client addresses, and waits for their acks.
+
+    Returns:
+        list: One command_trace.Trace per request, in order
+    """
+    traces = command_queue.submit(requests, clients)
+    logger.info(f"Sent a batch of {len(requests)} requests.")
+    if timeout > 0:
+        await command_trace.wait_for_acks(traces, timeout)
+    return traces
@@ -3,16 +3,137 @@ import aiohttp_jinja2
 from aiohttp import web
 import logging
 import apex_events
+import match_history
+import match_state
+import positions
+import ring
+import combat_ledger
+import live_updates
+import overlay_subscriptions
+import health
+import metrics
+import command_trace
+import command_scheduler
+import command_queue
+import session_registry
+from roster import roster, LOBBY_PLAYERS_TYPE
 import discord_manager
 import json
 import asyncio  # Added missing asyncio import
-from data_store import get_data_by_type, get_data_store, get_redis_connection
+import time
+from data_store import get_data_by_type, get_data_store, get_cache_stats, get_writer_stats
 import config  # Added import for config module
 from datetime import datetime
 from pubsub_manager import get_pubsub_status
+from ingest_pipeline import get_pipeline_stats
 
 logger = logging.getLogger('websocket_server')
 
+http_request_seconds = metrics.Histogram('apex_http_request_seconds', 'Time to handle an HTTP request, by route', ('method', 'route'))
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Times every request, labelled by route template so /history/{match_id} is one series"""
+    started = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        http_request_seconds.labels(request.method, route).observe(time.perf_counter() - started)
+
+@web.middleware
+async def trace_middleware(request, handler):
+    """Gives every request a trace id that commands sent while handling it are recorded under"""
+    context = command_trace.http_request_started()
+    try:
+        response = await handler(request)
+    finally:
+        # Replies with an error status (raised HTTPExceptions included) are timed too
+        command_trace.http_request_finished(context)
+    # Streams have already sent their headers
+    if not response.prepared:
+        response.headers['X-Trace-Id'] = context.trace_id
+    return response
+
+# HTTP status for a command the caller waited on, by outcome
+OUTCOME_STATUS = {'failed': 502, 'timeout': 504, 'disconnected': 503, 'not_sent': 503}
+
+async def command_reply(request, command):
+    """
+    The JSON reply of a handler that sent a command.
+
+    With ?wait=<seconds> (or ?wait=true for COMMAND_ACK_TIMEOUT) it first waits
+    for the game to ack the command and adds its outcome; a command the game
+    rejected, never acked or that had no client to go to gets a 5xx status.
+    Rate-limited camera commands are first waited on until their scheduler
+    sends them; one replaced by a newer command reports status 'replaced'.
+    """
+    body = apex_events.message_to_dict(command)
+    wait = request.query.get('wait')
+    if wait is None or wait.lower() in ('0', 'false'):
+        return web.json_response(body)
+    try:
+        timeout = min(max(float(wait), 0.0), config.BATCH_MAX_TIMEOUT)
+    except ValueError:
+        timeout = config.COMMAND_ACK_TIMEOUT
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    scheduled = command_trace.current_scheduled()
+    if scheduled:
+        done, _ = await asyncio.wait([scheduled[-1]], timeout=timeout)
+        trace = scheduled[-1].result() if done else None
+        if trace is None:
+            body['outcome'] = {'status': 'replaced' if done else 'queued'}
+            return web.json_response(body, status=200 if done else 504)
+    else:
+        traces = command_trace.current_traces()
+        if not traces:
+            return web.json_response(body)
+        trace = traces[-1]
+    await command_trace.wait_for_acks([trace], max(deadline - loop.time(), 0.0))
+    body['outcome'] = trace.to_dict()
+    return web.json_response(body, status=OUTCOME_STATUS.get(trace.status(), 200))
+
+def primary_session_only(handler):
+    """Marks a handler served from the in-memory trackers, which only follow the primary session"""
+    handler.primary_session_only = True
+    return handler
+
+@web.middleware
+async def target_middleware(request, handler):
+    """
+    ?session=<id> reads and commands the state and clients of that game session
+    instead of the primary one; ?client=<address> (repeatable) further limits
+    the commands of this request to those game clients. Handlers marked
+    primary_session_only reject any other session.
+    """
+    session = request.query.get('session')
+    clients = request.query.getall('client', None)
+    if session is None and not clients:
+        return await handler(request)
+    if session is not None and session_registry.session_id_for(session) != session:
+        return web.json_response({'error': f'invalid session id {session!r}'}, status=400)
+    if (session is not None and session != session_registry.registry.primary
+            and getattr(request.match_info.handler, 'primary_session_only', False)):
+        return web.json_response({'error': f'{request.path} only serves the primary session',
+                                  'primary': session_registry.registry.primary}, status=400)
+    if clients:
+        unknown = command_queue.unknown_clients(clients)
+        if unknown:
+            return web.json_response({'error': f'unknown game clients {unknown}',
+                                      'clients': list(command_queue.get_queue_stats())}, status=404)
+    session_token = session_registry.use(session) if session is not None else None
+    client_token = command_queue.target_clients(clients) if clients else None
+    try:
+        return await handler(request)
+    finally:
+        # Keep-alive requests on the same connection run in the same task
+        if client_token is not None:
+            command_queue.reset_targets(client_token)
+        if session_token is not None:
+            session_registry.reset(session_token)
+
 async def get_data(request):
     result_type = request.match_info.get('type', None)
     if result_type:
@@ -27,8 +148,7 @@ async def get_lobby_request(request):
 
 async def create_lobby_request(request):
     response = apex_events.create_lobby()
-    response_json = apex_events.message_to_dict(response)  # Convert the protobuf message to a dictionary
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def change_camera_request(request):
     body = await request.json()
@@ -43,22 +163,19 @@ async def change_camera_request(request):
             logger.error(f"Invalid POI value received: {poi_str}")
             return web.Response(text="Invalid POI value. Must be an integer.", status=400)
     response = apex_events.change_camera(poi=poi_int, name=name)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def pause_toggle_request(request):
     body = await request.json()
     pre_timer = body.get('preTimer')
     response = apex_events.pause_toggle(pre_timer)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def set_ready_request(request):
     body = await request.json()
     is_ready = body.get('isReady')
     response = apex_events.set_ready(is_ready)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def set_matchmaking_request(request):
     logger.info(f"Received set_matchmaking_request. Headers: {request.headers}")
@@ -82,8 +199,7 @@ async def set_matchmaking_request(request):
         # return web.Response(text="'enabled' flag must be a boolean", status=400)
         
     response = apex_events.set_matchmaking(enabled)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def set_team_request(request):
     body = await request.json()
@@ -91,16 +207,14 @@ async def set_team_request(request):
     target_hardware_name = body.get('targetHardwareName')
     target_nucleus_hash = body.get('targetNucleusHash')
     response = apex_events.set_team(team_id, target_hardware_name, target_nucleus_hash)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def kick_player_request(request):
     body = await request.json()
     target_hardware_name = body.get('targetHardwareName')
     target_nucleus_hash = body.get('targetNucleusHash')
     response = apex_events.kick_player(target_hardware_name, target_nucleus_hash)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def set_settings_request(request):
     logger.info(f"Received set_settings_request. Headers: {request.headers}")
@@ -117,15 +231,13 @@ async def set_settings_request(request):
         return web.Response(text="Unexpected error processing request", status=500)
         
     response = apex_events.set_settings(body)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def send_chat_request(request):
     body = await request.json()
     text = body.get('text')
     response = apex_events.send_chat(text)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def get_lobby_token_request(request):
     response = await apex_events.get_lobby_token()
@@ -176,107 +288,14 @@ async def index(request):
 # (These functions have been moved to the bottom of the file as _request versions)
 
 # Health check endpoint
+async def build_health_status():
+    """Summary of WebSocket, Redis, game data and pubsub status, read from the health monitor without any I/O"""
+    return health.monitor.snapshot(detail=False)
+
 async def health_check(request):
     """Check the status of WebSocket connections, Redis, game data, and pubsub streaming"""
     try:
-        # Check WebSocket status
-        websocket_connected = False
-        websocket_count = 0
-        try:
-            from websocket_server import connected_websockets
-            websocket_connected = len(connected_websockets) > 0
-            websocket_count = len(connected_websockets)
-        except ImportError as e:
-            logger.warning(f"Could not import websocket_server: {e}")
-        except Exception as e:
-            logger.warning(f"Error checking websocket status: {e}")
-        
-        # Check Redis connection
-        redis_connected = False
-        try:
-            r = await get_redis_connection()
-            await r.ping()
-            await r.close()
-            redis_connected = True
-        except Exception as e:
-            logger.warning(f"Redis connection failed: {e}")
-        
-        # Check if game data is available and recent
-        game_data_available = False
-        data_freshness = "unknown"
-        try:
-            data = await get_data_store()
-            if data and isinstance(data, dict) and len(data) > 0:
-                game_data_available = True
-                
-                # Check for recent lobby data
-                lobby_data = data.get('rtech.liveapi.CustomMatch_LobbyPlayers')
-                if lobby_data:
-                    data_freshness = "recent"
-                else:
-                    data_freshness = "stale"
-        except Exception as e:
-            logger.warning(f"Error checking game data: {e}")
-        
-        # Check pubsub streaming status
-        pubsub_status = {"streaming": False, "error": "Unable to check"}
-        try:
-            pubsub_status = get_pubsub_status()
-        except ImportError:
-            pubsub_status["error"] = "Pubsub manager not available"
-        except Exception as e:
-            pubsub_status["error"] = str(e)
-        
-        # Test websocket responsiveness by checking recent API responses
-        websocket_responsive = False
-        if websocket_connected:
-            # Check if we have recent successful API responses
-            try:
-                # Look for recent lobby data or response data
-                response_data = await get_data_by_type('rtech.liveapi.CustomMatch_LobbyPlayers')
-                if response_data and response_data != "{}":
-                    websocket_responsive = True
-            except:
-                pass
-            
-            if not websocket_responsive:
-                try:
-                    response_data = await get_data_by_type('rtech.liveapi.Response')
-                    if response_data and response_data != "{}":
-                        websocket_responsive = True
-                except:
-                    pass
-        
-        # Determine overall status
-        if websocket_connected and websocket_responsive and redis_connected and game_data_available:
-            overall_status = "healthy"
-        elif websocket_connected and redis_connected:
-            if websocket_responsive:
-                overall_status = "degraded"  # Connected but no game data
-            else:
-                overall_status = "issues"    # Connected but not responding
-        else:
-            overall_status = "error"
-        
-        status = {
-            "status": overall_status,
-            "websocket": {
-                "connected": websocket_connected,
-                "responsive": websocket_responsive,
-                "connections": websocket_count
-            },
-            "redis": {
-                "connected": redis_connected
-            },
-            "game_data": {
-                "available": game_data_available,
-                "freshness": data_freshness
-            },
-            "pubsub": pubsub_status,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        return web.json_response(status)
+        return web.json_response(health.monitor.snapshot())
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return web.json_response({
@@ -286,41 +305,22 @@ async def health_check(request):
         }, status=500)
 
 async def get_settings_request(request):
-    # First send the request to get fresh settings
-    response = apex_events.get_settings()
+    # Request fresh settings and wait only as long as the game takes to answer
+    settings_dict = await apex_events.fetch_settings()
     
-    # Wait for the response to come back and be processed
-    await asyncio.sleep(1.0)  # Increased wait time
-    
-    # Get the settings from the data store (they should have been updated by the response)
     try:
-        # Try to get the latest Response data that might contain settings
-        response_data = await get_data_by_type('rtech.liveapi.Response')
-        if response_data:
-            if isinstance(response_data, str):
-                try:
-                    response_dict = json.loads(response_data)
-                except json.JSONDecodeError:
-                    response_dict = {}
-            else:
-                response_dict = response_data
-            
-            # Check if this response contains settings data
-            if 'result' in response_dict:
-                result = response_dict['result']
-                if isinstance(result, dict) and ('playlistName' in result or 'selfAssign' in result or 'aimAssist' in result):
-                    # This looks like settings data
-                    settings = {
-                        "playlistName": result.get('playlistName', ''),
-                        "adminChat": result.get('adminChat', False),
-                        "teamRename": result.get('teamRename', False),
-                        "selfAssign": result.get('selfAssign', False),
-                        "aimAssist": result.get('aimAssist', False),
-                        "anonMode": result.get('anonMode', False)
-                    }
-                    return web.json_response({"settings": settings})
-        
-        # Also try to get CustomMatch_SetSettings data directly
+        if settings_dict:
+            settings = {
+                "playlistName": settings_dict.get('playlistName', ''),
+                "adminChat": settings_dict.get('adminChat', False),
+                "teamRename": settings_dict.get('teamRename', False),
+                "selfAssign": settings_dict.get('selfAssign', False),
+                "aimAssist": settings_dict.get('aimAssist', False),
+                "anonMode": settings_dict.get('anonMode', False)
+            }
+            return web.json_response({"settings": settings})
+
+        # No answer in time: fall back to the last settings we stored
         settings_data = await get_data_by_type('rtech.liveapi.CustomMatch_SetSettings')
         if settings_data:
             if isinstance(settings_data, str):
@@ -385,34 +385,90 @@ async def set_team_name_request(request):
         return web.json_response({'error': 'teamId must be a valid integer'}, status=400)
     
     response = apex_events.set_team_name(team_id, team_name)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
+
+async def batch_request(request):
+    """
+    Sends an ordered list of commands in one go and reports each one's ack.
+
+    Body: {"commands": [{"command": "customMatch_SetTeamName", "params": {"teamId": 2, "teamName": "A"}}, ...],
+           "timeout": 5, "session": "lobby-2", "clients": ["10.0.0.5:51234"]}
+    Every command is validated before anything is sent; timeout 0 returns without waiting for acks.
+    session and clients are optional: the batch goes to the clients of that game
+    session (default: ?session= or the primary one), or only to the listed clients.
+    """
+    try:
+        body = await request.json()
+    except Exception:
+        return web.json_response({'error': 'Invalid JSON body'}, status=400)
+    commands = body.get('commands') if isinstance(body, dict) else None
+    if not isinstance(commands, list) or not commands:
+        return web.json_response({'error': 'commands must be a non-empty list'}, status=400)
+    if len(commands) > config.BATCH_MAX_COMMANDS:
+        return web.json_response({'error': f'at most {config.BATCH_MAX_COMMANDS} commands per batch'}, status=400)
+    try:
+        timeout = min(max(float(body.get('timeout', config.COMMAND_ACK_TIMEOUT)), 0.0), config.BATCH_MAX_TIMEOUT)
+    except (TypeError, ValueError):
+        return web.json_response({'error': 'timeout must be a number'}, status=400)
+    session = body.get('session')
+    if session is not None and (not isinstance(session, str) or session_registry.session_id_for(session) != session):
+        return web.json_response({'error': 'session must be a session id'}, status=400)
+    clients = body.get('clients')
+    if clients is None and session is not None:
+        clients = session_registry.registry.clients(session)
+    elif clients is not None:
+        if not isinstance(clients, list) or not all(isinstance(c, str) for c in clients):
+            return web.json_response({'error': 'clients must be a list of client addresses'}, status=400)
+        unknown = command_queue.unknown_clients(clients)
+        if unknown:
+            return web.json_response({'error': f'unknown game clients {unknown}'}, status=404)
+
+    requests, errors = [], []
+    for index, entry in enumerate(commands):
+        if not isinstance(entry, dict):
+            errors.append({'index': index, 'error': 'each command must be an object'})
+            continue
+        try:
+            requests.append(apex_events.build_request(entry.get('command'), entry.get('params'), entry.get('withAck', True)))
+        except ValueError as e:
+            errors.append({'index': index, 'command': entry.get('command'), 'error': str(e)})
+    if errors:
+        return web.json_response({'error': 'invalid commands, nothing was sent', 'errors': errors}, status=400)
+
+    traces = await apex_events.send_batch(requests, timeout, clients)
+    results = [{'index': index, **trace.to_dict()} for index, trace in enumerate(traces)]
+    statuses = [result['status'] for result in results]
+    return web.json_response({
+        'commands': len(results),
+        'acked': statuses.count('acked'),
+        'failed': statuses.count('failed'),
+        'unacked': len(statuses) - statuses.count('acked') - statuses.count('failed'),
+        'results': results
+    })
 
 async def set_spawn_point_request(request):
     body = await request.json()
     team_id = body.get('teamId')
     spawn_point = body.get('spawnPoint')  # This should be an integer ID for pre-defined spawn points
     response = apex_events.set_spawn_point(team_id, spawn_point)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def set_end_ring_exclusion_request(request):
     body = await request.json()
     # According to protobuf, this should be a MapRegion enum value
     section_to_exclude = body.get('sectionToExclude')
     response = apex_events.set_end_ring_exclusion(section_to_exclude)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def get_legend_ban_status_request(request):
-    # Send request to get fresh legend ban status
-    response = apex_events.get_legend_ban_status()
-    
-    # Wait for the response to come back
-    await asyncio.sleep(0.8)
+    # Request fresh legend ban status and wait only as long as the game takes to answer
+    legend_dict = await apex_events.fetch_legend_ban_status()
     
     try:
-        # Try to get the legend ban status from the data store
+        if legend_dict and 'legends' in legend_dict:
+            return web.json_response(legend_dict)
+
+        # No answer in time: fall back to the last status we stored
         legend_ban_data = await get_data_by_type('rtech.liveapi.CustomMatch_LegendBanStatus')
         if legend_ban_data:
             if isinstance(legend_ban_data, str):
@@ -461,8 +517,7 @@ async def set_legend_ban_request(request):
         # Convert single character ban/unban to list format
         current_bans = []
         try:
-            current_status = apex_events.get_legend_ban_status()
-            current_status_dict = apex_events.message_to_dict(current_status)
+            current_status_dict = await apex_events.fetch_legend_ban_status() or {}
             if 'legends' in current_status_dict:
                 current_bans = [legend['reference'] for legend in current_status_dict['legends'] if legend.get('banned', False)]
         except:
@@ -476,51 +531,43 @@ async def set_legend_ban_request(request):
         legend_refs = current_bans
     
     response = apex_events.set_legend_ban(legend_refs)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
 async def change_camera_nucleus_hash_request(request):
     body = await request.json()
     nucleus_hash = body.get('nucleusHash')
     response = apex_events.change_camera_by_nucleus_hash(nucleus_hash)
-    response_json = apex_events.message_to_dict(response)
-    return web.json_response(response_json)
+    return await command_reply(request, response)
 
-async def get_player_names_request(request):
-    """Get list of current player names for autocomplete"""
+async def _autocomplete(request, field):
+    """Prefix search over one roster field, answered from the in-process index."""
     try:
-        lobby_data = await get_data_by_type('CustomMatch_LobbyPlayers')
-        if lobby_data and 'players' in lobby_data:
-            player_names = [player.get('name', '') for player in lobby_data['players'] if player.get('name')]
-            return web.json_response(player_names)
-        return web.json_response([])
-    except Exception as e:
-        logger.warning(f"Could not get player names: {e}")
-        return web.json_response([])
+        limit = max(int(request.query['limit']), 0) if 'limit' in request.query else None
+    except ValueError:
+        return web.json_response({'error': 'limit must be an integer'}, status=400)
+    if not roster.loaded:
+        # First request after a restart: seed the index from the last stored lobby
+        try:
+            roster.rebuild(await get_data_by_type(LOBBY_PLAYERS_TYPE, session_registry.registry.primary))
+        except Exception as e:
+            logger.warning(f"Could not load lobby players for autocomplete: {e}")
+            return web.json_response([])
+    return web.json_response(roster.search(field, request.query.get('q', ''), limit))
 
+@primary_session_only
+async def get_player_names_request(request):
+    """Get current player names for autocomplete, optionally filtered by a 'q' prefix"""
+    return await _autocomplete(request, 'name')
+
+@primary_session_only
 async def get_hardware_names_request(request):
-    """Get list of current hardware names for autocomplete"""
-    try:
-        lobby_data = await get_data_by_type('CustomMatch_LobbyPlayers')
-        if lobby_data and 'players' in lobby_data:
-            hardware_names = [player.get('hardwareName', '') for player in lobby_data['players'] if player.get('hardwareName')]
-            return web.json_response(hardware_names)
-        return web.json_response([])
-    except Exception as e:
-        logger.warning(f"Could not get hardware names: {e}")
-        return web.json_response([])
+    """Get current hardware names for autocomplete, optionally filtered by a 'q' prefix"""
+    return await _autocomplete(request, 'hardwareName')
 
+@primary_session_only
 async def get_nucleus_hashes_request(request):
-    """Get list of current nucleus hashes for autocomplete"""
-    try:
-        lobby_data = await get_data_by_type('CustomMatch_LobbyPlayers')
-        if lobby_data and 'players' in lobby_data:
-            nucleus_hashes = [player.get('nucleusHash', '') for player in lobby_data['players'] if player.get('nucleusHash')]
-            return web.json_response(nucleus_hashes)
-        return web.json_response([])
-    except Exception as e:
-        logger.warning(f"Could not get nucleus hashes: {e}")
-        return web.json_response([])
+    """Get current nucleus hashes for autocomplete, optionally filtered by a 'q' prefix"""
+    return await _autocomplete(request, 'nucleusHash')
 
 async def set_camera_position_request(request):
     """Handles the /set_camera_position route."""
@@ -542,8 +589,7 @@ async def set_camera_position_request(request):
             return web.json_response({'error': 'x, y, and z must be numbers'}, status=400)
 
         response_proto = apex_events.set_camera_position(x=x, y=y, z=z)
-        response_json = apex_events.message_to_dict(response_proto)
-        return web.json_response(response_json)
+        return await command_reply(request, response_proto)
     except json.JSONDecodeError:
         logger.error("Error decoding JSON for set_camera_position_request")
         return web.Response(text="Invalid JSON body", status=400)
@@ -551,6 +597,181 @@ async def set_camera_position_request(request):
         logger.error(f"Error in set_camera_position_request: {e}")
         return web.json_response({'error': str(e)}, status=500)
 
+async def sessions_request(request):
+    """Game sessions seen since startup, with their Init details and connected clients"""
+    return web.json_response({'primary': session_registry.registry.primary,
+                              'sessions': session_registry.registry.stats()})
+
 async def pubsub_status_request(request):
     status = get_pubsub_status()
     return web.json_response(status)
+
+async def pipeline_status_request(request):
+    """Queue depths and drop counts for the ingest pipeline, overlay subscribers and command schedulers"""
+    return web.json_response({**get_pipeline_stats(), "overlays": overlay_subscriptions.hub.stats(),
+                              "command_schedulers": command_scheduler.get_scheduler_stats(),
+                              "command_queues": command_queue.get_queue_stats()})
+
+async def metrics_request(request):
+    """Every metric in the Prometheus text format"""
+    return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+async def debug_traces_request(request):
+    """Recent command traces with their per-stage timings, newest first"""
+    try:
+        limit = max(int(request.query.get('limit', 50)), 0)
+    except ValueError:
+        return web.json_response({'error': 'limit must be an integer'}, status=400)
+    return web.json_response(command_trace.recent_traces(limit, request.query.get('command')))
+
+async def cache_status_request(request):
+    """Hit/miss counters for the in-process data cache and the Redis writer"""
+    return web.json_response({**get_cache_stats(), "writer": get_writer_stats()})
+
+async def history_matches_request(request):
+    """List matches with recorded event history"""
+    try:
+        return web.json_response(await match_history.list_matches())
+    except Exception as e:
+        logger.error(f"Error listing match history: {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+async def history_request(request):
+    """Page through one match's events by time range and type"""
+    match_id = request.match_info['match_id']
+    query = request.query
+    try:
+        count = int(query.get('count', 100))
+        if count < 1:
+            raise ValueError
+    except ValueError:
+        return web.json_response({'error': 'count must be a positive integer'}, status=400)
+    count = min(count, 1000)
+    try:
+        history = await match_history.get_history(
+            match_id,
+            start=query.get('start', '-'),
+            end=query.get('end', '+'),
+            event_type=query.get('type'),
+            count=count,
+            cursor=query.get('cursor')
+        )
+        return web.json_response(history)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error reading history for match {match_id}: {e}")
+        return web.json_response({'error': str(e)}, status=500)
+
+@primary_session_only
+async def player_scoreboard_request(request):
+    """Live per-player scoreboard for the current match"""
+    return web.Response(body=match_state.state.player_scoreboard_json(), content_type='application/json')
+
+@primary_session_only
+async def team_scoreboard_request(request):
+    """Live per-team scoreboard for the current match"""
+    return web.Response(body=match_state.state.team_scoreboard_json(), content_type='application/json')
+
+@primary_session_only
+async def positions_request(request):
+    """Latest known position of every player"""
+    table = positions.table
+    return web.json_response([table.get(h) for h in table.hashes])
+
+@primary_session_only
+async def closest_enemy_request(request):
+    """Nearest alive player on another team to the given player"""
+    nucleus_hash = request.match_info['nucleus_hash']
+    if positions.table.get(nucleus_hash) is None:
+        return web.json_response({'error': f'No position for player {nucleus_hash}'}, status=404)
+    return web.json_response(positions.table.closest_enemy(nucleus_hash))
+
+@primary_session_only
+async def nearby_players_request(request):
+    """Players within a radius of a point, nearest first"""
+    query = request.query
+    try:
+        point = (float(query['x']), float(query['y']), float(query.get('z', 0)))
+        radius = float(query['radius'])
+        team_id = int(query['team']) if 'team' in query else None
+    except KeyError as e:
+        return web.json_response({'error': f'Missing query parameter {e}'}, status=400)
+    except ValueError:
+        return web.json_response({'error': 'x, y, z and radius must be numbers and team an integer'}, status=400)
+    return web.json_response(positions.table.within(point, radius, team_id=team_id))
+
+@primary_session_only
+async def team_positions_request(request):
+    """Centroid and spread of every team, or of one team"""
+    team_id = request.match_info.get('team_id')
+    if team_id is None:
+        return web.json_response(positions.table.team_spreads())
+    try:
+        spread = positions.table.team_spread(int(team_id))
+    except ValueError:
+        return web.json_response({'error': 'team_id must be an integer'}, status=400)
+    if spread is None:
+        return web.json_response({'error': f'No alive players on team {team_id}'}, status=404)
+    return web.json_response(spread)
+
+@primary_session_only
+async def ring_request(request):
+    """Current ring radius and the players outside it"""
+    return web.json_response(ring.tracker.snapshot())
+
+def _time_window(query):
+    """Optional start/end (event timestamps, seconds) from the query string."""
+    return (int(query['start']) if 'start' in query else None,
+            int(query['end']) if 'end' in query else None)
+
+@primary_session_only
+async def combat_weapons_request(request):
+    """Damage per weapon for the current match, optionally within start/end"""
+    try:
+        start, end = _time_window(request.query)
+    except ValueError:
+        return web.json_response({'error': 'start and end must be integers'}, status=400)
+    return web.json_response(combat_ledger.ledger.damage_by_weapon(start, end))
+
+@primary_session_only
+async def combat_players_request(request):
+    """Damage dealt/taken, kills and deaths per player, optionally within start/end"""
+    try:
+        start, end = _time_window(request.query)
+    except ValueError:
+        return web.json_response({'error': 'start and end must be integers'}, status=400)
+    return web.json_response(combat_ledger.ledger.player_totals(start, end))
+
+@primary_session_only
+async def combat_timeline_request(request):
+    """Damage per time bucket ('bucket' seconds, default 30)"""
+    try:
+        start, end = _time_window(request.query)
+        bucket = int(request.query.get('bucket', 30))
+        if bucket <= 0:
+            raise ValueError
+    except ValueError:
+        return web.json_response({'error': 'start and end must be integers and bucket a positive integer'}, status=400)
+    return web.json_response(combat_ledger.ledger.damage_timeline(bucket, start, end))
+
+@primary_session_only
+async def live_updates_request(request):
+    """Server-Sent Events stream of status, lobby, settings and legend ban changes"""
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    subscriber = live_updates.subscribe()
+    try:
+        while not subscriber.closed:
+            frames = await subscriber.next_frames(config.LIVE_KEEPALIVE_INTERVAL)
+            # A comment line keeps proxies from closing an idle stream
+            await response.write(b"".join(frames) if frames else b": keepalive\n\n")
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        live_updates.unsubscribe(subscriber)
+    return response
@@ -0,0 +1,52 @@
+# background_tasks.py
+"""
+Stopping the server's long-running loops.
+
+A cancel alone doesn't reliably end a loop: redis-py can swallow one that
+arrives while it executes a pipeline or reads from a pubsub connection
+(and wait_for can before Python 3.12), after which the loop carries on.
+So loops run `while not stopping()`, and stop_task() marks the task as
+stopping and keeps cancelling it until it ends or the timeout passes.
+"""
+import asyncio
+import logging
+import time
+import weakref
+import config
+
+logger = logging.getLogger('websocket_server')
+
+# Seconds between repeated cancels of a task that hasn't ended yet
+_CANCEL_INTERVAL = 0.1
+
+_stopping = weakref.WeakSet()
+
+def stopping():
+    """Whether stop_task() has been called on the current task; loops run while it is False."""
+    return asyncio.current_task() in _stopping
+
+async def stop_task(task, timeout=None):
+    """
+    Stops a loop task and waits for it to end.
+
+    Args:
+        task: The task, or None
+        timeout: Most seconds to wait; defaults to config.TASK_STOP_TIMEOUT
+
+    Returns:
+        bool: Whether the task has ended
+    """
+    if task is None:
+        return True
+    _stopping.add(task)
+    deadline = time.monotonic() + (config.TASK_STOP_TIMEOUT if timeout is None else timeout)
+    while not task.done():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning(f"Task {task.get_name()} did not stop in time")
+            return False
+        task.cancel()
+        await asyncio.wait((task,), timeout=min(_CANCEL_INTERVAL, remaining))
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Task {task.get_name()} failed while stopping: {task.exception()}")
+    return True
@@ -0,0 +1,152 @@
+# combat_ledger.py
+import logging
+from array import array
+import numpy as np
+
+logger = logging.getLogger('websocket_server')
+
+# Values of the kind column
+DAMAGE = 0
+KILL = 1
+
+LEDGER_TYPES = {'rtech.liveapi.PlayerDamaged', 'rtech.liveapi.PlayerKilled'}
+
+# Column name -> (array typecode, NumPy dtype); array.array grows geometrically on append
+COLUMNS = {
+    'kind': ('B', np.uint8),
+    'timestamp': ('Q', np.uint64),
+    'attacker': ('i', np.int32),
+    'victim': ('i', np.int32),
+    'weapon': ('i', np.int32),
+    'damage': ('I', np.uint32),
+}
+
+class Interner:
+    """Maps strings to dense integer ids and back."""
+    __slots__ = ('ids', 'values')
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        interned = self.ids.get(value)
+        if interned is None:
+            interned = len(self.values)
+            self.ids[value] = interned
+            self.values.append(value)
+        return interned
+
+class CombatLedger:
+    """
+    Append-only, column-oriented record of every damage and kill event.
+
+    Each event is one row across typed array.array columns (about 25 bytes),
+    with players and weapons interned to integer ids. Queries view the
+    columns through np.frombuffer without copying and aggregate with
+    bincount, so they stay vectorised however long the match runs.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.columns = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+        self.players = Interner()
+        self.weapons = Interner()
+
+    def __len__(self):
+        return len(self.columns['kind'])
+
+    def _player_id(self, player):
+        key = player.nucleusHash or player.name
+        return self.players.intern(key) if key else -1
+
+    def append(self, kind, timestamp, attacker, victim, weapon, damage=0):
+        """Adds one row; attacker and victim are Player messages."""
+        columns = self.columns
+        columns['kind'].append(kind)
+        columns['timestamp'].append(timestamp)
+        columns['attacker'].append(self._player_id(attacker))
+        columns['victim'].append(self._player_id(victim))
+        columns['weapon'].append(self.weapons.intern(weapon))
+        columns['damage'].append(damage)
+
+    def apply(self, type_name, message):
+        if type_name == 'rtech.liveapi.PlayerDamaged':
+            self.append(DAMAGE, message.timestamp, message.attacker, message.victim, message.weapon, message.damageInflicted)
+        elif type_name == 'rtech.liveapi.PlayerKilled':
+            # Credit the kill the same way the game does
+            killer = message.awardedTo if message.awardedTo.nucleusHash or message.awardedTo.name else message.attacker
+            self.append(KILL, message.timestamp, killer, message.victim, message.weapon)
+
+    def view(self, name):
+        """A zero-copy NumPy view of one column."""
+        return np.frombuffer(self.columns[name], dtype=COLUMNS[name][1])
+
+    def _window(self, start=None, end=None):
+        """Boolean mask of rows with start <= timestamp < end."""
+        timestamps = self.view('timestamp')
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps < end
+        return mask
+
+    def damage_by_weapon(self, start=None, end=None):
+        """Total damage per weapon within the time window."""
+        mask = self._window(start, end) & (self.view('kind') == DAMAGE)
+        totals = np.bincount(self.view('weapon')[mask], weights=self.view('damage')[mask], minlength=len(self.weapons))
+        return {self.weapons.values[i]: int(totals[i]) for i in np.flatnonzero(totals)}
+
+    def player_totals(self, start=None, end=None):
+        """Damage dealt/taken, kills and deaths per player within the time window."""
+        window = self._window(start, end)
+        kind, attacker, victim, damage = self.view('kind'), self.view('attacker'), self.view('victim'), self.view('damage')
+        size = len(self.players)
+
+        def count(ids, mask, weights=None):
+            mask = mask & (ids >= 0)
+            return np.bincount(ids[mask], weights=None if weights is None else weights[mask], minlength=size)
+
+        hits = window & (kind == DAMAGE)
+        kills = window & (kind == KILL)
+        dealt, taken = count(attacker, hits, damage), count(victim, hits, damage)
+        kill_counts, deaths = count(attacker, kills), count(victim, kills)
+        return {
+            self.players.values[i]: {
+                "damageDealt": int(dealt[i]),
+                "damageTaken": int(taken[i]),
+                "kills": int(kill_counts[i]),
+                "deaths": int(deaths[i])
+            } for i in np.flatnonzero(dealt + taken + kill_counts + deaths)
+        }
+
+    def damage_timeline(self, bucket_seconds=30, start=None, end=None):
+        """Total damage per time bucket, as [[bucket start, damage], ...]."""
+        mask = self._window(start, end) & (self.view('kind') == DAMAGE)
+        timestamps = self.view('timestamp')[mask]
+        if not len(timestamps):
+            return []
+        origin = int(timestamps.min()) // bucket_seconds * bucket_seconds
+        buckets = (timestamps - origin) // bucket_seconds
+        totals = np.bincount(buckets.astype(np.intp), weights=self.view('damage')[mask])
+        return [[origin + i * bucket_seconds, int(totals[i])] for i in range(len(totals))]
+
+    def memory_usage(self):
+        """Bytes used by the column data."""
+        return sum(column.buffer_info()[1] * column.itemsize for column in self.columns.values())
+
+# Damage and kills of the live match, fed by the ingest pipeline
+ledger = CombatLedger()
+
+async def ledger_sink(envelope):
+    """Pipeline sink: append damage and kills to the ledger, starting over at each match."""
+    if envelope.type_name == 'rtech.liveapi.MatchSetup':
+        ledger.reset()
+    else:
+        ledger.apply(envelope.type_name, envelope.message)
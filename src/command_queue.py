@@ -0,0 +1,329 @@
+# command_queue.py
+"""
+Outbound commands, queued per game connection.
+
+The game's Response carries no request id, but a client acks its requests
+in the order it received them, so each connection keeps the requests it
+sent with withAck in a first-in first-out in-flight list and matches every
+Response to the oldest one. At most COMMAND_MAX_IN_FLIGHT are outstanding
+at a time; the rest wait in the connection's queue.
+
+A request not acked within COMMAND_ACK_TIMEOUT is given up on. Idempotent
+commands are then resent, up to COMMAND_MAX_RETRIES times, ahead of the
+queue; others (chat, pause toggle, lobby changes) are reported as timed out
+rather than risk carrying them out twice. A Response that arrives after its
+request was given up on is matched to the next one, so the timeout should
+sit well above the game's usual ack time.
+
+Every connection sends from its own task, so a stalled observer only holds
+up its own queue. A send that doesn't finish within COMMAND_SEND_TIMEOUT
+counts as a missed deadline, and so does an ack timeout. After
+COMMAND_DEGRADED_AFTER misses in a row the client is marked degraded:
+commands still go to it, but its queue is capped and commands no longer
+wait on its ack. The next ack it sends makes it healthy again.
+
+Commands go to the connections of the current game session (see
+session_registry.current()) unless the caller targets some clients, either
+through submit() or, for HTTP handlers, target_clients().
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+import websockets.exceptions
+import config
+import command_trace
+import metrics
+import session_registry
+from session_registry import client_label
+
+logger = logging.getLogger('websocket_server')
+
+# Sending these twice leaves the game as sending them once
+IDEMPOTENT_COMMANDS = frozenset({
+    'changeCam',
+    'customMatch_SetReady',
+    'customMatch_SetMatchmaking',
+    'customMatch_SetTeam',
+    'customMatch_KickPlayer',
+    'customMatch_SetSettings',
+    'customMatch_GetLobbyPlayers',
+    'customMatch_SetTeamName',
+    'customMatch_GetSettings',
+    'customMatch_SetSpawnPoint',
+    'customMatch_SetEndRingExclusion',
+    'customMatch_GetLegendBanStatus',
+    'customMatch_SetLegendBan',
+})
+
+websocket_send_seconds = metrics.Histogram('apex_websocket_send_seconds', 'Time to send a request to a game client', ('client',))
+ack_seconds = metrics.Histogram('apex_command_ack_seconds', 'Time from sending a request to its Response, by game client', ('client',))
+command_retries = metrics.Counter('apex_command_retries_total', 'Idempotent requests resent after an ack timeout', ('client',))
+command_results = metrics.Counter('apex_command_client_results_total', 'Per-client results of requests sent with withAck', ('client', 'result'))
+deadline_misses = metrics.Counter('apex_command_deadline_misses_total', 'Sends and acks that missed their deadline, by game client', ('client', 'kind'))
+commands_skipped = metrics.Counter('apex_command_skipped_total', 'Commands not queued for a degraded game client whose queue was full', ('client',))
+
+# Client addresses the commands of the current HTTP request are limited to; None for all
+_targets = contextvars.ContextVar('command_targets', default=None)
+
+class Command:
+    """One request on its way to one connection."""
+    __slots__ = ('payload', 'trace', 'with_ack', 'idempotent', 'counted', 'attempts', 'sent_at', 'deadline')
+
+    def __init__(self, payload, trace, with_ack, idempotent, counted=True):
+        self.payload = payload
+        self.trace = trace
+        self.with_ack = with_ack
+        self.idempotent = idempotent
+        # Whether the trace waits for this connection; not for degraded clients
+        self.counted = counted
+        self.attempts = 0
+        self.sent_at = None
+        self.deadline = None
+
+class CommandChannel:
+    """The queue and in-flight requests of one game connection, drained by its own task."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.client = client_label(websocket)
+        self.queue = deque()
+        self.in_flight = deque()
+        self.closed = False
+        self.degraded = False
+        self.misses = 0
+        self._wakeup = asyncio.Event()
+        self._send_latency = websocket_send_seconds.labels(self.client)
+        self._ack_latency = ack_seconds.labels(self.client)
+        self._retries = command_retries.labels(self.client)
+        self._results = {result: command_results.labels(self.client, result) for result in ('acked', 'failed', 'timeout')}
+        self._misses = {kind: deadline_misses.labels(self.client, kind) for kind in ('send', 'ack')}
+        self._skipped = commands_skipped.labels(self.client)
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, command):
+        if not command.counted and len(self.queue) >= config.COMMAND_MAX_IN_FLIGHT:
+            self._skipped.inc()
+            return
+        if command.counted:
+            command_trace.attach(command.trace)
+        self.queue.append(command)
+        self._wakeup.set()
+
+    def _abandon(self, command, outcome):
+        if command.counted:
+            command_trace.abandoned(command.trace, outcome)
+
+    def _missed_deadline(self, kind):
+        self._misses[kind].inc()
+        self.misses += 1
+        if self.misses >= config.COMMAND_DEGRADED_AFTER and not self.degraded:
+            self.degraded = True
+            logger.warning(f"Game client {self.client} marked degraded after {self.misses} missed deadlines")
+
+    def acknowledged(self, success):
+        """Matches a Response to the oldest request in flight."""
+        if not self.in_flight:
+            return None
+        command = self.in_flight.popleft()
+        self._ack_latency.observe(time.perf_counter() - command.sent_at)
+        self._results['acked' if success else 'failed'].inc()
+        self.misses = 0
+        if self.degraded:
+            self.degraded = False
+            logger.info(f"Game client {self.client} is answering again")
+        if command.counted:
+            command_trace.acknowledged(command.trace, success)
+        # A slot is free for the next queued request
+        self._wakeup.set()
+        return command.trace
+
+    def _expire(self, now):
+        """Gives up on requests past their deadline; idempotent ones go back to the front of the queue."""
+        retry = []
+        while self.in_flight and self.in_flight[0].deadline <= now:
+            command = self.in_flight.popleft()
+            self._missed_deadline('ack')
+            if command.idempotent and command.attempts <= config.COMMAND_MAX_RETRIES:
+                self._retries.inc()
+                command.trace.retries += 1
+                retry.append(command)
+            else:
+                self._results['timeout'].inc()
+                logger.warning(f"No ack from {self.client} for {command.trace.command} after {command.attempts} attempt(s)")
+                self._abandon(command, 'timeout')
+        # Resent in their original order
+        self.queue.extendleft(reversed(retry))
+
+    async def _run(self):
+        try:
+            while True:
+                if self.in_flight:
+                    # Woken by a timer rather than wait_for, which can swallow a cancel
+                    # that arrives just as the event is set and leave close() hanging
+                    timer = asyncio.get_running_loop().call_later(
+                        max(self.in_flight[0].deadline - time.perf_counter(), 0), self._wakeup.set)
+                    try:
+                        await self._wakeup.wait()
+                    finally:
+                        timer.cancel()
+                else:
+                    await self._wakeup.wait()
+                self._wakeup.clear()
+                self._expire(time.perf_counter())
+                while self.queue and len(self.in_flight) < config.COMMAND_MAX_IN_FLIGHT:
+                    await self._send(self.queue.popleft())
+        except websockets.exceptions.ConnectionClosed:
+            logger.warning(f"WebSocket connection to {self.client} closed while sending request")
+        except Exception as e:
+            logger.error(f"Error sending request to {self.client}: {e}")
+        finally:
+            self._abandon_all()
+
+    async def _send(self, command):
+        started = time.perf_counter()
+        command.attempts += 1
+        # asyncio.wait rather than wait_for, for the same reason as the timer in _run
+        sending = asyncio.ensure_future(self.websocket.send(command.payload))
+        try:
+            done, _ = await asyncio.wait((sending,), timeout=config.COMMAND_SEND_TIMEOUT)
+            if done:
+                sending.result()
+            else:
+                # The frame is in the socket buffer before send() waits for it to drain, so it still goes out
+                sending.cancel()
+                self._missed_deadline('send')
+        except BaseException:
+            # Not written; settled by _abandon_all with the rest of the queue
+            sending.cancel()
+            self.queue.appendleft(command)
+            raise
+        now = time.perf_counter()
+        self._send_latency.observe(now - started)
+        command_trace.sent(command.trace)
+        if command.with_ack:
+            command.sent_at = now
+            command.deadline = now + config.COMMAND_ACK_TIMEOUT
+            self.in_flight.append(command)
+        else:
+            self._abandon(command, 'sent')
+
+    def _abandon_all(self):
+        self.closed = True
+        for command in list(self.in_flight) + list(self.queue):
+            self._abandon(command, 'disconnected')
+        self.in_flight.clear()
+        self.queue.clear()
+
+    def close(self):
+        self._task.cancel()
+        if not self.closed:
+            self._abandon_all()
+        websocket_send_seconds.remove(self.client)
+        ack_seconds.remove(self.client)
+        command_retries.remove(self.client)
+        commands_skipped.remove(self.client)
+        for result in self._results:
+            command_results.remove(self.client, result)
+        for kind in self._misses:
+            deadline_misses.remove(self.client, kind)
+
+    def stats(self):
+        return {
+            "session": session_registry.registry.session_of(self.websocket),
+            "degraded": self.degraded,
+            "missed_deadlines": self.misses,
+            "skipped": self._skipped.value,
+            "queued": len(self.queue),
+            "in_flight": len(self.in_flight),
+            "oldest_in_flight_age": round(time.perf_counter() - self.in_flight[0].sent_at, 3) if self.in_flight else None,
+            "retries": self._retries.value,
+            **{result: counter.value for result, counter in self._results.items()}
+        }
+
+# Game connection -> its channel
+channels = {}
+
+def open_channel(websocket):
+    channels[websocket] = CommandChannel(websocket)
+
+def close_channel(websocket):
+    channel = channels.pop(websocket, None)
+    if channel is not None:
+        channel.close()
+
+def acknowledged(websocket, success):
+    """Called for every Response read from websocket."""
+    channel = channels.get(websocket)
+    return channel.acknowledged(success) if channel is not None else None
+
+def unknown_clients(clients):
+    """The addresses in clients that aren't a connected game client."""
+    known = {channel.client for channel in channels.values()}
+    return [client for client in clients if client not in known]
+
+def target_clients(clients):
+    """Limits the commands sent from the current context to these client addresses; returns a token for reset_targets()."""
+    return _targets.set(tuple(clients))
+
+def reset_targets(token):
+    _targets.reset(token)
+
+def current_targets():
+    """The client addresses set by target_clients() for the current context, or None."""
+    return _targets.get()
+
+def submit(request_msgs, clients=None):
+    """
+    Serializes each request once and queues it, in order, on every connection of the game session.
+
+    Returns right away; await command_trace.wait_for_acks() on the returned
+    traces for the outcome, which only waits on healthy clients while there
+    are any.
+
+    Args:
+        request_msgs: List of Request protobuf messages
+        clients: Client addresses to send to; defaults to the current
+            context's targets, or the clients of the current session
+
+    Returns:
+        list: The command_trace.Trace of each request
+    """
+    if clients is None:
+        clients = _targets.get()
+    if clients is None:
+        clients = session_registry.registry.clients(session_registry.current())
+    live = [channel for channel in channels.values()
+            if not channel.closed and channel.client in clients]
+    counted = {channel for channel in live if not channel.degraded} or set(live)
+    traces = []
+    for request_msg in request_msgs:
+        payload = request_msg.SerializeToString()
+        trace = command_trace.begin(request_msg)
+        traces.append(trace)
+        if not live:
+            command_trace.not_sent(trace)
+            continue
+        idempotent = trace.command in IDEMPOTENT_COMMANDS
+        for channel in live:
+            channel.enqueue(Command(payload, trace, request_msg.withAck, idempotent, channel in counted))
+    if not live:
+        logger.warning(f"No connected websockets to send {len(traces)} request(s) to")
+    return traces
+
+def _collect_depths():
+    depths = {}
+    for channel in channels.values():
+        depths[(channel.client, 'queued')] = len(channel.queue)
+        depths[(channel.client, 'in_flight')] = len(channel.in_flight)
+    return depths
+
+def _collect_degraded():
+    return {(channel.client,): int(channel.degraded) for channel in channels.values()}
+
+metrics.Collected('apex_command_queue_depth', 'Requests waiting to be sent or for their ack, by game client', ('client', 'state'), _collect_depths)
+metrics.Collected('apex_game_client_degraded', '1 while a game client keeps missing send or ack deadlines', ('client',), _collect_degraded)
+
+def get_queue_stats():
+    return {channel.client: channel.stats() for channel in channels.values()}
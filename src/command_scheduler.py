@@ -0,0 +1,135 @@
+# command_scheduler.py
+import asyncio
+import contextvars
+import logging
+import time
+import config
+import command_queue
+import command_trace
+import metrics
+import session_registry
+
+logger = logging.getLogger('websocket_server')
+
+commands_submitted = metrics.Counter('apex_scheduled_commands_total', 'Commands handed to a latest-wins scheduler', ('scheduler', 'session'))
+commands_dropped = metrics.Counter('apex_scheduled_commands_dropped_total', 'Commands replaced by a newer one before they were sent', ('scheduler', 'session'))
+
+class LatestWinsScheduler:
+    """
+    Sends commands of one class, such as camera moves, no more often than
+    min_interval, keeping only the newest while it waits.
+
+    A command that arrives after a quiet period goes out right away; during
+    a burst each new command replaces the pending one, so the game never
+    works through a backlog of stale moves and settles on the last choice.
+    """
+
+    def __init__(self, name, min_interval, session=session_registry.DEFAULT_SESSION):
+        self.name = name
+        self.min_interval = min_interval
+        self.pending = None
+        self.last_sent = None
+        self.sent = 0
+        self.submitted = 0
+        self.dropped = 0
+        self._task = None
+        self._submitted = commands_submitted.labels(name, session)
+        self._dropped = commands_dropped.labels(name, session)
+
+    def submit(self, request):
+        """
+        Queues request, replacing any command of this class that hasn't been sent yet.
+
+        Returns a future resolving to the command's trace once it is sent, or
+        to None if a newer command replaced it first.
+        """
+        self.submitted += 1
+        self._submitted.inc()
+        future = asyncio.get_running_loop().create_future()
+        command_trace.scheduled(future)
+        if self.pending is not None:
+            self.dropped += 1
+            self._dropped.inc()
+            _settle(self.pending[2], None)
+        # Sent from the submitter's context, so its trace belongs to the HTTP request that asked for it
+        self.pending = (request, contextvars.copy_context(), future)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        while self.pending is not None:
+            if self.last_sent is not None:
+                wait = self.last_sent + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            (request, context, future), self.pending = self.pending, None
+            self.last_sent = time.monotonic()
+            self.sent += 1
+            trace = None
+            try:
+                trace = context.run(command_queue.submit, [request])[0]
+            except Exception as e:
+                logger.error(f"Error sending {self.name} command: {e}")
+            _settle(future, trace)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.pending is not None:
+            _settle(self.pending[2], None)
+        self.pending = None
+
+    def stats(self):
+        return {
+            "min_interval": self.min_interval,
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "pending": self.pending is not None
+        }
+
+def _settle(future, trace):
+    if not future.done():
+        future.set_result(trace)
+
+CAMERA = 'camera'
+
+# Command class -> minimum seconds between two sent commands
+MIN_INTERVALS = {
+    CAMERA: config.CAMERA_MIN_INTERVAL,
+}
+
+# (command class, game session, target clients) -> its scheduler, so commands for one lobby
+# or set of clients never replace those for another
+schedulers = {}
+
+def submit(name, request):
+    """
+    Hands request to the scheduler of its class for the current game session
+    and target clients (see command_queue.target_clients); see LatestWinsScheduler.submit.
+    """
+    session = session_registry.current()
+    targets = command_queue.current_targets()
+    key = (name, session, tuple(sorted(targets)) if targets is not None else None)
+    scheduler = schedulers.get(key)
+    if scheduler is None:
+        scheduler = LatestWinsScheduler(name, MIN_INTERVALS[name], session)
+        schedulers[key] = scheduler
+    return scheduler.submit(request)
+
+async def stop_schedulers():
+    for scheduler in schedulers.values():
+        await scheduler.stop()
+
+def _stats_key(name, session, targets):
+    key = name if session == session_registry.DEFAULT_SESSION else f"{name}:{session}"
+    return key if targets is None else f"{key}@{','.join(targets)}"
+
+def get_scheduler_stats():
+    """
+    Stats per scheduler, keyed '<class>' for the default session and '<class>:<session>' for the others,
+    followed by '@<client>,...' for commands limited to some clients.
+    """
+    return {_stats_key(*key): scheduler.stats() for key, scheduler in schedulers.items()}
@@ -0,0 +1,231 @@
+# command_trace.py
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+import config
+import events_pb2
+import metrics
+
+logger = logging.getLogger('websocket_server')
+
+# Intervals recorded for every command:
+#   handle: HTTP request received -> Request serialized (our handler)
+#   send:   serialized -> written to the first game client
+#   game:   written -> Response received from that client (the game's share)
+#   reply:  HTTP request received -> HTTP reply sent
+#   total:  HTTP request received -> Response received
+STAGES = ('handle', 'send', 'game', 'reply', 'total')
+
+# The oneof member of Request that names the command, e.g. 'changeCam'
+COMMANDS = [field.name for field in events_pb2.Request.DESCRIPTOR.oneofs_by_name['actions'].fields]
+
+stage_seconds = metrics.Histogram('apex_command_stage_seconds', 'Command round-trip time per stage', ('command', 'stage'))
+# Preallocated for every command and stage
+STAGE_HISTOGRAMS = {(command, stage): stage_seconds.labels(command, stage) for command in COMMANDS for stage in STAGES}
+
+OUTCOMES = ('acked', 'failed', 'timeout', 'disconnected', 'not_sent', 'sent')
+command_outcomes = metrics.Counter('apex_command_outcomes_total', 'Commands by how they ended', ('outcome',))
+OUTCOME_COUNTERS = {outcome: command_outcomes.labels(outcome) for outcome in OUTCOMES}
+
+class HttpContext:
+    """What the HTTP layer knows about the request a command was sent from."""
+    __slots__ = ('trace_id', 'received', 'replied', 'traces', 'scheduled')
+
+    def __init__(self, received):
+        self.trace_id = os.urandom(8).hex()
+        self.received = received
+        self.replied = None
+        self.traces = []
+        self.scheduled = []
+
+# Set by the HTTP middleware; asyncio tasks created by a handler inherit it
+_http_context = contextvars.ContextVar('http_context', default=None)
+
+class Trace:
+    """
+    Timestamps and outcome of one command on its way to the game and back.
+
+    A command is sent to every game connection; command_queue reports each
+    connection's ack, timeout or disconnect, and the trace settles on its
+    outcome as soon as one client acks it successfully or none is left.
+    """
+    __slots__ = ('trace_id', 'command', 'started_at', 'received', 'serialized', 'sent',
+                 'acked', 'replied', 'success', 'clients', 'acks', 'pending', 'retries',
+                 'outcome', 'waiter')
+
+    def __init__(self, trace_id, command, received):
+        self.trace_id = trace_id
+        self.command = command
+        self.started_at = time.time()
+        self.received = received
+        self.serialized = None
+        self.sent = None
+        self.acked = None
+        self.replied = None
+        self.success = None
+        self.clients = 0
+        self.acks = 0
+        self.pending = 0
+        self.retries = 0
+        self.outcome = None
+        self.waiter = None
+
+    def _record(self, stage, start, end):
+        histogram = STAGE_HISTOGRAMS.get((self.command, stage))
+        if histogram is not None and start is not None and end is not None:
+            histogram.observe(end - start)
+
+    def _finish(self, outcome):
+        if self.outcome is not None:
+            return
+        self.outcome = outcome
+        OUTCOME_COUNTERS[outcome].inc()
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(outcome)
+
+    def status(self):
+        """acked, failed, timeout, disconnected, not_sent or sent once settled; queued or sent before."""
+        if self.outcome is not None:
+            return self.outcome
+        return "queued" if self.sent is None else "sent"
+
+    def to_dict(self):
+        def ms(start, end):
+            return round((end - start) * 1000, 3) if start is not None and end is not None else None
+        return {
+            "traceId": self.trace_id,
+            "command": self.command,
+            "startedAt": self.started_at,
+            "status": self.status(),
+            "clients": self.clients,
+            "acks": self.acks,
+            "retries": self.retries,
+            "success": self.success,
+            "stagesMs": {
+                "handle": ms(self.received, self.serialized),
+                "send": ms(self.serialized, self.sent),
+                "game": ms(self.sent, self.acked),
+                "reply": ms(self.received, self.replied),
+                "total": ms(self.received, self.acked)
+            }
+        }
+
+_recent = deque(maxlen=config.COMMAND_TRACE_HISTORY)
+
+def http_request_started():
+    """Called by the HTTP middleware when a request arrives; returns its context."""
+    context = HttpContext(time.perf_counter())
+    _http_context.set(context)
+    return context
+
+def http_request_finished(context):
+    """Called by the HTTP middleware once the reply is ready."""
+    context.replied = time.perf_counter()
+    for trace in context.traces:
+        trace.replied = context.replied
+        trace._record('reply', trace.received, trace.replied)
+
+def current_traces():
+    """Traces of the commands sent so far by the HTTP request being handled."""
+    context = _http_context.get()
+    return context.traces if context is not None else []
+
+def scheduled(future):
+    """Records a command that a scheduler sends later; future resolves to its Trace, or None if it was replaced."""
+    context = _http_context.get()
+    if context is not None:
+        context.scheduled.append(future)
+
+def current_scheduled():
+    """Futures of the commands the HTTP request being handled left to a scheduler."""
+    context = _http_context.get()
+    return context.scheduled if context is not None else []
+
+def begin(request_msg):
+    """Starts a trace for a Request that has just been serialized."""
+    now = time.perf_counter()
+    context = _http_context.get()
+    command = request_msg.WhichOneof('actions') or 'unknown'
+    if context is not None:
+        trace_id = context.trace_id if not context.traces else f"{context.trace_id}-{len(context.traces)}"
+        trace = Trace(trace_id, command, context.received)
+        context.traces.append(trace)
+        if context.replied is not None:
+            # The handler replied before the send task ran
+            trace.replied = context.replied
+            trace._record('reply', trace.received, trace.replied)
+    else:
+        trace = Trace(os.urandom(8).hex(), command, now)
+    trace.serialized = now
+    trace._record('handle', trace.received, trace.serialized)
+    _recent.append(trace)
+    return trace
+
+def attach(trace):
+    """Records that the Request was queued for one more game connection."""
+    trace.clients += 1
+    trace.pending += 1
+
+def sent(trace):
+    """Records that the Request was written to a connection."""
+    if trace.sent is None:
+        trace.sent = time.perf_counter()
+        trace._record('send', trace.serialized, trace.sent)
+
+def acknowledged(trace, success):
+    """Records a Response from one of the connections the trace was sent to."""
+    now = time.perf_counter()
+    trace.acks += 1
+    trace.pending -= 1
+    if trace.acked is None:
+        trace.acked = now
+        trace._record('game', trace.sent, trace.acked)
+        trace._record('total', trace.received, trace.acked)
+    if success:
+        # One client carrying out the command is enough
+        trace.success = True
+        trace._finish('acked')
+    else:
+        if trace.success is None:
+            trace.success = False
+        if trace.pending == 0:
+            trace._finish('failed')
+
+def abandoned(trace, outcome):
+    """
+    Records that one connection will not answer: 'timeout', 'disconnected',
+    or 'sent' for a request that didn't ask for an ack.
+    """
+    trace.pending -= 1
+    if trace.pending == 0 and trace.outcome is None:
+        trace._finish('failed' if trace.success is False else outcome)
+
+def not_sent(trace):
+    """Records that there was no game connection to send the Request to."""
+    trace._finish('not_sent')
+
+async def wait_for_acks(traces, timeout):
+    """Waits until every trace has its outcome or timeout seconds have passed."""
+    loop = asyncio.get_running_loop()
+    waiters = []
+    for trace in traces:
+        if trace.outcome is None:
+            if trace.waiter is None:
+                trace.waiter = loop.create_future()
+            waiters.append(trace.waiter)
+    if waiters:
+        await asyncio.wait(waiters, timeout=timeout)
+
+def recent_traces(limit=None, command=None):
+    """The most recent traces, newest first."""
+    result = []
+    for trace in reversed(_recent):
+        if limit is not None and len(result) >= limit:
+            break
+        if command is not None and trace.command != command:
+            continue
+        result.append(trace.to_dict())
+    return result
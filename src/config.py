@@ -11,3 +11,76 @@ TOPIC_ID = os.getenv("TOPIC_ID", "apexlegends")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+
+# Pub/Sub publisher configuration
+PUBSUB_QUEUE_MAXSIZE = int(os.getenv("PUBSUB_QUEUE_MAXSIZE", 10000))
+PUBSUB_BATCH_MAX_MESSAGES = int(os.getenv("PUBSUB_BATCH_MAX_MESSAGES", 100))
+PUBSUB_BATCH_MAX_BYTES = int(os.getenv("PUBSUB_BATCH_MAX_BYTES", 1024 * 1024))
+PUBSUB_BATCH_MAX_LATENCY = float(os.getenv("PUBSUB_BATCH_MAX_LATENCY", 0.05))
+PUBSUB_FLOW_CONTROL_MAX_MESSAGES = int(os.getenv("PUBSUB_FLOW_CONTROL_MAX_MESSAGES", 1000))
+PUBSUB_FLOW_CONTROL_MAX_BYTES = int(os.getenv("PUBSUB_FLOW_CONTROL_MAX_BYTES", 10 * 1024 * 1024))
+
+# Ingest pipeline configuration
+INGEST_FRAME_QUEUE_MAXSIZE = int(os.getenv("INGEST_FRAME_QUEUE_MAXSIZE", 1000))
+INGEST_SINK_QUEUE_MAXSIZE = int(os.getenv("INGEST_SINK_QUEUE_MAXSIZE", 5000))
+
+# In-process read cache in front of Redis
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 256))
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "liveapi:invalidate")
+
+# All LiveAPI state lives in this Redis hash (field = message type)
+REDIS_STATE_KEY = os.getenv("REDIS_STATE_KEY", "liveapi:state")
+
+# Redis write batching: flush after this many pending keys or this many seconds
+REDIS_WRITE_BATCH_SIZE = int(os.getenv("REDIS_WRITE_BATCH_SIZE", 100))
+REDIS_WRITE_FLUSH_INTERVAL = float(os.getenv("REDIS_WRITE_FLUSH_INTERVAL", 0.005))
+# A failed flush is retried with the batch kept, backing off up to this many seconds;
+# beyond this many buffered stream entries the oldest are dropped
+REDIS_WRITE_MAX_BACKOFF = float(os.getenv("REDIS_WRITE_MAX_BACKOFF", 5.0))
+REDIS_WRITE_MAX_PENDING = int(os.getenv("REDIS_WRITE_MAX_PENDING", 100000))
+
+# Per-match event history (Redis Streams)
+HISTORY_KEY_PREFIX = os.getenv("HISTORY_KEY_PREFIX", "liveapi:history")
+HISTORY_STREAM_MAXLEN = int(os.getenv("HISTORY_STREAM_MAXLEN", 200000))
+HISTORY_MAX_MATCHES = int(os.getenv("HISTORY_MAX_MATCHES", 100))
+HISTORY_TTL_SECONDS = int(os.getenv("HISTORY_TTL_SECONDS", 2 * 24 * 3600))
+
+# Ring tracker: seconds between "who is outside the ring" passes
+RING_TICK_INTERVAL = float(os.getenv("RING_TICK_INTERVAL", 0.5))
+
+# Dashboard live updates (Server-Sent Events)
+LIVE_STATUS_INTERVAL = float(os.getenv("LIVE_STATUS_INTERVAL", 1.0))
+LIVE_KEEPALIVE_INTERVAL = float(os.getenv("LIVE_KEEPALIVE_INTERVAL", 15.0))
+
+# Overlay subscriptions (ws://<host>:7777/subscribe)
+OVERLAY_SEND_BUFFER = int(os.getenv("OVERLAY_SEND_BUFFER", 256))
+OVERLAY_TICK_INTERVAL = float(os.getenv("OVERLAY_TICK_INTERVAL", 0.1))
+OVERLAY_RECENT_KILLS = int(os.getenv("OVERLAY_RECENT_KILLS", 20))
+
+# Background loops: longest wait for one to end when it is stopped
+TASK_STOP_TIMEOUT = float(os.getenv("TASK_STOP_TIMEOUT", 5.0))
+
+# Health: one background Redis probe instead of a PING per /health-check
+HEALTH_REDIS_PROBE_INTERVAL = float(os.getenv("HEALTH_REDIS_PROBE_INTERVAL", 5.0))
+HEALTH_REDIS_TIMEOUT = float(os.getenv("HEALTH_REDIS_TIMEOUT", 2.0))
+
+# Command tracing: how long a sent command may wait for the game's ack, and how many traces /debug/traces keeps
+COMMAND_ACK_TIMEOUT = float(os.getenv("COMMAND_ACK_TIMEOUT", 5.0))
+COMMAND_TRACE_HISTORY = int(os.getenv("COMMAND_TRACE_HISTORY", 200))
+
+# Command queue per game connection: most requests awaiting their ack at once, and resends of idempotent commands that time out
+COMMAND_MAX_IN_FLIGHT = int(os.getenv("COMMAND_MAX_IN_FLIGHT", 16))
+COMMAND_MAX_RETRIES = int(os.getenv("COMMAND_MAX_RETRIES", 2))
+# Seconds a send to one game client may take, and missed send/ack deadlines in a row before it is marked degraded
+COMMAND_SEND_TIMEOUT = float(os.getenv("COMMAND_SEND_TIMEOUT", 1.0))
+COMMAND_DEGRADED_AFTER = int(os.getenv("COMMAND_DEGRADED_AFTER", 3))
+
+# Game session (lobby) that the scoreboards, ring, overlays and live feeds follow; empty for the longest-connected one
+PRIMARY_SESSION = os.getenv("PRIMARY_SESSION", "")
+
+# /batch: most commands accepted in one request, and the longest wait for their acks
+BATCH_MAX_COMMANDS = int(os.getenv("BATCH_MAX_COMMANDS", 500))
+BATCH_MAX_TIMEOUT = float(os.getenv("BATCH_MAX_TIMEOUT", 30.0))
+
+# Camera commands: minimum seconds between two sent to the game; newer ones replace those waiting
+CAMERA_MIN_INTERVAL = float(os.getenv("CAMERA_MIN_INTERVAL", 0.2))
@@ -1,101 +1,396 @@
 # data_store.py
 import asyncio
 import json
+import time
+import uuid
+from collections import OrderedDict
 import redis.asyncio as redis # Use redis.asyncio for async operations
 import logging
 import config # Changed from relative to absolute import
+import metrics
+import session_registry
+from background_tasks import stop_task, stopping
 
 logger = logging.getLogger(__name__)
 
-# Global Redis connection pool
+# Global Redis connection pool and the long-lived client built on it.
+# Both are owned by the application lifecycle (on_startup/on_shutdown in main.py).
 redis_pool = None
+redis_client = None
 
-# data_updated_event will be initialized in main.py with the correct event loop
-data_updated_event = None
+# Pending writes for the batching writer: (state hash, field) -> encoded value (latest wins)
+_pending_writes = {}
+# Pending stream appends: (stream key, fields, maxlen, ttl), never coalesced
+_pending_appends = []
+_writer_task = None
+_writer_wakeup = None
+_batch_full = None
+_writes_queued = 0
+_writes_coalesced = 0
+_flushes = 0
+_last_flush_size = 0
+_flush_errors = 0
+_writes_dropped = 0
+# When the oldest write still waiting for a flush was queued (monotonic), None when nothing is pending
+_pending_since = None
 
-async def init_data_store_event(loop):
-    """Initializes the data_updated_event with the correct loop."""
-    global data_updated_event
-    data_updated_event = asyncio.Event(loop=loop)
-    logger.info("data_updated_event initialized with the provided event loop.")
+# In-process cache of decoded values: (state hash, field) -> (version, value).
+# Cached values are shared between readers and must be treated as read-only.
+_cache = OrderedDict()
+# Bumped on every local write or invalidation, so a slow read-through GET
+# never overwrites a newer value
+_versions = {}
+_cache_hits = 0
+_cache_misses = 0
+_cache_evictions = 0
+_cache_invalidations = 0
+_invalidation_task = None
+
+redis_write_seconds = metrics.Histogram('apex_redis_write_seconds', 'Time for one pipelined Redis write round-trip')
+redis_pipeline_size = metrics.Histogram('apex_redis_pipeline_size', 'State fields plus stream entries written per pipeline',
+                                        buckets=metrics.SIZE_BUCKETS)
+metrics.Collected('apex_redis_write_errors_total', 'Batched Redis writes that failed', (),
+                  lambda: {(): _flush_errors}, kind='counter')
+metrics.Collected('apex_redis_writes_dropped_total', 'Stream entries and state writes given up on after failed flushes', (),
+                  lambda: {(): _writes_dropped}, kind='counter')
+metrics.Collected('apex_redis_writes_pending', 'Writes waiting for the next batch', (),
+                  lambda: {(): _pending_count()})
+
+# Identifies this process on the invalidation channel so it ignores its own writes
+PROCESS_ID = uuid.uuid4().hex
 
 async def init_redis_pool():
-    """Initializes the Redis connection pool."""
-    global redis_pool
+    """Initializes the Redis connection pool and the shared client."""
+    global redis_pool, redis_client
     try:
         redis_pool = redis.ConnectionPool(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB)
+        redis_client = redis.Redis(connection_pool=redis_pool)
         logger.info(f"Successfully connected to Redis at {config.REDIS_HOST}:{config.REDIS_PORT}")
     except Exception as e:
         logger.error(f"Could not connect to Redis: {e}")
         redis_pool = None # Ensure pool is None if connection fails
+        redis_client = None
+
+async def close_redis():
+    """Flushes pending writes and closes the shared client and its pool."""
+    global redis_pool, redis_client
+    await stop_redis_writer()
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+        redis_pool = None
+        logger.info("Redis connection pool disconnected.")
 
 async def get_redis_connection():
-    """Gets a Redis connection from the pool."""
-    if not redis_pool:
+    """Gets the shared Redis client. Callers must not close it."""
+    if not redis_client:
         await init_redis_pool() # Attempt to initialize if not already
-        if not redis_pool: # If still None after attempt, raise error
+        if not redis_client: # If still None after attempt, raise error
             raise ConnectionError("Redis connection pool is not available.")
-    return redis.Redis(connection_pool=redis_pool)
+    return redis_client
+
+def state_key(session=None):
+    """
+    The Redis hash holding a game session's state. The default session keeps
+    the plain REDIS_STATE_KEY, so single-lobby setups read the same key as before.
+
+    Args:
+        session: Session id; None for the current request's session, see session_registry.current()
+    """
+    if session is None:
+        session = session_registry.current()
+    if session == session_registry.DEFAULT_SESSION:
+        return config.REDIS_STATE_KEY
+    return f"{config.REDIS_STATE_KEY}:{session}"
+
+def _bump_version(key):
+    version = _versions.get(key, 0) + 1
+    _versions[key] = version
+    return version
+
+def _cache_put(key, version, value):
+    global _cache_evictions
+    _cache[key] = (version, value)
+    _cache.move_to_end(key)
+    while len(_cache) > config.CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _cache_evictions += 1
+
+def invalidate_cached(key):
+    """Drops a key from the in-process cache."""
+    global _cache_invalidations
+    _bump_version(key)
+    if _cache.pop(key, None) is not None:
+        _cache_invalidations += 1
+
+async def update_data_store(result_type, data, decoded=None, session=None):
+    """
+    Updates data in Redis and in the in-process cache.
 
-async def update_data_store(result_type, data):
-    """Updates data in Redis and sets the event."""
+    Args:
+        result_type: Key to store the data under
+        data: A JSON-compatible dict, or already encoded JSON bytes
+        decoded: The value readers should get back, when data is bytes
+        session: Game session the data belongs to; None for the current one
+    """
+    key = (state_key(session), result_type)
+    if decoded is None and not isinstance(data, bytes):
+        decoded = data
+    if decoded is not None:
+        _cache_put(key, _bump_version(key), decoded)
+    else:
+        invalidate_cached(key)
+    # Store data as JSON string
+    value = data if isinstance(data, bytes) else json.dumps(data)
+    if _writer_task is not None:
+        _queue_write(key, value)
+        return
     try:
-        r = await get_redis_connection()
-        # Store data as JSON string
-        await r.set(result_type, json.dumps(data))
-        await r.close()
-        if data_updated_event:
-            data_updated_event.set()
-        else:
-            logger.warning("data_updated_event not initialized, cannot set event.")
+        await _write_batch({key: value})
         logger.debug(f"Data for {result_type} updated in Redis.")
     except Exception as e:
         logger.error(f"Error updating data in Redis for {result_type}: {e}")
 
-async def get_data_store():
-    """Retrieves all keys from Redis (use with caution in production)."""
+def _queue_write(key, value):
+    global _writes_queued, _writes_coalesced
+    _writes_queued += 1
+    if key in _pending_writes:
+        _writes_coalesced += 1
+    _pending_writes[key] = value
+    _wake_writer()
+
+def _pending_count():
+    """State fields and stream entries waiting for the next flush."""
+    return len(_pending_writes) + len(_pending_appends)
+
+def _wake_writer():
+    global _pending_since
+    if _pending_since is None:
+        _pending_since = time.monotonic()
+    _writer_wakeup.set()
+    if _pending_count() >= config.REDIS_WRITE_BATCH_SIZE:
+        _batch_full.set()
+
+async def append_to_stream(stream_key, fields, maxlen, ttl=None):
+    """
+    Appends an entry to a capped Redis stream (XADD MAXLEN ~).
+
+    Args:
+        stream_key: Stream to append to
+        fields: dict of field -> str/bytes value
+        maxlen: Approximate maximum stream length
+        ttl: Optional expiry in seconds, set on the stream if it has none yet
+    """
+    global _writes_queued
+    if _writer_task is not None:
+        _writes_queued += 1
+        _pending_appends.append((stream_key, fields, maxlen, ttl))
+        _wake_writer()
+        return
+    try:
+        await _write_batch({}, [(stream_key, fields, maxlen, ttl)])
+    except Exception as e:
+        logger.error(f"Error appending to Redis stream {stream_key}: {e}")
+
+async def _write_batch(batch, appends=()):
+    """Writes state fields and stream entries, and announces the fields, in a single round-trip."""
+    by_hash = {}
+    for (hash_key, field), value in batch.items():
+        by_hash.setdefault(hash_key, {})[field] = value
+    r = await get_redis_connection()
+    async with r.pipeline(transaction=False) as pipe:
+        for hash_key, fields in by_hash.items():
+            pipe.hset(hash_key, mapping=fields)
+            pipe.publish(config.CACHE_INVALIDATION_CHANNEL, f"{PROCESS_ID} {hash_key} {' '.join(fields)}")
+        expiring = {}
+        for stream_key, fields, maxlen, ttl in appends:
+            pipe.xadd(stream_key, fields, maxlen=maxlen, approximate=True)
+            if ttl:
+                expiring[stream_key] = ttl
+        # NX: a stream keeps the expiry of its first entry, without a separate round-trip to check for one
+        for stream_key, ttl in expiring.items():
+            pipe.expire(stream_key, ttl, nx=True)
+        started = time.perf_counter()
+        await pipe.execute()
+        redis_write_seconds.observe(time.perf_counter() - started)
+        redis_pipeline_size.observe(len(batch) + len(appends))
+
+async def start_redis_writer():
+    """Starts the micro-batching writer used by update_data_store."""
+    global _writer_task, _writer_wakeup, _batch_full
+    _writer_wakeup = asyncio.Event()
+    _batch_full = asyncio.Event()
+    _writer_task = asyncio.create_task(_writer_loop())
+
+async def stop_redis_writer():
+    """Stops the writer after flushing whatever is still pending."""
+    global _writer_task
+    if _writer_task is None:
+        return
+    task, _writer_task = _writer_task, None
+    await stop_task(task)
+    if (_pending_writes or _pending_appends) and not await _flush_pending():
+        _drop_pending()
+
+async def _writer_loop():
+    backoff = 0.0
+    while not stopping():
+        await _writer_wakeup.wait()
+        if _pending_count() < config.REDIS_WRITE_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(_batch_full.wait(), config.REDIS_WRITE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        if await _flush_pending():
+            backoff = 0.0
+        else:
+            # The batch is back in the queue; give Redis time to recover before retrying
+            backoff = min(max(backoff * 2, config.REDIS_WRITE_FLUSH_INTERVAL), config.REDIS_WRITE_MAX_BACKOFF)
+            await asyncio.sleep(backoff)
+
+def _requeue(batch, appends, since):
+    """Puts a batch that wasn't written back in front of newer writes, dropping the oldest stream entries beyond the cap."""
+    global _pending_writes, _pending_appends, _pending_since, _writes_dropped
+    # Newer values of the same field win
+    batch.update(_pending_writes)
+    _pending_writes = batch
+    _pending_appends = appends + _pending_appends
+    _pending_since = since
+    excess = len(_pending_appends) - config.REDIS_WRITE_MAX_PENDING
+    if excess > 0:
+        del _pending_appends[:excess]
+        _writes_dropped += excess
+        logger.warning(f"Dropped the {excess} oldest stream entries waiting for Redis")
+
+def _drop_pending():
+    global _pending_writes, _pending_appends, _pending_since, _writes_dropped
+    dropped = _pending_count()
+    _writes_dropped += dropped
+    _pending_writes, _pending_appends, _pending_since = {}, [], None
+    logger.error(f"Dropped {dropped} writes that could not be flushed to Redis")
+
+async def _flush_pending():
+    """Writes everything pending; returns False if Redis failed and the batch was put back for a retry."""
+    global _pending_writes, _pending_appends, _flushes, _last_flush_size, _flush_errors, _pending_since
+    batch, appends, since = _pending_writes, _pending_appends, _pending_since
+    _pending_writes, _pending_appends, _pending_since = {}, [], None
+    _writer_wakeup.clear()
+    _batch_full.clear()
+    if not batch and not appends:
+        return True
+    try:
+        await _write_batch(batch, appends)
+        _flushes += 1
+        _last_flush_size = len(batch) + len(appends)
+        logger.debug(f"Flushed {len(batch)} keys and {len(appends)} stream entries to Redis.")
+        return True
+    except asyncio.CancelledError:
+        # Put the batch back so shutdown can flush it
+        _requeue(batch, appends, since)
+        raise
+    except Exception as e:
+        _flush_errors += 1
+        logger.error(f"Error flushing {len(batch)} keys and {len(appends)} stream entries to Redis, will retry: {e}")
+        _requeue(batch, appends, since)
+        _writer_wakeup.set()
+        return False
+
+async def get_data_store(session=None):
+    """Retrieves a snapshot of a game session's LiveAPI state in one HGETALL round-trip."""
     try:
         r = await get_redis_connection()
-        keys = await r.keys('*')
+        fields = await r.hgetall(state_key(session))
         all_data = {}
-        for key_bytes in keys:
-            key = key_bytes.decode('utf-8')
-            value_bytes = await r.get(key)
+        for key_bytes, value_bytes in fields.items():
             if value_bytes:
-                all_data[key] = json.loads(value_bytes.decode('utf-8'))
-        await r.close()
+                all_data[key_bytes.decode('utf-8')] = json.loads(value_bytes)
         return all_data
     except Exception as e:
         logger.error(f"Error retrieving all data from Redis: {e}")
         return {}
 
-async def get_data_by_type(result_type):
-    """Retrieves specific data by type (key) from Redis."""
+async def get_data_by_type(result_type, session=None):
+    """Retrieves specific data by type (key) of a game session, from the in-process cache or Redis."""
+    global _cache_hits, _cache_misses
+    hash_key = state_key(session)
+    key = (hash_key, result_type)
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache_hits += 1
+        _cache.move_to_end(key)
+        return cached[1]
+    _cache_misses += 1
+    version = _versions.get(key, 0)
     try:
         r = await get_redis_connection()
-        value_bytes = await r.get(result_type)
-        await r.close()
+        value_bytes = await r.hget(hash_key, result_type)
         if value_bytes:
-            return json.loads(value_bytes.decode('utf-8'))
+            value = json.loads(value_bytes.decode('utf-8'))
+            if _versions.get(key, 0) == version:
+                _cache_put(key, version, value)
+            return value
         return {}
     except Exception as e:
         logger.error(f"Error retrieving data from Redis for {result_type}: {e}")
         return {}
 
-async def wait_for_data_update(timeout=5):
-    """
-    Waits for the local data_updated_event.
-    """
-    if not data_updated_event:
-        logger.warning("data_updated_event not initialized. Cannot wait.")
-        return False # Or raise an error, depending on desired behavior
-    try:
-        data_updated_event.clear()
-        await asyncio.wait_for(data_updated_event.wait(), timeout)
-    except asyncio.TimeoutError:
-        logger.debug("Timeout waiting for data update event.")
-        return False
-    return True
+async def start_cache_invalidation_listener():
+    """Starts listening for writes made by other processes."""
+    global _invalidation_task
+    _invalidation_task = asyncio.create_task(_listen_for_invalidations())
+
+async def stop_cache_invalidation_listener():
+    global _invalidation_task
+    task, _invalidation_task = _invalidation_task, None
+    await stop_task(task)
+
+async def _listen_for_invalidations():
+    while not stopping():
+        try:
+            r = await get_redis_connection()
+            async with r.pubsub() as pubsub:
+                await pubsub.subscribe(config.CACHE_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    origin, hash_key, *fields = message['data'].decode('utf-8').split(' ')
+                    if origin != PROCESS_ID:
+                        for field in fields:
+                            invalidate_cached((hash_key, field))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Cache invalidation listener failed, retrying: {e}")
+            await asyncio.sleep(5)
+
+def get_cache_stats():
+    """Hit/miss counters for the in-process cache."""
+    lookups = _cache_hits + _cache_misses
+    return {
+        "entries": len(_cache),
+        "max_entries": config.CACHE_MAX_ENTRIES,
+        "hits": _cache_hits,
+        "misses": _cache_misses,
+        "hit_ratio": round(_cache_hits / lookups, 4) if lookups else None,
+        "evictions": _cache_evictions,
+        "invalidations": _cache_invalidations
+    }
+
+def get_writer_stats():
+    """Counters for the batching Redis writer."""
+    return {
+        "pending": _pending_count(),
+        # Seconds the oldest pending write has been waiting
+        "lag": round(time.monotonic() - _pending_since, 4) if _pending_since is not None else 0.0,
+        "queued": _writes_queued,
+        "coalesced": _writes_coalesced,
+        "flushes": _flushes,
+        "last_flush_size": _last_flush_size,
+        "errors": _flush_errors,
+        "dropped": _writes_dropped
+    }
 
 # It might be useful to add functions for more specific Redis operations
 # e.g., incrementing counters, managing lists, sets, or hashes directly
@@ -0,0 +1,57 @@
+# event_envelope.py
+import orjson
+from google.protobuf.json_format import MessageToDict
+
+class EventEnvelope:
+    """
+    One decoded LiveAPI event shared by every sink.
+
+    The raw Any payload is parsed, converted to a dict and encoded to JSON
+    lazily, each at most once, so Redis, Pub/Sub and any other sink reuse
+    the same objects instead of serializing the event again.
+
+    Args:
+        type_name: Fully qualified message type name
+        raw: Serialized message bytes (the Any value), if available
+        message_class: Generated class used to parse raw
+        message: Already decoded protobuf message, if available
+        data: Already built dict, for events that have no protobuf message
+        session: Id of the game session (lobby) the event came from
+        source: Game connection the event was read from; None for events
+            the server derives itself
+    """
+    __slots__ = ('type_name', 'raw', 'session', 'source', '_message_class', '_message', '_data', '_json')
+
+    def __init__(self, type_name, raw=None, message_class=None, message=None, data=None, session=None, source=None):
+        self.type_name = type_name
+        self.session = session
+        self.source = source
+        self.raw = raw
+        self._message_class = message_class
+        self._message = message
+        self._data = data
+        self._json = None
+
+    @property
+    def message(self):
+        """The decoded protobuf message, or None for dict-only events."""
+        if self._message is None and self.raw is not None and self._message_class is not None:
+            message = self._message_class()
+            message.ParseFromString(self.raw)
+            self._message = message
+        return self._message
+
+    @property
+    def data(self):
+        """The event as a JSON-compatible dict (MessageToDict output)."""
+        if self._data is None:
+            message = self.message
+            self._data = MessageToDict(message) if message is not None else {}
+        return self._data
+
+    @property
+    def json_bytes(self):
+        """The event encoded as UTF-8 JSON bytes."""
+        if self._json is None:
+            self._json = orjson.dumps(self.data)
+        return self._json
@@ -0,0 +1,34 @@
+# event_registry.py
+import logging
+from collections import namedtuple
+
+import events_pb2
+
+logger = logging.getLogger('websocket_server')
+
+TYPE_URL_PREFIX = "type.googleapis.com/"
+
+# One entry per LiveAPI message type: the fully qualified name, the generated
+# class and the coroutine that handles a decoded instance of it.
+DecoderEntry = namedtuple('DecoderEntry', ['type_name', 'message_class', 'handler'])
+
+def build_decoder_table(default_handler, handlers=None):
+    """
+    Walk events_pb2.DESCRIPTOR once and map every type URL to its decoder.
+
+    Args:
+        default_handler: Coroutine function called with an EventEnvelope for
+            every type without a dedicated handler
+        handlers: Optional dict of fully qualified type name -> handler overrides
+
+    Returns:
+        dict: 'type.googleapis.com/rtech.liveapi.X' -> DecoderEntry
+    """
+    handlers = handlers or {}
+    table = {}
+    for name, descriptor in events_pb2.DESCRIPTOR.message_types_by_name.items():
+        message_class = getattr(events_pb2, name)
+        handler = handlers.get(descriptor.full_name, default_handler)
+        table[TYPE_URL_PREFIX + descriptor.full_name] = DecoderEntry(descriptor.full_name, message_class, handler)
+    logger.info(f"Decoder table built with {len(table)} LiveAPI message types")
+    return table
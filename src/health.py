@@ -0,0 +1,155 @@
+# health.py
+import asyncio
+import logging
+import time
+from datetime import datetime
+import config
+import data_store
+from background_tasks import stop_task, stopping
+import live_updates
+from pubsub_manager import get_pubsub_status
+
+logger = logging.getLogger('websocket_server')
+
+LOBBY_PLAYERS_TYPE = 'rtech.liveapi.CustomMatch_LobbyPlayers'
+RESPONSE_TYPE = 'rtech.liveapi.Response'
+
+def _age(moment, now):
+    return None if moment is None else round(now - moment, 1)
+
+class HealthMonitor:
+    """
+    Server health, kept up to date as things happen instead of measured per request.
+
+    Events and websocket traffic only record timestamps, and Redis is checked
+    by a single background probe, so snapshot() does no I/O and costs the
+    same however often /health-check and the live status feed ask for it.
+    """
+
+    def __init__(self):
+        self.last_event = {}
+        self.events = 0
+        self.clients = 0
+        self.last_message = None
+        self.redis_connected = False
+        self.redis_latency = None
+        self.redis_checked = None
+        self.redis_error = None
+        # What the shared data store held at the last probe, so a restarted server still reports the stored game data
+        self.stored_types = 0
+        self.stored_lobby = False
+        self.stored_response = False
+
+    def record_event(self, type_name):
+        self.last_event[type_name] = time.time()
+        self.events += 1
+
+    def record_message(self):
+        self.last_message = time.time()
+
+    def client_connected(self):
+        self.clients += 1
+
+    def client_disconnected(self):
+        self.clients -= 1
+
+    async def probe_redis(self):
+        """Pings Redis and reads what the store holds, in one round-trip."""
+        started = time.perf_counter()
+        try:
+            r = await data_store.get_redis_connection()
+            # The primary game session's state
+            state_key = data_store.state_key()
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.ping()
+                pipe.hlen(state_key)
+                pipe.hexists(state_key, LOBBY_PLAYERS_TYPE)
+                pipe.hexists(state_key, RESPONSE_TYPE)
+                _, self.stored_types, self.stored_lobby, self.stored_response = \
+                    await asyncio.wait_for(pipe.execute(), config.HEALTH_REDIS_TIMEOUT)
+            self.redis_latency = round((time.perf_counter() - started) * 1000, 1)
+            self.redis_error = None
+            connected = True
+        except Exception as e:
+            if self.redis_connected or self.redis_checked is None:
+                logger.warning(f"Redis connection failed: {e}")
+            self.redis_latency = None
+            self.redis_error = str(e) or type(e).__name__
+            connected = False
+        self.redis_checked = time.time()
+        if connected != self.redis_connected:
+            self.redis_connected = connected
+            live_updates.refresh_status()
+
+    def snapshot(self, detail=True):
+        """
+        The /health-check payload.
+
+        Args:
+            detail: Include the ages of the last message, probe and event of
+                every type. They change every second, so the live status feed
+                leaves them out and is only pushed on real changes.
+        """
+        now = time.time()
+        websocket_connected = self.clients > 0
+        game_data_available = bool(self.last_event) or self.stored_types > 0
+        has_lobby = LOBBY_PLAYERS_TYPE in self.last_event or self.stored_lobby
+        websocket_responsive = websocket_connected and (
+            has_lobby or RESPONSE_TYPE in self.last_event or self.stored_response)
+
+        if websocket_connected and websocket_responsive and self.redis_connected and game_data_available:
+            overall_status = "healthy"
+        elif websocket_connected and self.redis_connected:
+            overall_status = "degraded" if websocket_responsive else "issues"
+        else:
+            overall_status = "error"
+
+        status = {
+            "status": overall_status,
+            "websocket": {
+                "connected": websocket_connected,
+                "responsive": websocket_responsive,
+                "connections": self.clients
+            },
+            "redis": {
+                "connected": self.redis_connected,
+                "error": self.redis_error
+            },
+            "game_data": {
+                "available": game_data_available,
+                "freshness": "recent" if has_lobby else ("stale" if game_data_available else "unknown")
+            },
+            "pubsub": get_pubsub_status(),
+            "timestamp": datetime.now().isoformat()
+        }
+        if detail:
+            writer = data_store.get_writer_stats()
+            status["websocket"]["seconds_since_last_message"] = _age(self.last_message, now)
+            status["redis"].update({
+                "latency_ms": self.redis_latency,
+                "seconds_since_check": _age(self.redis_checked, now),
+                "writer_pending": writer["pending"],
+                "writer_lag": writer["lag"]
+            })
+            status["events"] = {
+                "total": self.events,
+                "seconds_since_last": {t: _age(at, now) for t, at in sorted(self.last_event.items())}
+            }
+        return status
+
+monitor = HealthMonitor()
+_probe_task = None
+
+async def _probe_loop():
+    while not stopping():
+        await monitor.probe_redis()
+        await asyncio.sleep(config.HEALTH_REDIS_PROBE_INTERVAL)
+
+def start_health_probe():
+    global _probe_task
+    _probe_task = asyncio.create_task(_probe_loop())
+
+async def stop_health_probe():
+    global _probe_task
+    task, _probe_task = _probe_task, None
+    await stop_task(task)
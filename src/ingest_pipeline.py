@@ -0,0 +1,259 @@
+# ingest_pipeline.py
+import asyncio
+import logging
+from collections import deque
+import config
+import metrics
+import session_registry
+from background_tasks import stop_task, stopping
+
+logger = logging.getLogger('websocket_server')
+
+# Per-category delivery policies for sink queues
+LOSSLESS = 'lossless'   # never dropped; the producer waits for room when the queue is full
+COALESCE = 'coalesce'   # only the latest value per key is kept while it waits in the queue
+DROP = 'drop'           # best effort; new events are dropped when the queue is full
+
+DEFAULT_POLICY = DROP
+
+CATEGORY_POLICIES = {
+    'rtech.liveapi.Init': LOSSLESS,
+    'rtech.liveapi.Response': LOSSLESS,
+    'rtech.liveapi.CustomMatch_LobbyPlayers': LOSSLESS,
+    'rtech.liveapi.CustomMatch_LegendBanStatus': LOSSLESS,
+    'rtech.liveapi.MatchSetup': LOSSLESS,
+    'rtech.liveapi.GameStateChanged': LOSSLESS,
+    'rtech.liveapi.MatchStateEnd': LOSSLESS,
+    'rtech.liveapi.PlayerKilled': LOSSLESS,
+    'rtech.liveapi.SquadEliminated': LOSSLESS,
+    'rtech.liveapi.PlayerStatChanged': COALESCE,
+    'rtech.liveapi.AmmoUsed': COALESCE,
+    'rtech.liveapi.WeaponSwitched': COALESCE,
+    'rtech.liveapi.PlayerUpgradeTierChanged': COALESCE,
+    'rtech.liveapi.PlayerUltimateCharged': COALESCE,
+    'rtech.liveapi.ObserverSwitched': COALESCE,
+}
+
+def coalesce_key(envelope):
+    """Events sharing a key replace each other while queued: one slot per session, type and player (observer)."""
+    message = envelope.message
+    if envelope.type_name == 'rtech.liveapi.ObserverSwitched':
+        # Each observer's camera switches only replace that observer's
+        player = message.observer
+    else:
+        player = getattr(message, 'player', None)
+    key = (envelope.session, envelope.type_name, player.nucleusHash if player is not None else '')
+    if envelope.type_name == 'rtech.liveapi.PlayerStatChanged':
+        key += (message.statName,)
+    return key
+
+class _CoalescedSlot:
+    """Queue placeholder whose value is looked up when it reaches the head."""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+class SinkQueue:
+    """
+    Bounded queue feeding one sink, with its own worker task.
+
+    Args:
+        name: Name reported in the pipeline stats
+        handler: Coroutine function called as handler(envelope)
+        accepts: Optional set of type names this sink wants; None means all
+        maxsize: Maximum number of queued events
+        policies: dict of type name -> LOSSLESS/COALESCE/DROP
+        default_policy: Policy for types missing from policies
+        primary_only: Only pass on events of the primary game session, for
+            sinks that track a single match
+        source_only: Only pass on events read from the source connection of
+            their session, so events every observer of a lobby sends are
+            counted once
+    """
+
+    def __init__(self, name, handler, accepts=None, maxsize=None, policies=None, default_policy=DEFAULT_POLICY,
+                 primary_only=False, source_only=False):
+        self.name = name
+        self.handler = handler
+        self.accepts = accepts
+        self.primary_only = primary_only
+        self.source_only = source_only
+        self.maxsize = maxsize or config.INGEST_SINK_QUEUE_MAXSIZE
+        self.policies = CATEGORY_POLICIES if policies is None else policies
+        self.default_policy = default_policy
+        self._slots = deque()
+        self._latest = {}
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._task = None
+        self.peak_depth = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def offer(self, envelope):
+        """Queues an event according to its category policy."""
+        type_name = envelope.type_name
+        if self.accepts is not None and type_name not in self.accepts:
+            return
+        if self.primary_only and envelope.session != session_registry.registry.primary:
+            return
+        if self.source_only and envelope.source is not None and not session_registry.registry.is_source(envelope.source):
+            return
+        policy = self.policies.get(type_name, self.default_policy)
+        if policy == COALESCE:
+            key = coalesce_key(envelope)
+            if key in self._latest:
+                self._latest[key] = envelope
+                self.coalesced += 1
+                return
+            if len(self._slots) >= self.maxsize:
+                self.dropped += 1
+                return
+            self._latest[key] = envelope
+            self._slots.append(_CoalescedSlot(key))
+        else:
+            if len(self._slots) >= self.maxsize:
+                if policy != LOSSLESS:
+                    self.dropped += 1
+                    return
+                while len(self._slots) >= self.maxsize:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+            self._slots.append(envelope)
+        depth = len(self._slots)
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+        self._not_empty.set()
+
+    async def run(self):
+        """Worker loop: hands queued events to the sink one at a time."""
+        while not stopping():
+            while not self._slots:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+            slot = self._slots.popleft()
+            if isinstance(slot, _CoalescedSlot):
+                slot = self._latest.pop(slot.key)
+            self._not_full.set()
+            try:
+                await self.handler(slot)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Sink '{self.name}' failed on {slot.type_name}: {e}")
+            self.processed += 1
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        await stop_task(task)
+
+    def stats(self):
+        return {
+            "depth": len(self._slots),
+            "maxsize": self.maxsize,
+            "peak_depth": self.peak_depth,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "errors": self.errors
+        }
+
+# Stage 1 (readers) -> frame queue -> stage 2 (decode) -> sink queues -> sinks
+_frame_queue = None
+_decode = None
+_decode_task = None
+_sinks = []
+_frames_received = 0
+_decode_errors = 0
+
+def register_sink(name, handler, accepts=None, maxsize=None, policies=None, default_policy=DEFAULT_POLICY,
+                  primary_only=False, source_only=False):
+    """Adds a sink to the fan-out. Must be called before start_pipeline()."""
+    sink = SinkQueue(name, handler, accepts=accepts, maxsize=maxsize, policies=policies,
+                     default_policy=default_policy, primary_only=primary_only, source_only=source_only)
+    _sinks.append(sink)
+    return sink
+
+async def start_pipeline(decode):
+    """
+    Starts the decode stage and one worker per registered sink.
+
+    Args:
+        decode: Coroutine function called as decode(frame, source) for every raw frame
+    """
+    global _frame_queue, _decode, _decode_task
+    _frame_queue = asyncio.Queue(maxsize=config.INGEST_FRAME_QUEUE_MAXSIZE)
+    _decode = decode
+    _decode_task = asyncio.create_task(_decode_loop())
+    for sink in _sinks:
+        sink.start()
+    logger.info(f"Ingest pipeline started with sinks: {', '.join(s.name for s in _sinks)}")
+
+async def stop_pipeline():
+    global _decode_task
+    task, _decode_task = _decode_task, None
+    await stop_task(task)
+    for sink in _sinks:
+        await sink.stop()
+    _sinks.clear()
+
+async def submit_frame(frame, source=None):
+    """
+    Called by websocket readers; waits only when the decode stage is saturated.
+
+    Args:
+        frame: The raw frame
+        source: The connection it arrived on, passed on to the decoder
+    """
+    global _frames_received
+    _frames_received += 1
+    await _frame_queue.put((frame, source))
+
+async def dispatch(envelope):
+    """Fans an event envelope out to every sink queue."""
+    for sink in _sinks:
+        await sink.offer(envelope)
+
+async def _decode_loop():
+    global _decode_errors
+    while not stopping():
+        frame, source = await _frame_queue.get()
+        try:
+            await _decode(frame, source)
+        except Exception as e:
+            _decode_errors += 1
+            logger.error(f"Error processing message: {e}")
+
+def get_pipeline_stats():
+    """Queue depths and drop counts for every stage."""
+    return {
+        "frames": {
+            "depth": _frame_queue.qsize() if _frame_queue is not None else 0,
+            "maxsize": config.INGEST_FRAME_QUEUE_MAXSIZE,
+            "received": _frames_received,
+            "decode_errors": _decode_errors
+        },
+        "sinks": {sink.name: sink.stats() for sink in _sinks}
+    }
+
+def _queue_depths():
+    depths = {('frames',): _frame_queue.qsize() if _frame_queue is not None else 0}
+    for sink in _sinks:
+        depths[(sink.name,)] = len(sink._slots)
+    return depths
+
+def _sink_events():
+    return {(sink.name, outcome): getattr(sink, outcome)
+            for sink in _sinks for outcome in ('processed', 'dropped', 'coalesced', 'errors')}
+
+# Read from the queues at scrape time, so they cost nothing per event
+metrics.Collected('apex_ingest_frames_total', 'Raw frames received from game clients', (),
+                  lambda: {(): _frames_received}, kind='counter')
+metrics.Collected('apex_ingest_queue_depth', 'Events waiting in each ingest queue', ('queue',), _queue_depths)
+metrics.Collected('apex_ingest_sink_events_total', 'Events handled by each sink, by outcome', ('sink', 'outcome'),
+                  _sink_events, kind='counter')
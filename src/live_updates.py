@@ -0,0 +1,141 @@
+# live_updates.py
+import asyncio
+import logging
+import orjson
+import config
+from background_tasks import stop_task, stopping
+
+logger = logging.getLogger('websocket_server')
+
+# Topics pushed to dashboards; each new subscriber first gets the latest value of every topic
+STATUS = 'status'
+LOBBY = 'lobby'
+SETTINGS = 'settings'
+LEGEND_BANS = 'legendBans'
+
+# Game results that map straight onto a topic
+RESULT_TOPICS = {
+    'rtech.liveapi.CustomMatch_LobbyPlayers': LOBBY,
+    'rtech.liveapi.CustomMatch_SetSettings': SETTINGS,
+    'rtech.liveapi.CustomMatch_LegendBanStatus': LEGEND_BANS,
+}
+
+class Subscriber:
+    """
+    One connected dashboard.
+
+    Only the latest event per topic is kept while the client is busy, so a
+    slow viewer costs at most one pending event per topic and never delays
+    the others.
+    """
+    __slots__ = ('pending', 'ready', 'closed')
+
+    def __init__(self):
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def push(self, topic, frame):
+        self.pending[topic] = frame
+        self.ready.set()
+
+    async def next_frames(self, timeout):
+        """Waits for pending events; returns their encoded frames, or [] on timeout."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        frames = list(self.pending.values())
+        self.pending.clear()
+        return frames
+
+_subscribers = set()
+_latest = {}
+_status_task = None
+_status_wakeup = None
+_events_published = 0
+
+def encode(topic, payload):
+    """A Server-Sent Events frame; orjson escapes newlines, so data fits on one line."""
+    return b"event: " + topic.encode('utf-8') + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
+
+def publish(topic, payload):
+    """Sends payload to every dashboard. It is encoded once, however many are connected."""
+    global _events_published
+    frame = encode(topic, payload)
+    if _latest.get(topic) == frame:
+        return
+    _latest[topic] = frame
+    _events_published += 1
+    for subscriber in _subscribers:
+        subscriber.push(topic, frame)
+
+def publish_result(result_type, data):
+    """Pushes a game result (lobby, settings, bans) if a topic follows it."""
+    topic = RESULT_TOPICS.get(result_type)
+    if topic is None or not data:
+        return
+    publish(topic, {"settings": data} if topic == SETTINGS else data)
+
+def subscribe():
+    subscriber = Subscriber()
+    for topic, frame in _latest.items():
+        subscriber.push(topic, frame)
+    _subscribers.add(subscriber)
+    return subscriber
+
+def unsubscribe(subscriber):
+    _subscribers.discard(subscriber)
+
+async def live_updates_sink(envelope):
+    """Pipeline sink: push standalone lobby and ban results."""
+    publish_result(envelope.type_name, envelope.data)
+
+async def _status_loop(build_status):
+    # One status computation per interval for all viewers, pushed only when it changed
+    while not stopping():
+        try:
+            status = await build_status()
+            status.pop('timestamp', None)
+            publish(STATUS, status)
+        except Exception as e:
+            logger.error(f"Error building live status: {e}")
+        try:
+            await asyncio.wait_for(_status_wakeup.wait(), config.LIVE_STATUS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _status_wakeup.clear()
+
+def refresh_status():
+    """Recomputes the status right away, e.g. when a game client connects or leaves."""
+    if _status_wakeup is not None:
+        _status_wakeup.set()
+
+def start_status_feed(build_status):
+    """
+    Starts pushing the server status.
+
+    Args:
+        build_status: Coroutine function returning the health-check dict
+    """
+    global _status_task, _status_wakeup
+    _status_wakeup = asyncio.Event()
+    _status_task = asyncio.create_task(_status_loop(build_status))
+
+async def stop_live_updates():
+    """Stops the status feed and ends every open stream."""
+    global _status_task
+    task, _status_task = _status_task, None
+    await stop_task(task)
+    for subscriber in _subscribers:
+        subscriber.closed = True
+        subscriber.ready.set()
+    _subscribers.clear()
+
+def get_live_update_stats():
+    return {
+        "subscribers": len(_subscribers),
+        "events_published": _events_published,
+        "topics": sorted(_latest)
+    }
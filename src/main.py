@@ -15,26 +15,44 @@ import api_routes
 import websockets
 import websocket_server
 import data_store # Import data_store to initialize Redis
+import pubsub_manager
+import ingest_pipeline
+import ring
+import live_updates
+import overlay_subscriptions
+import health
+import command_scheduler
 
 logger = setup_logging()
 
 async def on_startup(app):
     """Signal handler for application startup."""
     logger.info("Application starting up...")
-    # Initialize the data_updated_event with the current event loop
-    # before initializing the Redis pool which might use it.
-    await data_store.init_data_store_event(asyncio.get_event_loop())
     await data_store.init_redis_pool() # Initialize Redis connection pool
+    await data_store.start_redis_writer()
+    await data_store.start_cache_invalidation_listener()
+    await pubsub_manager.start_publisher()
+    await websocket_server.start_ingest()
+    health.start_health_probe()
+    ring.start_ring_tracker()
+    live_updates.start_status_feed(api_routes.build_health_status)
+    overlay_subscriptions.start_overlay_hub()
 
 async def on_shutdown(app):
     """Signal handler for application shutdown."""
     logger.info("Application shutting down...")
-    if data_store.redis_pool:
-        await data_store.redis_pool.disconnect()
-        logger.info("Redis connection pool disconnected.")
+    await live_updates.stop_live_updates()
+    await overlay_subscriptions.stop_overlay_hub()
+    await command_scheduler.stop_schedulers()
+    await ring.stop_ring_tracker()
+    await health.stop_health_probe()
+    await ingest_pipeline.stop_pipeline()
+    await pubsub_manager.stop_publisher()
+    await data_store.stop_cache_invalidation_listener()
+    await data_store.close_redis()
 
 async def main_app():
-    app = web.Application()
+    app = web.Application(middlewares=[api_routes.metrics_middleware, api_routes.trace_middleware, api_routes.target_middleware])
 
     # Register startup and shutdown signals
     app.on_startup.append(on_startup)
@@ -53,6 +71,7 @@ async def main_app():
     app.router.add_post('/kick_player', api_routes.kick_player_request)
     app.router.add_post('/set_settings', api_routes.set_settings_request)
     app.router.add_post('/send_chat', api_routes.send_chat_request)
+    app.router.add_post('/batch', api_routes.batch_request)
     
     # Additional custom match routes
     app.router.add_get('/get_settings', api_routes.get_settings_request)
@@ -71,6 +90,35 @@ async def main_app():
     # Health check route
     app.router.add_get('/health-check', api_routes.health_check)
     app.router.add_get('/pubsub-status', api_routes.pubsub_status_request)
+    app.router.add_get('/pipeline-status', api_routes.pipeline_status_request)
+    app.router.add_get('/sessions', api_routes.sessions_request)
+    app.router.add_get('/cache-status', api_routes.cache_status_request)
+    app.router.add_get('/metrics', api_routes.metrics_request)
+    app.router.add_get('/debug/traces', api_routes.debug_traces_request)
+
+    # Match event history
+    app.router.add_get('/history/matches', api_routes.history_matches_request)
+    app.router.add_get('/history/{match_id}', api_routes.history_request)
+
+    # Live scoreboards
+    app.router.add_get('/scoreboard/players', api_routes.player_scoreboard_request)
+    app.router.add_get('/scoreboard/teams', api_routes.team_scoreboard_request)
+
+    # Live player positions
+    app.router.add_get('/positions', api_routes.positions_request)
+    app.router.add_get('/positions/nearby', api_routes.nearby_players_request)
+    app.router.add_get('/positions/teams', api_routes.team_positions_request)
+    app.router.add_get('/positions/teams/{team_id}', api_routes.team_positions_request)
+    app.router.add_get('/positions/{nucleus_hash}/closest-enemy', api_routes.closest_enemy_request)
+    app.router.add_get('/ring', api_routes.ring_request)
+
+    # Dashboard push updates (Server-Sent Events)
+    app.router.add_get('/live', api_routes.live_updates_request)
+
+    # Combat analytics for the current match
+    app.router.add_get('/combat/weapons', api_routes.combat_weapons_request)
+    app.router.add_get('/combat/players', api_routes.combat_players_request)
+    app.router.add_get('/combat/timeline', api_routes.combat_timeline_request)
     app.router.add_post('/set_camera_position', api_routes.set_camera_position_request) # Added set_camera_position route
     
     # Setup static file serving
@@ -97,7 +145,7 @@ async def run_server():
 
     # Start WebSocket server, also listen on 0.0.0.0
     ws_server = await websockets.serve(
-        websocket_server.ws_handler,
+        websocket_server.route_connection,
         '0.0.0.0', 7777
     )
     logger.info("WebSocket server started on 0.0.0.0:7777")
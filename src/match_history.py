@@ -0,0 +1,156 @@
+# match_history.py
+import json
+import logging
+import re
+import time
+import config
+import session_registry
+from data_store import append_to_stream, get_redis_connection
+
+logger = logging.getLogger('websocket_server')
+
+TYPE_PREFIX = 'rtech.liveapi.'
+
+# Events that start a new history stream; Init only when the session isn't recording yet,
+# as an observer joining or reconnecting mid-match sends one too
+MATCH_START_TYPES = {'rtech.liveapi.Init', 'rtech.liveapi.MatchSetup'}
+
+# Sorted set of match id -> start time (ms), used to list and cap matches
+MATCH_INDEX_KEY = f"{config.HISTORY_KEY_PREFIX}:matches"
+
+# Upper bound on XRANGE pages scanned per request when filtering by type
+MAX_SCAN_PAGES = 10
+
+# A stream id, or a ms timestamp standing for the ids of that millisecond
+STREAM_ID = re.compile(r'\d+(-\d+)?')
+
+# Game session id -> the match its events are being recorded under
+current_matches = {}
+
+def stream_key(match_id):
+    return f"{config.HISTORY_KEY_PREFIX}:{match_id}"
+
+def match_id_for(envelope):
+    """Builds a match id from a MatchSetup or Init message; ids other than server ids are prefixed with their session."""
+    message = envelope.message
+    if envelope.type_name == 'rtech.liveapi.MatchSetup' and message.serverId:
+        return f"{message.serverId}-{message.timestamp}"
+    return _in_session(f"{envelope.type_name[len(TYPE_PREFIX):].lower()}-{message.timestamp or int(time.time())}",
+                       envelope.session)
+
+def _in_session(match_id, session):
+    if session is None or session == session_registry.DEFAULT_SESSION:
+        return match_id
+    return f"{session}-{match_id}"
+
+async def _prune_expired(r):
+    """Removes index entries whose stream has expired; matches still being recorded may not have a stream yet."""
+    recording = set(current_matches.values())
+    members = [m for m in await r.zrange(MATCH_INDEX_KEY, 0, -1) if m.decode('utf-8') not in recording]
+    if not members:
+        return
+    async with r.pipeline(transaction=False) as pipe:
+        for m in members:
+            pipe.exists(stream_key(m.decode('utf-8')))
+        exists = await pipe.execute()
+    expired = [m for m, found in zip(members, exists) if not found]
+    if expired:
+        await r.zrem(MATCH_INDEX_KEY, *expired)
+        logger.info(f"Removed {len(expired)} expired matches from the history index")
+
+async def start_match(match_id, session=None):
+    """Makes match_id the session's current stream and drops expired streams and those beyond the configured cap."""
+    current_matches[session or session_registry.DEFAULT_SESSION] = match_id
+    try:
+        r = await get_redis_connection()
+        await r.zadd(MATCH_INDEX_KEY, {match_id: int(time.time() * 1000)}, nx=True)
+        await _prune_expired(r)
+        excess = await r.zcard(MATCH_INDEX_KEY) - config.HISTORY_MAX_MATCHES
+        if excess > 0:
+            expired = await r.zrange(MATCH_INDEX_KEY, 0, excess - 1)
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.delete(*[stream_key(m.decode('utf-8')) for m in expired])
+                pipe.zrem(MATCH_INDEX_KEY, *expired)
+                await pipe.execute()
+            logger.info(f"Dropped history for {len(expired)} old matches")
+    except Exception as e:
+        logger.error(f"Error registering match {match_id} in history index: {e}")
+    logger.info(f"Recording event history for match {match_id}")
+
+async def history_sink(envelope):
+    """Pipeline sink: append every event to the current match's stream of its session."""
+    session = envelope.session or session_registry.DEFAULT_SESSION
+    if envelope.type_name == 'rtech.liveapi.MatchSetup' or (
+            envelope.type_name in MATCH_START_TYPES and session not in current_matches):
+        await start_match(match_id_for(envelope), session)
+    elif session not in current_matches:
+        await start_match(_in_session(f"unknown-{int(time.time())}", session), session)
+    if not envelope.data:
+        return
+    match_id = current_matches[session]
+    await append_to_stream(stream_key(match_id), {"type": envelope.type_name, "data": envelope.json_bytes},
+                           config.HISTORY_STREAM_MAXLEN, ttl=config.HISTORY_TTL_SECONDS)
+
+async def list_matches():
+    """Recorded matches, newest first."""
+    r = await get_redis_connection()
+    await _prune_expired(r)
+    entries = await r.zrevrange(MATCH_INDEX_KEY, 0, -1, withscores=True)
+    return [{"match_id": m.decode('utf-8'), "started": int(score)} for m, score in entries]
+
+async def get_history(match_id, start='-', end='+', event_type=None, count=100, cursor=None):
+    """
+    Pages through a match's events with XRANGE.
+
+    Args:
+        match_id: Match to read, or 'current' for the current session's (see session_registry.current())
+        start: Start of the range, a stream id or ms timestamp ('-' for the beginning)
+        end: End of the range, a stream id or ms timestamp ('+' for the end)
+        event_type: Optional type filter, with or without the 'rtech.liveapi.' prefix
+        count: Maximum number of events to return
+        cursor: next_cursor from a previous page
+
+    Returns:
+        dict: {"match_id", "events": [{"id", "type", "data"}], "next_cursor"}
+
+    Raises:
+        ValueError: If start, end or cursor isn't a stream id or ms timestamp
+    """
+    cursor = cursor or None
+    for name, value, open_end in (('start', start, '-'), ('end', end, '+'), ('cursor', cursor, None)):
+        if value is not None and value != open_end and not STREAM_ID.fullmatch(value):
+            raise ValueError(f"{name} must be a stream id or ms timestamp")
+    if match_id == 'current':
+        match_id = current_matches.get(session_registry.current())
+    if match_id is None:
+        return {"match_id": None, "events": [], "next_cursor": None}
+    if event_type and not event_type.startswith(TYPE_PREFIX):
+        event_type = TYPE_PREFIX + event_type
+    wanted = event_type.encode('utf-8') if event_type else None
+
+    r = await get_redis_connection()
+    key = stream_key(match_id)
+    low = f"({cursor}" if cursor else start
+    events = []
+    scanned_id = None
+    exhausted = False
+    for _ in range(MAX_SCAN_PAGES):
+        entries = await r.xrange(key, min=low, max=end, count=count)
+        for entry_id, fields in entries:
+            scanned_id = entry_id.decode('utf-8')
+            if wanted is None or fields[b'type'] == wanted:
+                events.append({
+                    "id": scanned_id,
+                    "type": fields[b'type'].decode('utf-8'),
+                    "data": json.loads(fields[b'data'])
+                })
+                if len(events) == count:
+                    break
+        if len(events) == count:
+            break
+        if len(entries) < count:
+            exhausted = True
+            break
+        # A filtered page came up short: keep scanning after the last id we looked at
+        low = f"({scanned_id}"
+    return {"match_id": match_id, "events": events, "next_cursor": None if exhausted else scanned_id}
@@ -0,0 +1,275 @@
+# match_state.py
+import logging
+import orjson
+from models import registry
+from roster import roster
+
+logger = logging.getLogger('websocket_server')
+
+class PlayerStats:
+    """Running totals for one player; identity strings live on the shared models.Player."""
+    __slots__ = ('player', 'team_id', 'kills', 'knocks', 'assists', 'deaths', 'damage_dealt',
+                 'damage_taken', 'revives', 'respawns', 'alive', 'downed')
+
+    def __init__(self, player):
+        self.player = player
+        self.team_id = 0
+        self.kills = 0
+        self.knocks = 0
+        self.assists = 0
+        self.deaths = 0
+        self.damage_dealt = 0
+        self.damage_taken = 0
+        self.revives = 0
+        self.respawns = 0
+        self.alive = True
+        self.downed = False
+
+    @property
+    def nucleus_hash(self):
+        return self.player.nucleus_hash
+
+    def to_dict(self):
+        player = self.player
+        return {
+            "nucleusHash": player.nucleus_hash,
+            "name": player.name,
+            "teamId": self.team_id,
+            "teamName": player.team_name,
+            "character": player.character,
+            "kills": self.kills,
+            "knocks": self.knocks,
+            "assists": self.assists,
+            "deaths": self.deaths,
+            "damageDealt": self.damage_dealt,
+            "damageTaken": self.damage_taken,
+            "revives": self.revives,
+            "respawns": self.respawns,
+            "alive": self.alive,
+            "downed": self.downed
+        }
+
+class TeamStats:
+    """Running totals for one team, updated alongside its players."""
+    __slots__ = ('team_id', 'name', 'players', 'kills', 'knocks', 'assists', 'damage_dealt',
+                 'alive_players', 'eliminated', 'placement')
+
+    def __init__(self, team_id):
+        self.team_id = team_id
+        self.name = ''
+        self.players = set()
+        self.kills = 0
+        self.knocks = 0
+        self.assists = 0
+        self.damage_dealt = 0
+        self.alive_players = 0
+        self.eliminated = False
+        self.placement = None
+
+    def to_dict(self):
+        return {
+            "teamId": self.team_id,
+            "name": self.name,
+            "players": sorted(self.players),
+            "kills": self.kills,
+            "knocks": self.knocks,
+            "assists": self.assists,
+            "damageDealt": self.damage_dealt,
+            "alivePlayers": self.alive_players,
+            "eliminated": self.eliminated,
+            "placement": self.placement
+        }
+
+class MatchState:
+    """
+    Live scoreboards built incrementally from the event stream.
+
+    Every apply() is O(1) in the number of players (SquadEliminated and
+    PlayerRespawnTeam are O(squad size)). Scoreboard JSON is rendered on the
+    first read after a change and reused until the next change.
+    """
+
+    def __init__(self):
+        self._version = 0
+        self.reset()
+        self._handlers = {
+            'rtech.liveapi.MatchSetup': self._on_match_setup,
+            'rtech.liveapi.MatchStateEnd': self._on_match_end,
+            'rtech.liveapi.PlayerKilled': self._on_killed,
+            'rtech.liveapi.PlayerDamaged': self._on_damaged,
+            'rtech.liveapi.PlayerDowned': self._on_downed,
+            'rtech.liveapi.PlayerAssist': self._on_assist,
+            'rtech.liveapi.SquadEliminated': self._on_squad_eliminated,
+            'rtech.liveapi.PlayerRespawnTeam': self._on_respawn_team,
+            'rtech.liveapi.PlayerRevive': self._on_revive,
+        }
+
+    def reset(self, match_info=None, team_count=0):
+        self.match_info = match_info or {}
+        self.players = {}
+        self.teams = {}
+        # Teams in the match as the lobby saw them at MatchSetup; teams seen in events count too
+        self.team_count = team_count
+        self.eliminated_teams = 0
+        self.frozen = False
+        self.events_applied = 0
+        self._version += 1
+        self._rendered = {}
+
+    @property
+    def version(self):
+        """Bumped on every change, including resets."""
+        return self._version
+
+    @property
+    def event_types(self):
+        return set(self._handlers)
+
+    def apply(self, type_name, message):
+        """Updates the state from one decoded event."""
+        handler = self._handlers.get(type_name)
+        if handler is None:
+            return
+        if self.frozen and type_name != 'rtech.liveapi.MatchSetup':
+            return
+        handler(message)
+        self.events_applied += 1
+        self._version += 1
+
+    def _player(self, player):
+        """Returns the stats for a Player message, registering it on first sight."""
+        key = player.nucleusHash or player.name
+        stats = self.players.get(key)
+        if stats is None:
+            stats = PlayerStats(registry.from_message(player))
+            self.players[key] = stats
+            self._join_team(stats, player.teamId)
+        elif stats.team_id != player.teamId:
+            registry.from_message(player)
+            self._leave_team(stats)
+            self._join_team(stats, player.teamId)
+        return stats
+
+    def _join_team(self, stats, team_id):
+        stats.team_id = team_id
+        team = self.teams.get(team_id)
+        if team is None:
+            team = TeamStats(team_id)
+            self.teams[team_id] = team
+        if stats.player.team_name:
+            team.name = stats.player.team_name
+        team.players.add(stats.player.key)
+        if stats.alive:
+            team.alive_players += 1
+
+    def _leave_team(self, stats):
+        team = self.teams.get(stats.team_id)
+        if team is not None:
+            team.players.discard(stats.player.key)
+            if stats.alive:
+                team.alive_players -= 1
+
+    def _set_alive(self, stats, alive):
+        if stats.alive != alive:
+            stats.alive = alive
+            self.teams[stats.team_id].alive_players += 1 if alive else -1
+        stats.downed = False
+
+    def _on_match_setup(self, message):
+        # The shared player registry starts over with the match, as the trackers do
+        registry.reset()
+        self.reset({
+            "map": message.map,
+            "playlistName": message.playlistName,
+            "serverId": message.serverId,
+            "timestamp": message.timestamp
+        }, roster.playing_team_count())
+
+    def _on_match_end(self, message):
+        self.match_info["endState"] = message.state
+        self.frozen = True
+        logger.info(f"Match state frozen after {self.events_applied} events")
+
+    def _on_killed(self, message):
+        victim = self._player(message.victim)
+        victim.deaths += 1
+        self._set_alive(victim, False)
+        awarded = message.awardedTo if message.awardedTo.nucleusHash or message.awardedTo.name else message.attacker
+        if awarded.nucleusHash or awarded.name:
+            killer = self._player(awarded)
+            killer.kills += 1
+            self.teams[killer.team_id].kills += 1
+
+    def _on_damaged(self, message):
+        damage = message.damageInflicted
+        victim = self._player(message.victim)
+        victim.damage_taken += damage
+        if message.attacker.nucleusHash or message.attacker.name:
+            attacker = self._player(message.attacker)
+            attacker.damage_dealt += damage
+            self.teams[attacker.team_id].damage_dealt += damage
+
+    def _on_downed(self, message):
+        self._player(message.victim).downed = True
+        if message.attacker.nucleusHash or message.attacker.name:
+            attacker = self._player(message.attacker)
+            attacker.knocks += 1
+            self.teams[attacker.team_id].knocks += 1
+
+    def _on_assist(self, message):
+        assistant = self._player(message.assistant)
+        assistant.assists += 1
+        self.teams[assistant.team_id].assists += 1
+
+    def _on_squad_eliminated(self, message):
+        team = None
+        for player in message.players:
+            stats = self._player(player)
+            self._set_alive(stats, False)
+            team = self.teams[stats.team_id]
+        if team is not None and not team.eliminated:
+            # Teams that haven't produced an event yet are still in the match
+            team.placement = max(self.team_count, len(self.teams)) - self.eliminated_teams
+            self.eliminated_teams += 1
+            team.eliminated = True
+
+    def _on_respawn_team(self, message):
+        self._player(message.player).respawns += 1
+        for player in message.respawnedTeammates:
+            self._set_alive(self._player(player), True)
+
+    def _on_revive(self, message):
+        self._player(message.player).revives += 1
+        self._player(message.revived).downed = False
+
+    def _render(self, name, build):
+        cached = self._rendered.get(name)
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        body = orjson.dumps(build())
+        self._rendered[name] = (self._version, body)
+        return body
+
+    def player_scoreboard_json(self):
+        """Players ordered by kills then damage, as JSON bytes."""
+        return self._render('players', lambda: {
+            "match": self.match_info,
+            "frozen": self.frozen,
+            "players": [p.to_dict() for p in sorted(self.players.values(), key=lambda p: (-p.kills, -p.damage_dealt))]
+        })
+
+    def team_scoreboard_json(self):
+        """Alive teams by kills then damage, then eliminated teams by placement, as JSON bytes."""
+        return self._render('teams', lambda: {
+            "match": self.match_info,
+            "frozen": self.frozen,
+            "teams": [t.to_dict() for t in sorted(self.teams.values(),
+                                                  key=lambda t: (t.eliminated, t.placement or 0, -t.kills, -t.damage_dealt))]
+        })
+
+# The live match, fed by the ingest pipeline
+state = MatchState()
+
+async def match_state_sink(envelope):
+    """Pipeline sink: fold combat and lifecycle events into the live match state."""
+    state.apply(envelope.type_name, envelope.message)
@@ -0,0 +1,155 @@
+# metrics.py
+"""
+Process-wide metrics rendered in the Prometheus text format by /metrics.
+
+Modules create their metrics at import time. Recording is a plain attribute
+update on a child object: callers on hot paths look their labelled children
+up once (or preallocate them, e.g. one per event type) and keep them, so
+counting an event costs an add and observing a latency a bisect.
+"""
+from bisect import bisect_left
+
+# Upper bounds in seconds, from 50us to 2.5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Upper bounds for batch and pipeline sizes
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf; made cumulative only when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metric:
+    """A metric family: one child per combination of label values."""
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        if not self.labelnames:
+            self._default = self.labels()
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The child for these label values, created on first use. Keep it to skip the lookup next time."""
+        child = self.children.get(values)
+        if child is None:
+            child = self._new_child()
+            self.children[values] = child
+        return child
+
+    def remove(self, *values):
+        self.children.pop(values, None)
+
+    def _samples(self):
+        for values, child in list(self.children.items()):
+            yield self.name, _labels(self.labelnames, values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in self._samples())
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+    @property
+    def value(self):
+        return self._default.value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _samples(self):
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                yield self.name + '_bucket', _labels(self.labelnames, values, f'le="{_number(bound)}"'), cumulative
+            yield self.name + '_sum', _labels(self.labelnames, values), child.sum
+            yield self.name + '_count', _labels(self.labelnames, values), child.count
+
+class Collected(Metric):
+    """
+    Values read from existing state when /metrics is scraped, such as queue
+    depths, so nothing is recorded on the hot path at all.
+
+    Args:
+        collect: Function returning {label values tuple: value}
+        kind: 'gauge' or 'counter'
+    """
+
+    def __init__(self, name, help, labelnames=(), collect=None, kind='gauge'):
+        self.collect = collect
+        self.kind = kind
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return CounterChild()
+
+    def _samples(self):
+        for values, value in self.collect().items():
+            yield self.name, _labels(self.labelnames, values), value
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+# models.py
+import sys
+from collections import namedtuple
+
+def intern_str(value):
+    """Interns identity strings so every record of a player shares one copy."""
+    return sys.intern(value) if value else ''
+
+def player_key(nucleus_hash, name):
+    """Registry key of a player: the nucleusHash, or the name for players without one."""
+    return nucleus_hash or name
+
+class Player:
+    """
+    Identity of one player, shared by every part of the live state that refers to them.
+
+    key is what the live state indexes the player by (see player_key); it is
+    never reported as the nucleusHash, which stays empty when the game sent none.
+    """
+    __slots__ = ('key', 'nucleus_hash', 'name', 'hardware_name', 'team_id', 'team_name', 'character')
+
+    def __init__(self, nucleus_hash, name='', hardware_name='', team_id=0, team_name='', character=''):
+        self.key = player_key(nucleus_hash, name)
+        self.nucleus_hash = nucleus_hash
+        self.name = name
+        self.hardware_name = hardware_name
+        self.team_id = team_id
+        self.team_name = team_name
+        self.character = character
+
+    def to_dict(self):
+        return {
+            "nucleusHash": self.nucleus_hash,
+            "name": self.name,
+            "hardwareName": self.hardware_name,
+            "teamId": self.team_id,
+            "teamName": self.team_name,
+            "character": self.character
+        }
+
+class Team:
+    """A team id, its display name and its current members."""
+    __slots__ = ('team_id', 'name', 'players')
+
+    def __init__(self, team_id, name=''):
+        self.team_id = team_id
+        self.name = name
+        self.players = {}
+
+    def to_dict(self):
+        return {
+            "teamId": self.team_id,
+            "name": self.name,
+            "players": sorted(self.players)
+        }
+
+# One row of a CustomMatch_LobbyPlayers result
+LobbyPlayer = namedtuple('LobbyPlayer', ['name', 'team_id', 'nucleus_hash', 'hardware_name'])
+
+def lobby_player_to_dict(row):
+    return {"name": row.name, "teamId": row.team_id, "nucleusHash": row.nucleus_hash, "hardwareName": row.hardware_name}
+
+class PlayerRegistry:
+    """
+    One Player per nucleusHash (or name, for players without one) and one Team
+    per team id, built from protobuf Player messages and lobby rows. Cleared
+    on MatchSetup, like the trackers that use it.
+
+    Looking up a known player reads only the key, team and character fields
+    of the message; the other strings are copied and interned once.
+    """
+
+    def __init__(self):
+        self.players = {}
+        self.teams = {}
+
+    def __len__(self):
+        return len(self.players)
+
+    def reset(self):
+        self.players = {}
+        self.teams = {}
+
+    def get(self, key):
+        return self.players.get(key)
+
+    def team(self, team_id):
+        team = self.teams.get(team_id)
+        if team is None:
+            team = Team(team_id)
+            self.teams[team_id] = team
+        return team
+
+    def _move(self, player, team_id, team_name):
+        if player.team_id in self.teams:
+            self.teams[player.team_id].players.pop(player.key, None)
+        team = self.team(team_id)
+        if team_name:
+            team_name = intern_str(team_name)
+            team.name = team_name
+            player.team_name = team_name
+        else:
+            player.team_name = team.name
+        player.team_id = team_id
+        team.players[player.key] = player
+
+    def from_message(self, message):
+        """The Player for a protobuf Player message, registering or updating it."""
+        key = player_key(message.nucleusHash, message.name)
+        player = self.players.get(key)
+        if player is None:
+            player = Player(intern_str(message.nucleusHash), intern_str(message.name), intern_str(message.hardwareName),
+                            character=intern_str(message.character))
+            self.players[player.key] = player
+            self._move(player, message.teamId, message.teamName)
+            return player
+        if player.team_id != message.teamId:
+            self._move(player, message.teamId, message.teamName)
+        character = message.character
+        if character and character != player.character:
+            player.character = intern_str(character)
+        return player
+
+    def lobby_row(self, data):
+        """A LobbyPlayer row for one lobby player dict, registering the player as well."""
+        key = player_key(data.get('nucleusHash', ''), data.get('name', ''))
+        team_id = data.get('teamId', 0)
+        player = self.players.get(key)
+        if player is None:
+            player = Player(intern_str(data.get('nucleusHash', '')), intern_str(data.get('name', '')),
+                            intern_str(data.get('hardwareName', '')))
+            self.players[player.key] = player
+            self._move(player, team_id, '')
+        elif player.team_id != team_id:
+            self._move(player, team_id, '')
+        return LobbyPlayer(player.name, team_id, player.nucleus_hash, player.hardware_name)
+
+# Every player seen in the current match
+registry = PlayerRegistry()
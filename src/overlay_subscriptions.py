@@ -0,0 +1,353 @@
+# overlay_subscriptions.py
+"""
+Topic subscriptions for overlays and caster tools on ws://<host>:7777/subscribe.
+
+Client -> server (JSON text frames):
+    {"op": "subscribe", "topics": ["kills", "ring"], "players": ["<nucleusHash>"], "teams": [2, 3]}
+    {"op": "unsubscribe", "topics": ["ring"]}
+players/teams are optional filters; they replace the previous filters when given.
+The players and kills topics match either filter; teams only uses the teams filter.
+
+Server -> client:
+    {"op": "snapshot", "topic": "players", "seq": 12, "data": {...}}
+    {"op": "delta", "topic": "players", "seq": 13, "data": {"changed": {key: {field: value}}, "removed": [key]}}
+    {"op": "event", "topic": "kills", "data": {...}}
+    {"op": "error", "error": "..."}
+
+State topics (players, teams, ring, observer) start with a snapshot and then
+receive only the fields that changed. Event topics (kills) replay the recent
+events as their snapshot and then stream new ones.
+"""
+import asyncio
+import logging
+from collections import deque
+import orjson
+import websockets
+import config
+import match_state
+import ring
+
+logger = logging.getLogger('websocket_server')
+
+PLAYERS = 'players'
+TEAMS = 'teams'
+RING = 'ring'
+OBSERVER = 'observer'
+KILLS = 'kills'
+
+STATE_TOPICS = (PLAYERS, TEAMS, RING, OBSERVER)
+TOPICS = set(STATE_TOPICS) | {KILLS}
+
+SINK_TYPES = {
+    'rtech.liveapi.PlayerKilled',
+    'rtech.liveapi.PlayerDowned',
+    'rtech.liveapi.SquadEliminated',
+    'rtech.liveapi.ObserverSwitched',
+    'rtech.liveapi.MatchSetup',
+}
+
+# WebSocket close code sent to subscribers that fall too far behind
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+def _player_ref(player):
+    return {"nucleusHash": player.nucleusHash, "name": player.name, "teamId": player.teamId}
+
+def diff(previous, current):
+    """Shallow per-key field diff of two {key: {field: value}} dicts."""
+    changed = {}
+    for key, fields in current.items():
+        before = previous.get(key)
+        if before is None:
+            changed[key] = fields
+        elif before != fields:
+            changed[key] = {f: v for f, v in fields.items() if before.get(f) != v}
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+class Subscriber:
+    """One overlay connection: its topics, filters and bounded send buffer."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.topics = set()
+        self.players = None
+        self.teams = None
+        self.queue = asyncio.Queue(maxsize=config.OVERLAY_SEND_BUFFER)
+        self.slow = False
+        self.sent = 0
+
+    @property
+    def filter_key(self):
+        return (self.players, self.teams)
+
+    def wants(self, nucleus_hash, team_id):
+        if self.players is None and self.teams is None:
+            return True
+        return (self.players is not None and nucleus_hash in self.players) or \
+               (self.teams is not None and team_id in self.teams)
+
+    def offer(self, frame):
+        """Queues a frame without waiting; a full buffer marks the subscriber as too slow."""
+        if self.slow:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.slow = True
+            hub.slow_disconnects += 1
+            # Stop fanning out to it now; closing can take until the close timeout
+            hub.subscribers.discard(self)
+            logger.warning(f"Disconnecting slow overlay subscriber {self.websocket.remote_address}")
+            asyncio.create_task(self.websocket.close(SLOW_CONSUMER_CLOSE_CODE, "slow consumer"))
+
+    async def writer(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                # Text frames, so browser overlays get strings rather than Blobs
+                await self.websocket.send(frame, text=True)
+                self.sent += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+class OverlayHub:
+    """
+    Keeps the last published state of every state topic and fans snapshots,
+    deltas and events out to subscribers.
+
+    State is diffed once per tick for everyone; frames are encoded once per
+    distinct filter rather than once per subscriber.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.state = {topic: {} for topic in STATE_TOPICS}
+        self.seq = {topic: 0 for topic in STATE_TOPICS}
+        self.recent_kills = deque(maxlen=config.OVERLAY_RECENT_KILLS)
+        self._built_from = {}
+        self.slow_disconnects = 0
+        self.frames_encoded = 0
+
+    def _build(self, topic):
+        """Current {key: {field: value}} state of a scoreboard or ring topic."""
+        if topic == PLAYERS:
+            return {p.player.key: p.to_dict() for p in match_state.state.players.values()}
+        if topic == TEAMS:
+            return {str(t.team_id): t.to_dict() for t in match_state.state.teams.values()}
+        snapshot = ring.tracker.snapshot()
+        return {"ring": snapshot} if snapshot["stage"] is not None else {}
+
+    def _filtered(self, topic, subscriber, entries, previous=None):
+        if topic not in (PLAYERS, TEAMS) or (subscriber.players is None and subscriber.teams is None):
+            return entries
+        if topic == TEAMS:
+            if subscriber.teams is None:
+                return entries
+            return {key: fields for key, fields in entries.items() if int(key) in subscriber.teams}
+        full = self.state[topic]
+        kept = {}
+        for key, fields in entries.items():
+            ref = full.get(key) or (previous or {}).get(key) or fields
+            if subscriber.wants(ref.get("nucleusHash"), ref.get("teamId")):
+                kept[key] = fields
+        return kept
+
+    def _fan_out(self, topic, build_frame):
+        """Sends build_frame(subscriber) to every subscriber of topic, encoding once per filter."""
+        encoded = {}
+        # Copy: a subscriber that overflows removes itself while we iterate
+        for subscriber in list(self.subscribers):
+            if topic not in subscriber.topics:
+                continue
+            key = subscriber.filter_key
+            if key not in encoded:
+                message = build_frame(subscriber)
+                encoded[key] = orjson.dumps(message) if message is not None else None
+                self.frames_encoded += 1
+            if encoded[key] is not None:
+                subscriber.offer(encoded[key])
+
+    def snapshot(self, subscriber, topic):
+        if topic == KILLS:
+            events = [e for e in self.recent_kills if self._kill_wanted(subscriber, e)]
+            message = {"op": "snapshot", "topic": KILLS, "data": events}
+        else:
+            message = {"op": "snapshot", "topic": topic, "seq": self.seq[topic],
+                       "data": self._filtered(topic, subscriber, self.state[topic])}
+        subscriber.offer(orjson.dumps(message))
+
+    def tick(self, extra_topics=()):
+        """Diffs every state topic that has subscribers and sends the deltas."""
+        wanted = set(extra_topics)
+        for subscriber in self.subscribers:
+            wanted |= subscriber.topics
+        # The scoreboards only need rebuilding when the match state moved on
+        match_version = match_state.state.version
+        for topic in (PLAYERS, TEAMS, RING):
+            if topic not in wanted:
+                continue
+            if topic != RING:
+                if self._built_from.get(topic) == match_version:
+                    continue
+                self._built_from[topic] = match_version
+            self.publish_state(topic, self._build(topic))
+
+    def publish_state(self, topic, current):
+        previous = self.state[topic]
+        changed, removed = diff(previous, current)
+        if not changed and not removed:
+            return
+        self.state[topic] = current
+        self.seq[topic] += 1
+        seq = self.seq[topic]
+
+        def build(subscriber):
+            sub_changed = self._filtered(topic, subscriber, changed)
+            sub_removed = [k for k in removed if self._filtered(topic, subscriber, {k: previous[k]}, previous)]
+            if not sub_changed and not sub_removed:
+                return None
+            return {"op": "delta", "topic": topic, "seq": seq, "data": {"changed": sub_changed, "removed": sub_removed}}
+
+        self._fan_out(topic, build)
+
+    def _kill_wanted(self, subscriber, event):
+        involved = event.get("players") or (event["attacker"], event["victim"])
+        return any(subscriber.wants(p["nucleusHash"], p["teamId"]) for p in involved)
+
+    def publish_kill(self, event):
+        self.recent_kills.append(event)
+
+        def build(subscriber):
+            if not self._kill_wanted(subscriber, event):
+                return None
+            return {"op": "event", "topic": KILLS, "data": event}
+
+        self._fan_out(KILLS, build)
+
+    def reset(self):
+        self.recent_kills.clear()
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "slow_disconnects": self.slow_disconnects,
+            "frames_encoded": self.frames_encoded,
+            "max_buffered": max((s.queue.qsize() for s in self.subscribers), default=0)
+        }
+
+hub = OverlayHub()
+_tick_task = None
+
+async def overlay_sink(envelope):
+    """Pipeline sink: kill feed and spectator changes for overlays."""
+    type_name = envelope.type_name
+    message = envelope.message
+    if type_name == 'rtech.liveapi.MatchSetup':
+        hub.reset()
+    elif type_name == 'rtech.liveapi.ObserverSwitched':
+        target = message.target
+        hub.publish_state(OBSERVER, {"observer": {
+            "observer": message.observer.name,
+            "target": _player_ref(target) if target.nucleusHash or target.name else None
+        }})
+    elif type_name == 'rtech.liveapi.SquadEliminated':
+        players = [_player_ref(p) for p in message.players]
+        hub.publish_kill({"type": "SquadEliminated", "timestamp": message.timestamp, "players": players})
+    else:
+        hub.publish_kill({
+            "type": type_name[len('rtech.liveapi.'):],
+            "timestamp": message.timestamp,
+            "weapon": message.weapon,
+            "attacker": _player_ref(message.attacker),
+            "victim": _player_ref(message.victim)
+        })
+
+async def _tick_loop():
+    while True:
+        await asyncio.sleep(config.OVERLAY_TICK_INTERVAL)
+        try:
+            if hub.subscribers:
+                hub.tick()
+        except Exception as e:
+            logger.error(f"Error publishing overlay deltas: {e}")
+
+def start_overlay_hub():
+    global _tick_task
+    _tick_task = asyncio.create_task(_tick_loop())
+
+async def stop_overlay_hub():
+    global _tick_task
+    if _tick_task is not None:
+        _tick_task.cancel()
+        _tick_task = None
+
+def _team_ids(teams):
+    """The teams filter as ints, accepting numeric strings; None if an entry isn't a team id."""
+    ids = set()
+    for team in teams:
+        if isinstance(team, bool):
+            return None
+        if isinstance(team, str) and team.strip().isdigit():
+            team = int(team)
+        if not isinstance(team, int):
+            return None
+        ids.add(team)
+    return frozenset(ids)
+
+def _apply_request(subscriber, request):
+    """Handles one subscribe/unsubscribe message; returns an error string or None."""
+    op = request.get('op')
+    topics = request.get('topics', [])
+    if op not in ('subscribe', 'unsubscribe') or not isinstance(topics, list) or \
+            not all(isinstance(t, str) for t in topics):
+        return "expected {\"op\": \"subscribe\" | \"unsubscribe\", \"topics\": [...]}"
+    unknown = [t for t in topics if t not in TOPICS]
+    if unknown:
+        return f"unknown topics {unknown}; available: {sorted(TOPICS)}"
+    if op == 'unsubscribe':
+        subscriber.topics.difference_update(topics)
+        return None
+    players = subscriber.players
+    if 'players' in request:
+        players = request['players']
+        if players is not None:
+            if not isinstance(players, list) or not all(isinstance(p, str) for p in players):
+                return "players must be a list of nucleus hashes"
+            players = frozenset(players)
+    teams = subscriber.teams
+    if 'teams' in request:
+        teams = request['teams']
+        if teams is not None:
+            teams = _team_ids(teams) if isinstance(teams, list) else None
+            if teams is None:
+                return "teams must be a list of team ids"
+    subscriber.players = players
+    subscriber.teams = teams
+    # Bring the state up to date first so the snapshot is current
+    hub.tick(topics)
+    for topic in topics:
+        subscriber.topics.add(topic)
+        hub.snapshot(subscriber, topic)
+    return None
+
+async def handle_subscriber(websocket):
+    """Serves one overlay connection until it closes or falls too far behind."""
+    subscriber = Subscriber(websocket)
+    hub.subscribers.add(subscriber)
+    writer = asyncio.create_task(subscriber.writer())
+    logger.info(f"Overlay subscriber connected from {websocket.remote_address}")
+    try:
+        async for message in websocket:
+            try:
+                request = orjson.loads(message)
+                error = _apply_request(subscriber, request) if isinstance(request, dict) else "expected a JSON object"
+            except orjson.JSONDecodeError:
+                error = "invalid JSON"
+            if error:
+                subscriber.offer(orjson.dumps({"op": "error", "error": error}))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        hub.subscribers.discard(subscriber)
+        writer.cancel()
+        logger.info(f"Overlay subscriber disconnected ({subscriber.sent} frames sent)")
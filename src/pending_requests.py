@@ -0,0 +1,73 @@
+# pending_requests.py
+import asyncio
+import logging
+import session_registry
+
+logger = logging.getLogger('websocket_server')
+
+class _Pending:
+    """A request in flight and how many callers are waiting on it."""
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+# (game session, expected result type) -> the request every caller waiting on it shares
+_in_flight = {}
+
+async def request(expected_type, send, timeout=5):
+    """
+    Sends a request and waits for the message type it produces.
+
+    Concurrent callers expecting the same type from the same game session
+    (the current one, see session_registry.current()) share one in-flight
+    request: only the first one calls send(), the others just wait on its
+    future. It stays in flight until it is resolved or the last caller
+    waiting on it gives up, whichever caller that is.
+
+    Args:
+        expected_type: Fully qualified type name of the result, e.g.
+            'rtech.liveapi.CustomMatch_LobbyPlayers'
+        send: Callable that builds and sends the request to the game
+        timeout: Seconds this caller is willing to wait
+
+    Returns:
+        dict: The result as a dict, or None on timeout
+    """
+    key = (session_registry.current(), expected_type)
+    pending = _in_flight.get(key)
+    owner = pending is None
+    if owner:
+        pending = _Pending(asyncio.get_running_loop().create_future())
+        _in_flight[key] = pending
+    pending.waiters += 1
+    try:
+        if owner:
+            send()
+        return await asyncio.wait_for(asyncio.shield(pending.future), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Timed out after {timeout}s waiting for {expected_type}")
+        return None
+    finally:
+        # Once nobody waits on it, let the next caller send a fresh request instead of joining a lost one
+        pending.waiters -= 1
+        if not pending.waiters and _in_flight.get(key) is pending:
+            del _in_flight[key]
+
+def is_waiting(expected_type, session):
+    return (session, expected_type) in _in_flight
+
+def resolve(result_type, result, session):
+    """
+    Completes the in-flight request waiting for result_type from session, if any.
+
+    Args:
+        result_type: Fully qualified type name of the message that arrived
+        result: The message as a dict
+        session: Id of the game session it came from
+    """
+    pending = _in_flight.pop((session, result_type), None)
+    if pending is not None and not pending.future.done():
+        pending.future.set_result(result)
+        logger.debug(f"Resolved pending request for {result_type}")
@@ -0,0 +1,238 @@
+# positions.py
+import logging
+import numpy as np
+from google.protobuf.descriptor import FieldDescriptor
+
+import events_pb2
+from models import registry
+
+logger = logging.getLogger('websocket_server')
+
+PLAYER_TYPE = 'rtech.liveapi.Player'
+
+# Player fields whose position isn't a player in the match (the observer is the camera)
+IGNORED_FIELDS = {('rtech.liveapi.ObserverSwitched', 'observer')}
+
+def _player_fields():
+    """Message type -> [(field name, repeated)] for every field holding a Player."""
+    fields = {}
+    for descriptor in events_pb2.DESCRIPTOR.message_types_by_name.values():
+        found = [(f.name, f.label == FieldDescriptor.LABEL_REPEATED) for f in descriptor.fields
+                 if f.message_type is not None and f.message_type.full_name == PLAYER_TYPE
+                 and (descriptor.full_name, f.name) not in IGNORED_FIELDS]
+        if found:
+            fields[descriptor.full_name] = found
+    return fields
+
+PLAYER_FIELDS = _player_fields()
+
+class PositionTable:
+    """
+    Latest position, view angles and health of every player, one row each in
+    contiguous NumPy arrays.
+
+    Rows are assigned on first sight and reused for the rest of the match.
+    Updates write through flat memoryviews of the arrays, which is about half
+    the cost of NumPy item assignment. Queries are vectorised over the
+    occupied rows; with a lobby-sized table (60 rows) that takes tens of
+    microseconds, cheaper than maintaining a grid or KD-tree on every move.
+    """
+
+    ARRAYS = ('pos', 'angles', 'team', 'health', 'alive', 'timestamp')
+
+    def __init__(self, capacity=64):
+        self._capacity = capacity
+        self.reset()
+
+    def reset(self):
+        capacity = self._capacity
+        self.rows = {}
+        self.hashes = []
+        self.players = []
+        self.pos = np.zeros((capacity, 3))
+        self.angles = np.zeros((capacity, 3))
+        self.team = np.zeros(capacity, dtype=np.int32)
+        self.health = np.zeros(capacity, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.timestamp = np.zeros(capacity, dtype=np.uint64)
+        self._make_views()
+        self.updates = 0
+
+    def _make_views(self):
+        self._pos = memoryview(self.pos).cast('B').cast('d')
+        self._angles = memoryview(self.angles).cast('B').cast('d')
+        self._team = memoryview(self.team)
+        self._health = memoryview(self.health)
+        self._timestamp = memoryview(self.timestamp)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _grow(self):
+        self._capacity *= 2
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((self._capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self._make_views()
+
+    def _row(self, key, player):
+        """Assigns the next free row to a newly seen player."""
+        row = len(self.hashes)
+        if row == len(self.pos):
+            self._grow()
+        self.rows[key] = row
+        self.hashes.append(key)
+        self.players.append(registry.from_message(player))
+        self.alive[row] = True
+        return row
+
+    def update(self, player, timestamp=0):
+        """Records the state carried by one Player message."""
+        key = player.nucleusHash or player.name
+        if not key:
+            return None
+        row = self.rows.get(key)
+        if row is None:
+            row = self._row(key, player)
+        i = row * 3
+        pos, angles, pos_view, angles_view = player.pos, player.angles, self._pos, self._angles
+        pos_view[i] = pos.x
+        pos_view[i + 1] = pos.y
+        pos_view[i + 2] = pos.z
+        angles_view[i] = angles.x
+        angles_view[i + 1] = angles.y
+        angles_view[i + 2] = angles.z
+        self._team[row] = player.teamId
+        self._health[row] = player.currentHealth
+        self._timestamp[row] = timestamp
+        self.updates += 1
+        return row
+
+    def set_alive(self, player, alive):
+        row = self.rows.get(player.nucleusHash or player.name)
+        if row is not None:
+            self.alive[row] = alive
+            self.updates += 1
+
+    def _entry(self, row, distance=None):
+        entry = {
+            "nucleusHash": self.players[row].nucleus_hash,
+            "name": self.players[row].name,
+            "teamId": int(self.team[row]),
+            "pos": self.pos[row].tolist(),
+            "angles": self.angles[row].tolist(),
+            "currentHealth": int(self.health[row]),
+            "alive": bool(self.alive[row])
+        }
+        if distance is not None:
+            entry["distance"] = float(distance)
+        return entry
+
+    def get(self, nucleus_hash):
+        row = self.rows.get(nucleus_hash)
+        return None if row is None else self._entry(row)
+
+    def _distances(self, point):
+        n = len(self.hashes)
+        delta = self.pos[:n] - np.asarray(point, dtype=float)
+        return np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+    def within(self, point, radius, team_id=None, alive_only=True):
+        """Players within radius of point, nearest first."""
+        n = len(self.hashes)
+        distances = self._distances(point)
+        mask = distances <= radius
+        if alive_only:
+            mask &= self.alive[:n]
+        if team_id is not None:
+            mask &= self.team[:n] == team_id
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(distances[rows], kind='stable')]
+        return [self._entry(row, distances[row]) for row in rows]
+
+    def closest_enemy(self, nucleus_hash):
+        """The nearest alive player on another team, or None."""
+        row = self.rows.get(nucleus_hash)
+        if row is None:
+            return None
+        n = len(self.hashes)
+        distances = self._distances(self.pos[row])
+        distances[~(self.alive[:n] & (self.team[:n] != self.team[row]))] = np.inf
+        nearest = int(np.argmin(distances)) if n else 0
+        if not n or np.isinf(distances[nearest]):
+            return None
+        return self._entry(nearest, distances[nearest])
+
+    def team_spread(self, team_id, alive_only=True):
+        """Centroid of a team's players and how far they are spread around it."""
+        n = len(self.hashes)
+        mask = self.team[:n] == team_id
+        if alive_only:
+            mask &= self.alive[:n]
+        points = self.pos[:n][mask]
+        if not len(points):
+            return None
+        centroid = points.mean(axis=0)
+        offsets = np.linalg.norm(points - centroid, axis=1)
+        return {
+            "teamId": team_id,
+            "players": int(len(points)),
+            "centroid": centroid.tolist(),
+            "spread": float(np.sqrt(np.mean(offsets ** 2))),
+            "maxDistance": float(offsets.max())
+        }
+
+    def team_spreads(self, alive_only=True):
+        """team_spread() for every team with at least one player counted, in one pass."""
+        n = len(self.hashes)
+        mask = self.alive[:n] if alive_only else np.ones(n, dtype=bool)
+        points = self.pos[:n][mask]
+        if not len(points):
+            return []
+        teams, index, counts = np.unique(self.team[:n][mask], return_inverse=True, return_counts=True)
+        sums = np.zeros((len(teams), 3))
+        np.add.at(sums, index, points)
+        centroids = sums / counts[:, None]
+        offsets = np.linalg.norm(points - centroids[index], axis=1)
+        squared = np.bincount(index, weights=offsets ** 2, minlength=len(teams))
+        farthest = np.zeros(len(teams))
+        np.maximum.at(farthest, index, offsets)
+        spreads = np.sqrt(squared / counts)
+        return [{
+            "teamId": int(teams[t]),
+            "players": int(counts[t]),
+            "centroid": centroids[t].tolist(),
+            "spread": float(spreads[t]),
+            "maxDistance": float(farthest[t])
+        } for t in range(len(teams))]
+
+# Positions in the live match, fed by the ingest pipeline
+table = PositionTable()
+
+async def position_sink(envelope):
+    """Pipeline sink: record the position of every Player embedded in an event."""
+    type_name = envelope.type_name
+    if type_name == 'rtech.liveapi.MatchSetup':
+        table.reset()
+        return
+    message = envelope.message
+    timestamp = message.timestamp
+    for field, repeated in PLAYER_FIELDS[type_name]:
+        if repeated:
+            for player in getattr(message, field):
+                table.update(player, timestamp)
+        elif message.HasField(field):
+            table.update(getattr(message, field), timestamp)
+    if type_name == 'rtech.liveapi.PlayerKilled':
+        table.set_alive(message.victim, False)
+    elif type_name == 'rtech.liveapi.SquadEliminated':
+        for player in message.players:
+            table.set_alive(player, False)
+    elif type_name == 'rtech.liveapi.PlayerRespawnTeam':
+        for player in message.respawnedTeammates:
+            table.set_alive(player, True)
+
+# Everything position_sink reads
+SINK_TYPES = set(PLAYER_FIELDS) | {'rtech.liveapi.MatchSetup'}
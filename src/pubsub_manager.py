@@ -1,64 +1,200 @@
 # pubsub_manager.py
 import os
+import asyncio
+import threading
 from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1 import types
 import logging
 import config
+import metrics
 import time
+from functools import partial
 from datetime import datetime
 
 # Set the environment variable for Google Cloud credentials
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.path.dirname(__file__), "service_account.json")
 
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(config.PROJECT_ID, config.TOPIC_ID)
+# Created by start_publisher() so that importing this module never touches Google Cloud
+publisher = None
+topic_path = None
 
 logger = logging.getLogger('websocket_server')
 
+# Outgoing messages wait here until the publish loop hands them to the client
+_publish_queue = None
+_publisher_task = None
+
+# Completion callbacks run on the client's batching threads
+_counter_lock = threading.Lock()
+
 # Tracking variables for pubsub status
 _last_publish_time = None
-_total_messages_published = 0
-_publish_errors = 0
+_messages_in_flight = 0
+
+messages_published = metrics.Counter('apex_pubsub_published_total', 'Messages acknowledged by Pub/Sub')
+publish_errors = metrics.Counter('apex_pubsub_errors_total', 'Messages Pub/Sub failed to publish')
+messages_dropped = metrics.Counter('apex_pubsub_dropped_total', 'Messages dropped because the publish queue was full')
+publish_seconds = metrics.Histogram('apex_pubsub_publish_seconds', 'Time from handing a message to the client until Pub/Sub acks it')
+batch_size = metrics.Histogram('apex_pubsub_batch_size', 'Messages handed to the client per submission', buckets=metrics.SIZE_BUCKETS)
+metrics.Collected('apex_pubsub_queue_depth', 'Messages waiting in the publish queue', (),
+                  lambda: {(): _publish_queue.qsize() if _publish_queue is not None else 0})
+metrics.Collected('apex_pubsub_in_flight', 'Messages handed to the client and not acked yet', (),
+                  lambda: {(): _messages_in_flight})
 
-def publish_message(message):
-    global _last_publish_time, _total_messages_published, _publish_errors
-    
+def create_publisher():
+    """Creates a PublisherClient with batching and flow control from config."""
+    batch_settings = types.BatchSettings(
+        max_messages=config.PUBSUB_BATCH_MAX_MESSAGES,
+        max_bytes=config.PUBSUB_BATCH_MAX_BYTES,
+        max_latency=config.PUBSUB_BATCH_MAX_LATENCY,
+    )
+    flow_control = types.PublishFlowControl(
+        message_limit=config.PUBSUB_FLOW_CONTROL_MAX_MESSAGES,
+        byte_limit=config.PUBSUB_FLOW_CONTROL_MAX_BYTES,
+        limit_exceeded_behavior=types.LimitExceededBehavior.BLOCK,
+    )
+    return pubsub_v1.PublisherClient(
+        batch_settings=batch_settings,
+        publisher_options=types.PublisherOptions(flow_control=flow_control),
+    )
+
+async def start_publisher(client=None):
+    """
+    Starts the background publish loop.
+
+    Args:
+        client: Optional publisher to use instead of a real PublisherClient.
+            It must provide topic_path() and a non-blocking publish() returning a future.
+    """
+    global publisher, topic_path, _publish_queue, _publisher_task
     try:
-        data = message.encode("utf-8")
-        future = publisher.publish(topic_path, data=data)
-        message_id = future.result()
-        
-        _last_publish_time = time.time()
-        _total_messages_published += 1
-        
-        logger.info(f"Message published with ID {message_id}")
+        publisher = client or create_publisher()
+        topic_path = publisher.topic_path(config.PROJECT_ID, config.TOPIC_ID)
+    except Exception as e:
+        logger.error(f"Could not create Pub/Sub publisher, events will not be published: {e}")
+        publisher = None
+        return
+    _publish_queue = asyncio.Queue(maxsize=config.PUBSUB_QUEUE_MAXSIZE)
+    _publisher_task = asyncio.create_task(_publish_loop())
+    logger.info(f"Pub/Sub publisher started for {topic_path}")
+
+async def stop_publisher(timeout=5):
+    """Flushes queued messages to the client and stops the publish loop."""
+    global _publisher_task
+    if _publisher_task is None:
+        return
+    try:
+        await asyncio.wait_for(_publish_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Pub/Sub queue not drained on shutdown, {_publish_queue.qsize()} messages discarded")
+    _publisher_task.cancel()
+    _publisher_task = None
+    if hasattr(publisher, 'stop'):
+        # stop() commits pending batches and waits for them
+        await asyncio.get_running_loop().run_in_executor(None, publisher.stop)
+    logger.info("Pub/Sub publisher stopped.")
+
+def publish_message(message, session=None):
+    """
+    Queues a message for publishing without waiting for Pub/Sub.
+
+    Args:
+        message: JSON str or bytes
+        session: Game session the event came from, sent as the 'session' attribute
+
+    Returns:
+        bool: False if the publisher is not running or the queue is full
+    """
+    if _publish_queue is None:
+        return False
+    data = message.encode("utf-8") if isinstance(message, str) else message
+    try:
+        _publish_queue.put_nowait((data, {"session": session} if session else {}))
         return True
+    except asyncio.QueueFull:
+        messages_dropped.inc()
+        if messages_dropped.value % 1000 == 1:
+            logger.warning(f"Pub/Sub queue full, {messages_dropped.value} messages dropped so far")
+        return False
+
+async def _publish_loop():
+    """Drains the queue in chunks and submits them to the client off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _publish_queue.get()]
+        while len(batch) < config.PUBSUB_BATCH_MAX_MESSAGES and not _publish_queue.empty():
+            batch.append(_publish_queue.get_nowait())
+        batch_size.observe(len(batch))
+        try:
+            # publish() may block while flow control is saturated, so keep it off the loop
+            await loop.run_in_executor(None, _submit_batch, batch)
+        except Exception as e:
+            logger.error(f"Failed to submit {len(batch)} messages to Pub/Sub: {e}")
+        finally:
+            for _ in batch:
+                _publish_queue.task_done()
+
+def _submit_batch(batch):
+    global _messages_in_flight
+    for data, attributes in batch:
+        started = time.perf_counter()
+        try:
+            future = publisher.publish(topic_path, data=data, **attributes)
+        except Exception as e:
+            with _counter_lock:
+                publish_errors.inc()
+            logger.error(f"Failed to publish message: {e}")
+            continue
+        with _counter_lock:
+            _messages_in_flight += 1
+        future.add_done_callback(partial(_on_publish_done, started))
+
+def _on_publish_done(started, future):
+    """Completion callback, called from the client's thread once Pub/Sub acks or fails."""
+    global _last_publish_time, _messages_in_flight
+    try:
+        message_id = future.result()
+        with _counter_lock:
+            _messages_in_flight -= 1
+            _last_publish_time = time.time()
+            messages_published.inc()
+            publish_seconds.observe(time.perf_counter() - started)
+        logger.debug(f"Message published with ID {message_id}")
     except Exception as e:
-        _publish_errors += 1
+        with _counter_lock:
+            _messages_in_flight -= 1
+            publish_errors.inc()
         logger.error(f"Failed to publish message: {e}")
-        return False
 
 def get_pubsub_status():
     """Get current pubsub streaming status"""
     now = time.time()
     is_streaming = False
-    
+    queue_depth = _publish_queue.qsize() if _publish_queue is not None else 0
+
     if _last_publish_time:
         # Consider streaming active if we published within last 30 seconds
         time_since_last = now - _last_publish_time
         is_streaming = time_since_last < 30
-        
+
         return {
             "streaming": is_streaming,
             "last_publish": datetime.fromtimestamp(_last_publish_time).isoformat(),
             "seconds_since_last": int(time_since_last),
-            "total_messages": _total_messages_published,
-            "errors": _publish_errors
+            "total_messages": messages_published.value,
+            "errors": publish_errors.value,
+            "queued": queue_depth,
+            "in_flight": _messages_in_flight,
+            "dropped": messages_dropped.value
         }
     else:
         return {
             "streaming": False,
             "last_publish": None,
             "seconds_since_last": None,
-            "total_messages": _total_messages_published,
-            "errors": _publish_errors
+            "total_messages": messages_published.value,
+            "errors": publish_errors.value,
+            "queued": queue_depth,
+            "in_flight": _messages_in_flight,
+            "dropped": messages_dropped.value
         }
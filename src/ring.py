@@ -0,0 +1,168 @@
+# ring.py
+import asyncio
+import logging
+import time
+import numpy as np
+import config
+import ingest_pipeline
+import positions
+import session_registry
+from event_envelope import EventEnvelope
+
+logger = logging.getLogger('websocket_server')
+
+RING_TYPES = {'rtech.liveapi.RingStartClosing', 'rtech.liveapi.RingFinishedClosing'}
+
+# Events produced by the tracker itself rather than the game
+PLAYER_OUTSIDE_RING = 'derived.PlayerOutsideRing'
+PLAYER_INSIDE_RING = 'derived.PlayerInsideRing'
+
+class RingTracker:
+    """
+    Current ring, interpolated between RingStartClosing and RingFinishedClosing.
+
+    The game only reports the start and the end of each shrink, so the radius
+    in between is interpolated linearly over shrinkDuration from the moment
+    RingStartClosing was received. The ring is a cylinder: distances are
+    measured in the horizontal plane.
+    """
+
+    def __init__(self, table=None):
+        self.table = table or positions.table
+        self.reset()
+
+    def reset(self):
+        self.stage = None
+        self.center = None
+        self.start_radius = 0.0
+        self.end_radius = 0.0
+        self.shrink_duration = 0.0
+        self.started_at = 0.0
+        self.closing = False
+        self.outside = {}
+        self._snapshot = None
+        self._snapshot_key = None
+
+    def apply(self, type_name, message, now=None):
+        """Updates the ring from a RingStartClosing or RingFinishedClosing message."""
+        now = time.time() if now is None else now
+        self.stage = message.stage
+        self.center = (message.center.x, message.center.y)
+        if type_name == 'rtech.liveapi.RingStartClosing':
+            self.start_radius = message.currentRadius
+            self.end_radius = message.endRadius
+            self.shrink_duration = message.shrinkDuration
+            self.closing = True
+        else:
+            self.start_radius = self.end_radius = message.currentRadius
+            self.shrink_duration = 0.0
+            self.closing = False
+        self.started_at = now
+        logger.info(f"Ring stage {self.stage} {'closing' if self.closing else 'closed'}: radius {self.start_radius} -> {self.end_radius}")
+
+    def radius_at(self, now):
+        if not self.closing or self.shrink_duration <= 0:
+            return self.end_radius
+        progress = min(max((now - self.started_at) / self.shrink_duration, 0.0), 1.0)
+        return self.start_radius + (self.end_radius - self.start_radius) * progress
+
+    def _measure(self, radius):
+        """nucleusHash -> distance beyond the ring edge for every alive player outside it."""
+        table = self.table
+        n = len(table)
+        delta = table.pos[:n, :2] - self.center
+        beyond = np.sqrt(np.einsum('ij,ij->i', delta, delta)) - radius
+        rows = np.flatnonzero((beyond > 0) & table.alive[:n])
+        return {table.hashes[row]: float(beyond[row]) for row in rows}
+
+    def tick(self, now=None):
+        """
+        Recomputes who is outside the ring in one vectorised pass.
+
+        Returns:
+            tuple: ({nucleusHash: distance} of players who just left the ring,
+                    [nucleusHash] of alive players who just came back in)
+        """
+        if self.center is None:
+            return {}, []
+        now = time.time() if now is None else now
+        outside = self._measure(self.radius_at(now))
+        table = self.table
+        entered = {h: d for h, d in outside.items() if h not in self.outside}
+        # Players who died outside just drop off the list; only the living come back in
+        returned = [h for h in self.outside if h not in outside and h in table.rows and table.alive[table.rows[h]]]
+        self.outside = outside
+        return entered, returned
+
+    def snapshot(self, now=None):
+        """The ring and the players outside it, recomputed only when positions or the radius changed."""
+        now = time.time() if now is None else now
+        radius = self.radius_at(now)
+        key = (self.table.updates, radius, self.stage)
+        if self._snapshot is None or key != self._snapshot_key:
+            outside = self._measure(radius) if self.center is not None else {}
+            table = self.table
+            self._snapshot = {
+                "stage": self.stage,
+                "center": list(self.center) if self.center else None,
+                "radius": radius,
+                "endRadius": self.end_radius,
+                "closing": self.closing and radius != self.end_radius,
+                "outside": sorted(({
+                    "nucleusHash": table.players[table.rows[h]].nucleus_hash,
+                    "name": table.players[table.rows[h]].name,
+                    "teamId": int(table.team[table.rows[h]]),
+                    "distance": d
+                } for h, d in outside.items()), key=lambda p: -p["distance"])
+            }
+            self._snapshot_key = key
+        return self._snapshot
+
+# The ring of the live match
+tracker = RingTracker()
+_tick_task = None
+
+async def ring_sink(envelope):
+    """Pipeline sink: follow ring events and forget the ring at each new match."""
+    if envelope.type_name == 'rtech.liveapi.MatchSetup':
+        tracker.reset()
+    else:
+        tracker.apply(envelope.type_name, envelope.message)
+
+def _derived_event(type_name, nucleus_hash, distance=None):
+    table = tracker.table
+    row = table.rows.get(nucleus_hash)
+    data = {
+        "event": type_name.split('.', 1)[1],
+        "timestamp": int(time.time()),
+        "stage": tracker.stage,
+        "nucleusHash": table.players[row].nucleus_hash if row is not None else nucleus_hash,
+        "name": table.players[row].name if row is not None else '',
+        "teamId": int(table.team[row]) if row is not None else 0
+    }
+    if distance is not None:
+        data["distance"] = distance
+    # The tracker follows the primary session, so its events belong to it
+    return EventEnvelope(type_name, data=data, session=session_registry.registry.primary)
+
+async def _tick_loop():
+    while True:
+        await asyncio.sleep(config.RING_TICK_INTERVAL)
+        try:
+            entered, returned = tracker.tick()
+            for nucleus_hash, distance in entered.items():
+                await ingest_pipeline.dispatch(_derived_event(PLAYER_OUTSIDE_RING, nucleus_hash, distance))
+            for nucleus_hash in returned:
+                await ingest_pipeline.dispatch(_derived_event(PLAYER_INSIDE_RING, nucleus_hash))
+        except Exception as e:
+            logger.error(f"Error updating ring state: {e}")
+
+def start_ring_tracker():
+    global _tick_task
+    _tick_task = asyncio.create_task(_tick_loop())
+
+async def stop_ring_tracker():
+    global _tick_task
+    if _tick_task is not None:
+        _tick_task.cancel()
+        _tick_task = None
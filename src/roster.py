@@ -0,0 +1,93 @@
+# roster.py
+import logging
+from bisect import bisect_left
+from models import registry
+
+logger = logging.getLogger('websocket_server')
+
+LOBBY_PLAYERS_TYPE = 'rtech.liveapi.CustomMatch_LobbyPlayers'
+
+# Team ids below this are the unassigned (0) and observer (1) teams
+FIRST_PLAYING_TEAM = 2
+
+# Fields of CustomMatch_LobbyPlayer that get a prefix index -> LobbyPlayer attribute
+INDEXED_FIELDS = {'name': 'name', 'hardwareName': 'hardware_name', 'nucleusHash': 'nucleus_hash'}
+
+class PrefixIndex:
+    """
+    Sorted list of distinct values searched by case-insensitive prefix.
+
+    Lookups are a bisect plus a walk over the matches, so they cost
+    O(log n + limit) no matter how large the lobby is.
+    """
+    __slots__ = ('_keys', '_values')
+
+    def __init__(self, values=()):
+        pairs = sorted({(v.casefold(), v) for v in values if v})
+        self._keys = [k for k, _ in pairs]
+        self._values = [v for _, v in pairs]
+
+    def __len__(self):
+        return len(self._values)
+
+    def search(self, prefix='', limit=None):
+        """Values starting with prefix, in sorted order, at most limit of them."""
+        prefix = prefix.casefold()
+        start = bisect_left(self._keys, prefix)
+        end = len(self._keys) if limit is None else min(start + limit, len(self._keys))
+        if not prefix:
+            return self._values[start:end]
+        results = []
+        for i in range(start, end):
+            if not self._keys[i].startswith(prefix):
+                break
+            results.append(self._values[i])
+        return results
+
+class RosterIndex:
+    """Lobby roster of models.LobbyPlayer rows with prefix indexes and team lookups, rebuilt once per lobby update."""
+
+    def __init__(self):
+        self.loaded = False
+        self.version = 0
+        self.players = []
+        self.by_nucleus_hash = {}
+        self.teams = {}
+        self.indexes = {field: PrefixIndex() for field in INDEXED_FIELDS}
+
+    def rebuild(self, lobby_data):
+        """
+        Replaces the roster with the players of a CustomMatch_LobbyPlayers result.
+
+        Args:
+            lobby_data: The result as a dict, as produced by MessageToDict
+        """
+        players = [registry.lobby_row(p) for p in lobby_data.get('players', [])] if lobby_data else []
+        teams = {}
+        for player in players:
+            teams.setdefault(player.team_id, []).append(player)
+        # Build everything first and swap it in at once, so readers never see a half-built index
+        self.indexes = {field: PrefixIndex(getattr(p, attr) for p in players) for field, attr in INDEXED_FIELDS.items()}
+        self.by_nucleus_hash = {p.nucleus_hash: p for p in players if p.nucleus_hash}
+        self.teams = teams
+        self.players = players
+        self.loaded = True
+        self.version += 1
+        logger.debug(f"Roster index rebuilt with {len(players)} players in {len(teams)} teams")
+
+    def search(self, field, prefix='', limit=None):
+        return self.indexes[field].search(prefix, limit)
+
+    def team_players(self, team_id):
+        return self.teams.get(team_id, [])
+
+    def playing_team_count(self):
+        """Teams with at least one player, leaving out the unassigned and observer teams."""
+        return sum(1 for team_id in self.teams if team_id >= FIRST_PLAYING_TEAM)
+
+# The current lobby, kept up to date from LobbyPlayers results
+roster = RosterIndex()
+
+async def roster_sink(envelope):
+    """Pipeline sink: rebuild the roster whenever a lobby player list arrives."""
+    roster.rebuild(envelope.data)
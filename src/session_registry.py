@@ -0,0 +1,170 @@
+# session_registry.py
+"""
+Game client connections grouped into sessions, one per lobby.
+
+A connection starts in the default session and moves to a named one when
+its Init message carries a LiveAPI session name (the game's
+cl_liveapi_session_name); observers of the same lobby share that name, so
+they share a session. Stored state is namespaced per session (see
+data_store.state_key) and commands go to the clients of one session.
+
+Every observer of a lobby sends the same match events, so each session
+has one source connection whose events feed the match trackers and the
+history; when it disconnects, another connection of the session takes over.
+
+The in-memory single-match trackers (scoreboards, ring, positions, combat
+ledger, roster, overlays and live feeds) follow the primary session: the
+one configured in PRIMARY_SESSION, otherwise the longest-connected one.
+"""
+import contextvars
+import logging
+import re
+import time
+import config
+
+logger = logging.getLogger('websocket_server')
+
+DEFAULT_SESSION = 'default'
+
+# Session of the HTTP request being handled, set from ?session=; None for the primary
+_current = contextvars.ContextVar('session', default=None)
+
+def client_label(websocket):
+    address = websocket.remote_address
+    return f"{address[0]}:{address[1]}" if address else 'unknown'
+
+def session_id_for(name):
+    """The session id for an Init name, safe for Redis keys and URLs."""
+    session_id = re.sub(r'[^A-Za-z0-9_.-]+', '-', name).strip('-')
+    return session_id or DEFAULT_SESSION
+
+class Session:
+    """One lobby: what its Init said and the connections it arrived on."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.name = None
+        self.platform = None
+        self.game_version = None
+        self.api_version = None
+        self.connections = set()
+        self.connected_since = None
+        # The connection whose events count for the match; see is_source()
+        self.source = None
+
+    def identify(self, init):
+        self.name = init.name
+        self.platform = init.platform
+        self.game_version = init.gameVersion
+        api = init.apiVersion
+        self.api_version = f"{api.major_num}.{api.minor_num}.{api.build_stamp}" if init.HasField('apiVersion') else None
+
+    def to_dict(self):
+        return {
+            "session": self.session_id,
+            "name": self.name,
+            "platform": self.platform,
+            "gameVersion": self.game_version,
+            "apiVersion": self.api_version,
+            "clients": sorted(client_label(ws) for ws in self.connections),
+            "source": client_label(self.source) if self.source is not None else None,
+            "connectedSince": self.connected_since
+        }
+
+class SessionRegistry:
+    """Maps game connections to sessions and picks the primary session."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.by_connection = {}
+        self._primary = config.PRIMARY_SESSION or None
+
+    def _session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self.sessions[session_id] = session
+        return session
+
+    def _attach(self, websocket, session):
+        if not session.connections:
+            session.connected_since = time.time()
+        session.connections.add(websocket)
+        if session.source is None:
+            session.source = websocket
+        self.by_connection[websocket] = session
+
+    def _detach(self, websocket):
+        session = self.by_connection.pop(websocket, None)
+        if session is not None:
+            session.connections.discard(websocket)
+            if not session.connections:
+                session.connected_since = None
+            if session.source is websocket:
+                session.source = next(iter(session.connections), None)
+                if session.source is not None:
+                    logger.info(f"Game client {client_label(session.source)} is now the event source of "
+                                f"session {session.session_id}")
+        return session
+
+    def connect(self, websocket):
+        self._attach(websocket, self._session(DEFAULT_SESSION))
+
+    def disconnect(self, websocket):
+        self._detach(websocket)
+
+    def identify(self, websocket, init):
+        """Moves a connection to the session its Init message names; returns the session id."""
+        session = self._session(session_id_for(init.name))
+        if self.by_connection.get(websocket) is not session:
+            self._detach(websocket)
+            self._attach(websocket, session)
+            logger.info(f"Game client {client_label(websocket)} joined session {session.session_id} "
+                        f"({init.platform}, {init.gameVersion})")
+        session.identify(init)
+        return session.session_id
+
+    def is_source(self, websocket):
+        """Whether events from this connection count for its session; only one connection per session does."""
+        session = self.by_connection.get(websocket)
+        return session is not None and session.source is websocket
+
+    def session_of(self, websocket):
+        session = self.by_connection.get(websocket)
+        return session.session_id if session is not None else DEFAULT_SESSION
+
+    @property
+    def primary(self):
+        """The configured session, else the one connected longest; sticks after its clients leave until another connects."""
+        if config.PRIMARY_SESSION:
+            return config.PRIMARY_SESSION
+        current = self.sessions.get(self._primary)
+        if current is None or not current.connections:
+            connected = [s for s in self.sessions.values() if s.connections]
+            if connected:
+                self._primary = min(connected, key=lambda s: s.connected_since).session_id
+        return self._primary or DEFAULT_SESSION
+
+    def clients(self, session_id):
+        """Client addresses of a session's connections."""
+        session = self.sessions.get(session_id)
+        return [client_label(ws) for ws in session.connections] if session is not None else []
+
+    def stats(self):
+        primary = self.primary
+        # The default session only matters while clients without a session name are connected
+        return [{**s.to_dict(), "primary": s.session_id == primary} for s in self.sessions.values()
+                if s.connections or s.name is not None or s.session_id == primary]
+
+registry = SessionRegistry()
+
+def current():
+    """The session the current HTTP request asked for with ?session=, else the primary session."""
+    return _current.get() or registry.primary
+
+def use(session_id):
+    """Makes session_id the current session for this context; returns a token for reset()."""
+    return _current.set(session_id)
+
+def reset(token):
+    _current.reset(token)
@@ -10,13 +10,8 @@ let gameState = {
 document.addEventListener("DOMContentLoaded", function() {
     showNotification('Dashboard loaded successfully');
     
-    // Initialize status check
-    checkSystemStatus();
-    checkPubSubStatus(); // Add this line
-    
-    // Set up periodic status checking
-    setInterval(checkSystemStatus, 5000); // Check every 5 seconds
-    setInterval(checkPubSubStatus, 5000); // Check Pub/Sub status every 5 seconds // Add this line
+    // Status, lobby, settings and ban changes are pushed by the server
+    connectLiveUpdates();
     
     // Set up form enhancements
     setupPlayerAutoComplete();
@@ -345,6 +340,70 @@ function updatePubSubStatusIndicator(statusData) {
     pubSubStatusElement.title = titleHint; // Add a tooltip for more details
 }
 
+// Live updates pushed by the server over Server-Sent Events (replaces polling)
+function connectLiveUpdates() {
+    if (!window.EventSource) {
+        // No Server-Sent Events support: fall back to polling
+        checkSystemStatus();
+        checkPubSubStatus();
+        setInterval(checkSystemStatus, 5000);
+        setInterval(checkPubSubStatus, 5000);
+        return;
+    }
+
+    const source = new EventSource('/live');
+    source.addEventListener('status', event => {
+        const data = JSON.parse(event.data);
+        updateStatusIndicator(data);
+        updatePubSubStatusIndicator(data.pubsub || {});
+        gameState.connectionStatus = data.websocket?.connected ? 'connected' : 'disconnected';
+    });
+    source.addEventListener('lobby', event => applyLobbyUpdate(JSON.parse(event.data)));
+    source.addEventListener('settings', event => updateSettingsDisplay(JSON.parse(event.data)));
+    source.addEventListener('legendBans', event => updateLegendBanDisplay(JSON.parse(event.data)));
+    source.onerror = () => {
+        // EventSource reconnects by itself; show the server as unreachable until it does
+        updateStatusIndicator({ status: 'error', websocket: { connected: false }, redis: { connected: false }, game_data: { available: false } });
+        updatePubSubStatusIndicator({ client_error: 'Live updates disconnected' });
+        gameState.connectionStatus = 'error';
+    };
+}
+
+function applyLobbyUpdate(data) {
+    updateLobbyDisplay(data);
+    gameState.lobbyPlayers = data.players || [];
+    gameState.teams = data.teams || [];
+    populateTeamAssignmentOptions();
+    fillAutocompleteLists(gameState.lobbyPlayers);
+}
+
+function fillAutocompleteLists(players) {
+    const lists = {
+        playerNames: 'name',
+        hardwareNames: 'hardwareName',
+        kickHardwareNames: 'hardwareName',
+        nucleusHashes: 'nucleusHash',
+        kickNucleusHashes: 'nucleusHash'
+    };
+    Object.entries(lists).forEach(([target, field]) => {
+        const dataList = document.getElementById(target);
+        if (!dataList) return;
+        dataList.innerHTML = '';
+        [...new Set(players.map(p => p[field]).filter(Boolean))].forEach(value => {
+            const option = document.createElement('option');
+            option.value = value;
+            dataList.appendChild(option);
+        });
+    });
+}
+
+function updateSettingsDisplay(data) {
+    const display = safeGetElement('currentSettingsDisplay');
+    if (display && data.settings) {
+        display.innerHTML = `<pre style="margin: 0; white-space: pre-wrap;">${JSON.stringify(data.settings, null, 2)}</pre>`;
+    }
+}
+
 // Notification system
 function showNotification(message, type = 'success') {
     const notification = document.createElement('div');
@@ -1,11 +1,9 @@
 # websocket_server.py
 import asyncio
+import time
 import websockets
 from websockets.server import WebSocketServerProtocol
-from google.protobuf import symbol_database
 import logging
-import json
-from google.protobuf.json_format import MessageToDict
 from pubsub_manager import publish_message
 import os, sys
 
@@ -14,113 +12,170 @@ current_script_directory = os.path.dirname(os.path.abspath(__file__))
 parent_directory = os.path.abspath(os.path.join(current_script_directory, os.pardir, os.pardir))
 sys.path.append(parent_directory)
 import events_pb2
+import event_registry
+import ingest_pipeline
+from event_envelope import EventEnvelope
+import pending_requests
+import match_history
+import match_state
+import positions
+import ring
+import combat_ledger
+import live_updates
+import overlay_subscriptions
+import health
+import metrics
+import command_queue
+import session_registry
+from roster import roster, roster_sink, LOBBY_PLAYERS_TYPE
 from data_store import update_data_store
 
 connected_websockets = set()
 
+# Path on the game websocket port where overlays subscribe to topics
+OVERLAY_PATH = '/subscribe'
+
 logger = logging.getLogger('websocket_server')
 
+async def publish_sink(envelope):
+    """Pipeline sink: publish the event to Pub/Sub."""
+    if envelope.data:
+        publish_message(envelope.json_bytes, envelope.session)
+
+async def store_sink(envelope):
+    """Pipeline sink: write the event to the data store."""
+    if envelope.data:
+        await update_data_store(envelope.type_name, envelope.json_bytes, envelope.data, session=envelope.session)
+        logger.debug(f"Writing {envelope.type_name} to data store")
+
+RESPONSE_TYPE = 'rtech.liveapi.Response'
+INIT_TYPE = 'rtech.liveapi.Init'
+
+# Types that can answer a pending request when they arrive on their own
+STANDALONE_RESULT_TYPES = {
+    'rtech.liveapi.CustomMatch_LobbyPlayers',
+    'rtech.liveapi.CustomMatch_LegendBanStatus',
+}
+
+async def response_sink(envelope):
+    """Pipeline sink: process acks and results, and wake up waiting requests."""
+    if envelope.type_name == RESPONSE_TYPE:
+        await handle_response_message(envelope.message, envelope.session)
+    elif pending_requests.is_waiting(envelope.type_name, envelope.session):
+        pending_requests.resolve(envelope.type_name, envelope.data, envelope.session)
+
+# Built once at import: type URL -> (message class, handler)
+DECODERS = event_registry.build_decoder_table(ingest_pipeline.dispatch)
+
+events_received = metrics.Counter('apex_events_received_total', 'LiveAPI events received, by type', ('type',))
+decode_seconds = metrics.Histogram('apex_decode_seconds', 'Time to parse a frame and hand it to the sink queues')
+# Preallocated per type URL, so counting an event is one lookup and an add
+EVENT_COUNTERS = {type_url: events_received.labels(entry.type_name) for type_url, entry in DECODERS.items()}
+UNKNOWN_EVENTS = events_received.labels('unknown')
+
+async def decode_frame(message, source=None):
+    """
+    Decode stage: wrap one raw frame in an envelope and hand it to its handler.
+
+    Args:
+        message: The raw frame
+        source: The game client connection it came from, if known
+    """
+    started = time.perf_counter()
+    pblist = events_pb2.LiveAPIEvent()
+    pblist.ParseFromString(message)
+    type_url = pblist.gameMessage.type_url
+    entry = DECODERS.get(type_url)
+    session = session_registry.registry.session_of(source)
+
+    if entry is not None:
+        EVENT_COUNTERS[type_url].inc()
+        health.monitor.record_event(entry.type_name)
+        envelope = EventEnvelope(entry.type_name, raw=pblist.gameMessage.value, message_class=entry.message_class,
+                                 session=session, source=source)
+        if entry.type_name == INIT_TYPE and source is not None:
+            # Init names the lobby; it and everything after it belong to that session
+            envelope.session = session_registry.registry.identify(source, envelope.message)
+        elif entry.type_name == RESPONSE_TYPE and source is not None:
+            # Timed here rather than in the response sink, so queueing behind other events doesn't count as game time
+            command_queue.acknowledged(source, envelope.message.success)
+        await entry.handler(envelope)
+    else:
+        # Store raw data for unknown types
+        UNKNOWN_EVENTS.inc()
+        result_type = pblist.gameMessage.TypeName()
+        raw_msg = pblist.gameMessage.value
+        logger.info(f"Storing raw message data for {result_type}, length: {len(raw_msg)} bytes")
+        await update_data_store(result_type, { # Pass a dict for raw data as well
+            "raw_data": raw_msg.hex(), 
+            "type": result_type,
+            "timestamp": logger._created if hasattr(logger, '_created') else 0
+        }, session=session)
+    decode_seconds.observe(time.perf_counter() - started)
+
+async def start_ingest():
+    """Registers the sinks and starts the ingest pipeline."""
+    ingest_pipeline.register_sink('pubsub', publish_sink)
+    ingest_pipeline.register_sink('redis', store_sink)
+    # A replayable record of the match: every event is kept, none coalesced or dropped.
+    # Every observer of a lobby sends the same events, so the record and the match
+    # trackers take them from one connection per session
+    ingest_pipeline.register_sink('history', match_history.history_sink, policies={},
+                                  default_policy=ingest_pipeline.LOSSLESS, source_only=True)
+    # In-process and O(1) per event, so it can afford to be lossless for everything it reads
+    # The in-memory trackers below hold a single match, so they follow the primary session only
+    ingest_pipeline.register_sink('match_state', match_state.match_state_sink, accepts=match_state.state.event_types,
+                                  policies={t: ingest_pipeline.LOSSLESS for t in match_state.state.event_types},
+                                  primary_only=True, source_only=True)
+    ingest_pipeline.register_sink('positions', positions.position_sink, accepts=positions.SINK_TYPES, primary_only=True,
+                                  source_only=True)
+    ring_types = ring.RING_TYPES | {'rtech.liveapi.MatchSetup'}
+    ingest_pipeline.register_sink('ring', ring.ring_sink, accepts=ring_types,
+                                  policies={t: ingest_pipeline.LOSSLESS for t in ring_types}, primary_only=True,
+                                  source_only=True)
+    ledger_types = combat_ledger.LEDGER_TYPES | {'rtech.liveapi.MatchSetup'}
+    ingest_pipeline.register_sink('combat_ledger', combat_ledger.ledger_sink, accepts=ledger_types,
+                                  policies={t: ingest_pipeline.LOSSLESS for t in ledger_types}, primary_only=True,
+                                  source_only=True)
+    ingest_pipeline.register_sink('roster', roster_sink, accepts={LOBBY_PLAYERS_TYPE}, primary_only=True)
+    ingest_pipeline.register_sink('overlays', overlay_subscriptions.overlay_sink, accepts=overlay_subscriptions.SINK_TYPES,
+                                  primary_only=True, source_only=True)
+    ingest_pipeline.register_sink('live_updates', live_updates.live_updates_sink, accepts=set(live_updates.RESULT_TOPICS),
+                                  primary_only=True)
+    ingest_pipeline.register_sink('responses', response_sink, accepts={RESPONSE_TYPE} | STANDALONE_RESULT_TYPES)
+    await ingest_pipeline.start_pipeline(decode_frame)
+
+async def route_connection(websocket):
+    """Sends overlay subscribers to the subscription API and everything else to ws_handler."""
+    request = getattr(websocket, 'request', None)
+    path = request.path if request is not None else getattr(websocket, 'path', '/')
+    if path.split('?', 1)[0] == OVERLAY_PATH:
+        await overlay_subscriptions.handle_subscriber(websocket)
+    else:
+        await ws_handler(websocket, path)
+
 async def ws_handler(websocket, path="/"):
     """
     Handle WebSocket connections.
     
+    Only reads frames; decoding and the sinks run in the ingest pipeline so a
+    slow sink never stalls reads from the game client.
+
     Args:
         websocket: The WebSocket connection object
         path: The request path, defaulting to "/" if not provided
     """
     connected_websockets.add(websocket)
+    session_registry.registry.connect(websocket)
+    command_queue.open_channel(websocket)
+    health.monitor.client_connected()
+    live_updates.refresh_status()
     logger.info(f"New client connected. Path: {path}")
     
     try:
         async for message in websocket:
-            try:
-                logger.debug(f"Received raw message of length: {len(message)}")
-                pblist = events_pb2.LiveAPIEvent()
-                pblist.ParseFromString(message)
-                result_type = pblist.gameMessage.TypeName()
-                logger.info(f"Result type: {result_type}")
-                
-                try:
-                    msg_result = symbol_database.Default().GetSymbol(result_type)()
-                    pblist.gameMessage.Unpack(msg_result)
-                    logger.info(f"Received message from client: {msg_result}")
-                    
-                    # Convert to dict for data store and pubsub
-                    msg_dict = MessageToDict(msg_result)
-                    if msg_dict:
-                        # Pass the dictionary directly, not the JSON string
-                        publish_message(json.dumps(msg_dict)) # pubsub might still expect a string
-                        await update_data_store(result_type, msg_dict) # Pass the dict
-                        logger.info(f"Writing {result_type} to data store")
-                        
-                        # Handle Response messages specifically
-                        if result_type == "rtech.liveapi.Response":
-                            await handle_response_message(msg_result)
-                            
-                except Exception as symbol_error:
-                    logger.error(f"Error processing message: \"{symbol_error}\"")
-                    # Enhanced error handling - try alternative message processing
-                    try:
-                        # Try to handle known message types without symbol lookup
-                        if "CustomMatch_LobbyPlayers" in result_type:
-                            # Handle lobby players data
-                            try:
-                                msg_result = events_pb2.CustomMatch_LobbyPlayers()
-                                pblist.gameMessage.Unpack(msg_result)
-                                msg_dict = MessageToDict(msg_result)
-                                if msg_dict:
-                                    # Pass the dictionary directly
-                                    publish_message(json.dumps(msg_dict)) # pubsub might still expect a string
-                                    await update_data_store(result_type, msg_dict) # Pass the dict
-                                    logger.info(f"Successfully processed {result_type} via fallback")
-                            except Exception as fallback_error:
-                                logger.error(f"Fallback processing failed for {result_type}: {fallback_error}")
-                        
-                        elif "CustomMatch_LegendBanStatus" in result_type:
-                            # Handle legend ban status data
-                            try:
-                                msg_result = events_pb2.CustomMatch_LegendBanStatus()
-                                pblist.gameMessage.Unpack(msg_result)
-                                msg_dict = MessageToDict(msg_result)
-                                if msg_dict:
-                                    # Pass the dictionary directly
-                                    publish_message(json.dumps(msg_dict)) # pubsub might still expect a string
-                                    await update_data_store(result_type, msg_dict) # Pass the dict
-                                    logger.info(f"Successfully processed {result_type} via fallback")
-                            except Exception as fallback_error:
-                                logger.error(f"Fallback processing failed for {result_type}: {fallback_error}")
-                        
-                        elif "Response" in result_type:
-                            # Handle Response messages
-                            try:
-                                msg_result = events_pb2.Response()
-                                pblist.gameMessage.Unpack(msg_result)
-                                msg_dict = MessageToDict(msg_result)
-                                if msg_dict:
-                                    # Pass the dictionary directly
-                                    publish_message(json.dumps(msg_dict)) # pubsub might still expect a string
-                                    await update_data_store(result_type, msg_dict) # Pass the dict
-                                    await handle_response_message(msg_result) # Assuming this expects the protobuf message
-                                    logger.info(f"Successfully processed {result_type} via fallback")
-                            except Exception as fallback_error:
-                                logger.error(f"Fallback processing failed for {result_type}: {fallback_error}")
-                        
-                        else:
-                            # Store raw data for unknown types
-                            raw_msg = pblist.gameMessage.value
-                            logger.info(f"Storing raw message data for {result_type}, length: {len(raw_msg)} bytes")
-                            await update_data_store(result_type, { # Pass a dict for raw data as well
-                                "raw_data": raw_msg.hex(), 
-                                "type": result_type,
-                                "timestamp": logger._created if hasattr(logger, '_created') else 0
-                            })
-                    except Exception as processing_error:
-                        logger.error(f"Complete message processing failed: {processing_error}")
-                        # Continue processing other messages
-                        
-            except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                # Continue processing other messages even if one fails
+            health.monitor.record_message()
+            await ingest_pipeline.submit_frame(message, websocket)
 
     except websockets.exceptions.ConnectionClosedError:
         logger.info("Client disconnected.")
@@ -128,58 +183,42 @@ async def ws_handler(websocket, path="/"):
         logger.error(f"Error handling client connection: {e}")
         await websocket.close()
     finally:
-        connected_websockets.remove(websocket)
+        connected_websockets.discard(websocket)
+        command_queue.close_channel(websocket)
+        session_registry.registry.disconnect(websocket)
+        health.monitor.client_disconnected()
+        live_updates.refresh_status()
 
-async def handle_response_message(response_msg):
+async def handle_response_message(response_msg, session=None):
     """
     Handle Response messages from the game.
     
     Args:
         response_msg: The Response protobuf message
+        session: Id of the game session it came from
     """
     if response_msg.success:
         logger.info("Request acknowledged successfully by the game")
-        if response_msg.result:
+        if response_msg.HasField('result'):
             # Unpack and handle the result if present
             try:
-                result_type = response_msg.result.TypeName()
-                logger.info(f"Response contains result of type: {result_type}")
-                
-                # Try to unpack the result and store it separately
-                try:
-                    result_msg = symbol_database.Default().GetSymbol(result_type)()
-                    response_msg.result.Unpack(result_msg)
-                    logger.info(f"Response result: {result_msg}")
-                    
-                    # Store the unpacked result in the data store under its specific type
-                    result_dict = MessageToDict(result_msg)
-                    if result_dict:
-                        # Pass the dictionary directly
-                        await update_data_store(result_type, result_dict) # Pass the dict
-                        logger.info(f"Stored response result under type: {result_type}")
-                        
-                except Exception as unpack_error:
-                    logger.warning(f"Could not unpack result of type {result_type}: {unpack_error}")
-                    # Try fallback unpacking for known types
-                    try:
-                        if "CustomMatch_SetSettings" in result_type:
-                            result_msg = events_pb2.CustomMatch_SetSettings()
-                            response_msg.result.Unpack(result_msg)
-                            result_dict = MessageToDict(result_msg)
-                            if result_dict:
-                                # Pass the dictionary directly
-                                await update_data_store(result_type, result_dict) # Pass the dict
-                                logger.info(f"Successfully unpacked {result_type} via fallback")
-                        elif "CustomMatch_LegendBanStatus" in result_type:
-                            result_msg = events_pb2.CustomMatch_LegendBanStatus()
-                            response_msg.result.Unpack(result_msg)
-                            result_dict = MessageToDict(result_msg)
-                            if result_dict:
-                                # Pass the dictionary directly
-                                await update_data_store(result_type, result_dict) # Pass the dict
-                                logger.info(f"Successfully unpacked {result_type} via fallback")
-                    except Exception as fallback_error:
-                        logger.error(f"Fallback unpacking also failed for {result_type}: {fallback_error}")
+                entry = DECODERS.get(response_msg.result.type_url)
+                if entry is None:
+                    logger.warning(f"Could not unpack result of type {response_msg.result.TypeName()}")
+                    return
+                logger.debug(f"Response contains result of type: {entry.type_name}")
+                health.monitor.record_event(entry.type_name)
+                result = EventEnvelope(entry.type_name, raw=response_msg.result.value, message_class=entry.message_class)
+                pending_requests.resolve(entry.type_name, result.data, session)
+                if session == session_registry.registry.primary:
+                    if entry.type_name == LOBBY_PLAYERS_TYPE:
+                        roster.rebuild(result.data)
+                    live_updates.publish_result(entry.type_name, result.data)
+
+                # Store the unpacked result in the data store under its specific type
+                if result.data:
+                    await update_data_store(entry.type_name, result.json_bytes, result.data, session=session)
+                    logger.info(f"Stored response result under type: {entry.type_name}")
                         
             except Exception as result_error:
                 logger.error(f"Error processing response result: {result_error}")
@@ -188,32 +227,33 @@ async def handle_response_message(response_msg):
         if hasattr(response_msg, 'error_message'):
             logger.warning(f"Error message: {response_msg.error_message}")
         
-async def send_request_to_game(request_msg):
+async def send_request_to_game(request_msg, clients=None):
     """
-    Send a Request message to all connected Apex Legends clients.
+    Send a Request message to the connected Apex Legends clients of a session.
     
     Args:
         request_msg: The Request protobuf message to send
+        clients: Addresses of the clients to send it to, or None for the current session's
+
+    Returns:
+        bool: Whether it was queued for at least one client
     """
-    if not connected_websockets:
-        logger.warning("No connected websockets to send request to")
-        return False
-        
-    serialized_request = request_msg.SerializeToString()
-    disconnected_sockets = set()
-    
-    for ws in connected_websockets:
-        try:
-            await ws.send(serialized_request)
-            logger.debug("Request sent to websocket client")
-        except websockets.exceptions.ConnectionClosed:
-            logger.warning("WebSocket connection closed while sending request")
-            disconnected_sockets.add(ws)
-        except Exception as e:
-            logger.error(f"Error sending request to websocket: {e}")
-            disconnected_sockets.add(ws)
-    
-    # Clean up disconnected sockets
-    connected_websockets.difference_update(disconnected_sockets)
-    
-    return len(connected_websockets) > 0
+    trace, = await send_requests_to_game([request_msg], clients)
+    return trace.clients > 0
+
+async def send_requests_to_game(request_msgs, clients=None):
+    """
+    Send Request messages, in order, to the connected Apex Legends clients of a session.
+
+    Every request is serialized once and queued on each client's command
+    queue, which sends it and tracks its ack; see command_queue. Clients
+    are sent to concurrently, so a stalled one doesn't hold up the others.
+
+    Args:
+        request_msgs: List of Request protobuf messages
+        clients: Addresses of the clients to send them to, or None for the current session's
+
+    Returns:
+        list: The command_trace.Trace of each request
+    """
+    return command_queue.submit(request_msgs, clients)
@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# The server runs with src/ as its working directory and imports its modules flat
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
@@ -0,0 +1,31 @@
+# test_apex_events.py
+import pytest
+import apex_events
+
+@pytest.mark.parametrize('command, params, with_ack, expected', [
+    ('customMatch_SetTeamName', {"teamId": 2, "teamName": "A"}, True,
+     {"customMatchSetTeamName": {"teamId": 2, "teamName": "A"}, "withAck": True}),
+    ('customMatch_SetLegendBan', {"legendRefs": ["wraith"]}, False, {"customMatchSetLegendBan": {"legendRefs": ["wraith"]}}),
+    ('customMatch_SetEndRingExclusion', {"sectionToExclude": "CENTER"}, True,
+     {"customMatchSetEndRingExclusion": {"sectionToExclude": "CENTER"}, "withAck": True}),
+    # Commands without fields are still selected
+    ('pauseToggle', None, True, {"pauseToggle": {}, "withAck": True}),
+])
+def test_build_request(command, params, with_ack, expected):
+    request = apex_events.build_request(command, params, with_ack)
+    assert apex_events.message_to_dict(request) == expected
+
+@pytest.mark.parametrize('command, params, with_ack, error', [
+    ('customMatch_DoesNotExist', None, True, "unknown command"),
+    (None, None, True, "unknown command"),
+    (['pauseToggle'], None, True, "unknown command"),
+    ('customMatch_SetTeamName', ["teamId", 2], True, "params must be an object"),
+    ('customMatch_SetTeamName', {"teamId": "two"}, True, "teamId"),
+    ('customMatch_SetTeamName', {"teamName": 5}, True, "teamName"),
+    ('customMatch_SetTeamName', {"color": "red"}, True, "color"),
+    ('customMatch_SetEndRingExclusion', {"sectionToExclude": "NORTH"}, True, "NORTH"),
+    ('pauseToggle', None, "yes", "withAck must be true or false"),
+])
+def test_build_request_rejects_bad_commands(command, params, with_ack, error):
+    with pytest.raises(ValueError, match=error):
+        apex_events.build_request(command, params, with_ack)
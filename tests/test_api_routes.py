@@ -0,0 +1,117 @@
+# test_api_routes.py
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import api_routes
+import command_queue
+import command_trace
+import events_pb2
+
+def serve(app, requests):
+    """Runs requests(client) against app on a test server and returns its result."""
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            return await requests(client)
+    return asyncio.run(run())
+
+def test_trace_middleware_times_replies_of_failing_handlers():
+    traces = []
+
+    def command_sent():
+        traces.append(command_trace.begin(events_pb2.Request(pauseToggle=events_pb2.PauseToggle())))
+
+    async def bad_request(request):
+        command_sent()
+        raise web.HTTPBadRequest(text='bad')
+
+    async def broken(request):
+        command_sent()
+        raise RuntimeError('handler bug')
+
+    app = web.Application(middlewares=[api_routes.trace_middleware])
+    app.router.add_post('/bad', bad_request)
+    app.router.add_post('/broken', broken)
+
+    async def requests(client):
+        return [(await client.post('/bad')).status, (await client.post('/broken')).status]
+
+    assert serve(app, requests) == [400, 500]
+    assert len(traces) == 2
+    assert all(trace.replied is not None for trace in traces)
+
+@pytest.fixture
+def sent_batches(monkeypatch):
+    """Stands in for the command queue: records each submit() and settles its traces as acked, failed, then unacked."""
+    batches = []
+
+    def submit(request_msgs, clients=None):
+        batches.append(([request.WhichOneof('actions') for request in request_msgs], clients))
+        traces = [command_trace.begin(request) for request in request_msgs]
+        for trace, success in zip(traces, (True, False)):
+            command_trace.attach(trace)
+            command_trace.sent(trace)
+            command_trace.acknowledged(trace, success)
+        return traces
+
+    monkeypatch.setattr(command_queue, 'submit', submit)
+    return batches
+
+def post_batch(body):
+    app = web.Application()
+    app.router.add_post('/batch', api_routes.batch_request)
+
+    async def requests(client):
+        response = await client.post('/batch', json=body)
+        return response.status, await response.json()
+
+    return serve(app, requests)
+
+def test_batch_sends_commands_in_order_in_one_submit(sent_batches):
+    status, reply = post_batch({"timeout": 0, "commands": [
+        {"command": "customMatch_SetTeamName", "params": {"teamId": 2, "teamName": "A"}},
+        {"command": "customMatch_SetTeamName", "params": {"teamId": 3, "teamName": "B"}},
+        {"command": "pauseToggle", "withAck": False},
+    ]})
+    assert status == 200
+    assert sent_batches == [(['customMatch_SetTeamName', 'customMatch_SetTeamName', 'pauseToggle'], None)]
+    assert (reply["commands"], reply["acked"], reply["failed"], reply["unacked"]) == (3, 1, 1, 1)
+    assert [(r["index"], r["command"], r["status"]) for r in reply["results"]] == [
+        (0, 'customMatch_SetTeamName', 'acked'), (1, 'customMatch_SetTeamName', 'failed'), (2, 'pauseToggle', 'queued')]
+
+def test_batch_names_every_bad_command_and_sends_nothing(sent_batches):
+    status, reply = post_batch({"commands": [
+        {"command": "pauseToggle"},
+        {"command": "customMatch_Teleport"},
+        "pauseToggle",
+        {"command": "customMatch_SetTeamName", "params": {"teamId": "two"}},
+        {"command": "customMatch_SetTeamName", "params": [2]},
+        {"command": "pauseToggle", "withAck": "yes"},
+    ]})
+    assert status == 400
+    assert [error["index"] for error in reply["errors"]] == [1, 2, 3, 4, 5]
+    assert reply["errors"][0]["command"] == "customMatch_Teleport"
+    assert sent_batches == []
+
+@pytest.mark.parametrize('body, error', [
+    ([{"command": "pauseToggle"}], "commands must be a non-empty list"),
+    ({}, "commands must be a non-empty list"),
+    ({"commands": []}, "commands must be a non-empty list"),
+    ({"commands": {"command": "pauseToggle"}}, "commands must be a non-empty list"),
+    ({"commands": [{"command": "pauseToggle"}], "timeout": "soon"}, "timeout must be a number"),
+    ({"commands": [{"command": "pauseToggle"}], "session": "not a session"}, "session must be a session id"),
+    ({"commands": [{"command": "pauseToggle"}], "clients": "10.0.0.1:1"}, "clients must be a list of client addresses"),
+])
+def test_batch_rejects_bad_bodies(sent_batches, body, error):
+    assert post_batch(body) == (400, {"error": error})
+    assert sent_batches == []
+
+def test_malformed_history_range_is_a_400():
+    app = web.Application()
+    app.router.add_get('/history/{match_id}', api_routes.history_request)
+
+    async def requests(client):
+        response = await client.get('/history/srv-1', params={"cursor": "next"})
+        return response.status, await response.json()
+
+    assert serve(app, requests) == (400, {"error": "cursor must be a stream id or ms timestamp"})
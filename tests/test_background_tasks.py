@@ -0,0 +1,43 @@
+# test_background_tasks.py
+import asyncio
+from background_tasks import stop_task, stopping
+
+def test_stop_ends_a_loop_that_swallows_its_cancels():
+    passes = []
+
+    async def loop():
+        while not stopping():
+            passes.append(1)
+            try:
+                await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                # As redis-py can in the middle of a pipeline
+                pass
+
+    async def run():
+        task = asyncio.create_task(loop())
+        while not passes:
+            await asyncio.sleep(0)
+        return await stop_task(task, timeout=1), task.done()
+
+    assert asyncio.run(run()) == (True, True)
+
+def test_stop_gives_up_after_the_timeout():
+    async def stuck(released):
+        while True:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                if released.is_set():
+                    raise
+
+    async def run():
+        released = asyncio.Event()
+        task = asyncio.create_task(stuck(released))
+        await asyncio.sleep(0)
+        stopped = await stop_task(task, timeout=0.05)
+        running = not task.done()
+        released.set()
+        return stopped, running, await stop_task(task, timeout=1)
+
+    assert asyncio.run(run()) == (False, True, True)
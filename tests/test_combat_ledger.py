@@ -0,0 +1,81 @@
+# test_combat_ledger.py
+import random
+from collections import defaultdict
+import events_pb2
+from combat_ledger import CombatLedger
+
+WEAPONS = ("R-301", "Wingman", "Peacekeeper")
+
+def player(i):
+    return events_pb2.Player(name=f"Player{i}", nucleusHash=f"{i:032x}", teamId=i // 3 + 2)
+
+def random_events(count=2000, seed=3):
+    random.seed(seed)
+    events = []
+    for k in range(count):
+        attacker, victim = random.sample(range(12), 2)
+        if k % 10 == 9:
+            message = events_pb2.PlayerKilled(timestamp=100 + k, weapon=random.choice(WEAPONS))
+            message.awardedTo.CopyFrom(player(attacker))
+            events.append(('rtech.liveapi.PlayerKilled', message))
+        else:
+            message = events_pb2.PlayerDamaged(timestamp=100 + k, weapon=random.choice(WEAPONS),
+                                               damageInflicted=random.randrange(1, 50))
+            message.attacker.CopyFrom(player(attacker))
+            events.append(('rtech.liveapi.PlayerDamaged', message))
+        message.victim.CopyFrom(player(victim))
+    return events
+
+def filled_ledger(events):
+    ledger = CombatLedger()
+    for type_name, message in events:
+        ledger.apply(type_name, message)
+    return ledger
+
+def test_damage_by_weapon_matches_a_plain_sum():
+    events = random_events()
+    ledger = filled_ledger(events)
+    expected, windowed = defaultdict(int), defaultdict(int)
+    for type_name, message in events:
+        if type_name == 'rtech.liveapi.PlayerDamaged':
+            expected[message.weapon] += message.damageInflicted
+            if 500 <= message.timestamp < 1500:
+                windowed[message.weapon] += message.damageInflicted
+    assert ledger.damage_by_weapon() == expected
+    assert ledger.damage_by_weapon(500, 1500) == windowed
+
+def test_player_totals_match_a_plain_count():
+    events = random_events()
+    ledger = filled_ledger(events)
+    expected = defaultdict(lambda: {"damageDealt": 0, "damageTaken": 0, "kills": 0, "deaths": 0})
+    for type_name, message in events:
+        victim = expected[message.victim.nucleusHash]
+        if type_name == 'rtech.liveapi.PlayerDamaged':
+            expected[message.attacker.nucleusHash]["damageDealt"] += message.damageInflicted
+            victim["damageTaken"] += message.damageInflicted
+        else:
+            # Kills go to awardedTo, the attacker field is left empty in these events
+            expected[message.awardedTo.nucleusHash]["kills"] += 1
+            victim["deaths"] += 1
+    assert ledger.player_totals() == expected
+
+def test_damage_timeline_buckets_by_timestamp():
+    events = random_events()
+    ledger = filled_ledger(events)
+    expected = defaultdict(int)
+    for type_name, message in events:
+        if type_name == 'rtech.liveapi.PlayerDamaged':
+            expected[message.timestamp // 30 * 30] += message.damageInflicted
+    assert ledger.damage_timeline(30) == [[start, total] for start, total in sorted(expected.items())]
+    assert CombatLedger().damage_timeline(30) == []
+
+def test_appends_keep_working_after_queries_and_reset():
+    events = random_events(100)
+    ledger = filled_ledger(events)
+    ledger.player_totals()
+    ledger.apply(*events[0])
+    assert len(ledger) == 101
+    assert ledger.memory_usage() >= 101 * 25
+    ledger.reset()
+    assert len(ledger) == 0
+    assert ledger.player_totals() == {}
@@ -0,0 +1,278 @@
+# test_command_queue.py
+import asyncio
+import pytest
+import websockets.exceptions
+import command_queue
+import config
+import events_pb2
+import websocket_server
+
+class FakeGameClient:
+    """Stands in for a game connection's websocket and records what was sent to it."""
+
+    def __init__(self, port, stall=False, fail=False):
+        self.remote_address = ('127.0.0.1', port)
+        self.sent = []
+        self.stall = stall
+        self.fail = fail
+
+    async def send(self, payload):
+        if self.fail:
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        if self.stall:
+            await asyncio.sleep(3600)
+        self.sent.append(events_pb2.Request.FromString(payload))
+
+def team_name(name, with_ack=True):
+    """An idempotent command."""
+    return events_pb2.Request(customMatch_SetTeamName=events_pb2.CustomMatch_SetTeamName(teamId=2, teamName=name),
+                              withAck=with_ack)
+
+def chat(text):
+    """A command that must not be carried out twice."""
+    return events_pb2.Request(customMatch_SendChat=events_pb2.CustomMatch_SendChat(text=text), withAck=True)
+
+@pytest.fixture(autouse=True)
+def fast_deadlines(monkeypatch):
+    monkeypatch.setattr(config, 'COMMAND_ACK_TIMEOUT', 0.05)
+    monkeypatch.setattr(config, 'COMMAND_SEND_TIMEOUT', 0.05)
+    monkeypatch.setattr(config, 'COMMAND_MAX_RETRIES', 2)
+    monkeypatch.setattr(config, 'COMMAND_DEGRADED_AFTER', 3)
+    yield
+    for websocket in list(command_queue.channels):
+        command_queue.close_channel(websocket)
+
+async def until(condition):
+    while not condition():
+        await asyncio.sleep(0.001)
+
+async def settle():
+    """Lets the channel tasks send whatever they can."""
+    await asyncio.sleep(0.01)
+
+def open_clients(*clients):
+    for client in clients:
+        command_queue.open_channel(client)
+    return [command_queue.channels[client].client for client in clients]
+
+def test_acks_are_matched_to_requests_in_order(monkeypatch):
+    monkeypatch.setattr(config, 'COMMAND_ACK_TIMEOUT', 5)
+    client = FakeGameClient(1001)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A"), team_name("B"), team_name("C")], targets)
+        await until(lambda: len(client.sent) == 3)
+        assert command_queue.acknowledged(client, True) is traces[0]
+        assert command_queue.acknowledged(client, False) is traces[1]
+        assert command_queue.acknowledged(client, True) is traces[2]
+        assert command_queue.acknowledged(client, True) is None
+        return traces
+
+    traces = asyncio.run(asyncio.wait_for(run(), 5))
+    assert [r.customMatch_SetTeamName.teamName for r in client.sent] == ["A", "B", "C"]
+    assert [t.status() for t in traces] == ["acked", "failed", "acked"]
+
+def test_in_flight_requests_are_capped(monkeypatch):
+    monkeypatch.setattr(config, 'COMMAND_MAX_IN_FLIGHT', 2)
+    monkeypatch.setattr(config, 'COMMAND_ACK_TIMEOUT', 5)
+    client = FakeGameClient(1002)
+
+    async def run():
+        targets = open_clients(client)
+        command_queue.submit([team_name(str(i)) for i in range(5)], targets)
+        await until(lambda: len(client.sent) == 2)
+        await settle()
+        channel = command_queue.channels[client]
+        assert (len(client.sent), len(channel.in_flight), len(channel.queue)) == (2, 2, 3)
+        command_queue.acknowledged(client, True)
+        await until(lambda: len(client.sent) == 3)
+        await settle()
+        assert (len(client.sent), len(channel.in_flight), len(channel.queue)) == (3, 2, 2)
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+
+def test_requests_without_ack_are_settled_once_sent():
+    client = FakeGameClient(1003)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A", with_ack=False)], targets)
+        await until(lambda: traces[0].status() == "sent")
+        return traces[0], command_queue.channels[client]
+
+    trace, channel = asyncio.run(asyncio.wait_for(run(), 5))
+    assert trace.status() == "sent"
+    assert not channel.in_flight
+
+def test_idempotent_requests_are_resent_after_an_ack_timeout():
+    client = FakeGameClient(1004)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A")], targets)
+        await command_queue.command_trace.wait_for_acks(traces, 1)
+        return traces[0]
+
+    trace = asyncio.run(asyncio.wait_for(run(), 5))
+    # The first send and COMMAND_MAX_RETRIES resends, then it times out
+    assert len(client.sent) == 3
+    assert trace.retries == 2
+    assert trace.status() == "timeout"
+
+def test_other_requests_time_out_without_a_resend():
+    client = FakeGameClient(1005)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([chat("gg")], targets)
+        await command_queue.command_trace.wait_for_acks(traces, 1)
+        return traces[0]
+
+    trace = asyncio.run(asyncio.wait_for(run(), 5))
+    assert len(client.sent) == 1
+    assert trace.status() == "timeout"
+
+def test_late_ack_after_a_resend_settles_the_request():
+    client = FakeGameClient(1006)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A")], targets)
+        await until(lambda: len(client.sent) == 2)
+        command_queue.acknowledged(client, True)
+        return traces[0]
+
+    trace = asyncio.run(asyncio.wait_for(run(), 5))
+    assert trace.status() == "acked"
+    assert trace.retries == 1
+
+def test_disconnect_abandons_queued_and_in_flight_requests():
+    client = FakeGameClient(1007)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A"), team_name("B")], targets)
+        await settle()
+        command_queue.close_channel(client)
+        return traces
+
+    traces = asyncio.run(asyncio.wait_for(run(), 5))
+    assert [t.status() for t in traces] == ["disconnected", "disconnected"]
+    assert client not in command_queue.channels
+
+def test_closed_connection_abandons_its_queue():
+    client = FakeGameClient(1008, fail=True)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A"), chat("gg")], targets)
+        channel = command_queue.channels[client]
+        await until(lambda: channel.closed)
+        return traces, channel
+
+    traces, channel = asyncio.run(asyncio.wait_for(run(), 5))
+    assert channel.closed
+    assert [t.status() for t in traces] == ["disconnected", "disconnected"]
+
+def test_nothing_connected_is_reported_as_not_sent():
+    async def run():
+        return command_queue.submit([team_name("A")], ['127.0.0.1:9'])
+
+    assert asyncio.run(asyncio.wait_for(run(), 5))[0].status() == "not_sent"
+
+def test_missed_deadlines_mark_a_client_degraded_until_it_acks():
+    client = FakeGameClient(1101)
+
+    async def run():
+        targets = open_clients(client)
+        channel = command_queue.channels[client]
+        traces = command_queue.submit([chat(str(i)) for i in range(3)], targets)
+        await command_queue.command_trace.wait_for_acks(traces, 1)
+        degraded = channel.degraded
+        command_queue.submit([chat("again")], targets)
+        await until(lambda: len(channel.in_flight) == 1)
+        command_queue.acknowledged(client, True)
+        return degraded, channel.degraded, channel.misses
+
+    degraded_after_timeouts, degraded_after_ack, misses = asyncio.run(asyncio.wait_for(run(), 5))
+    assert degraded_after_timeouts
+    assert not degraded_after_ack
+    assert misses == 0
+
+def test_stalled_send_counts_as_a_missed_deadline_and_the_frame_still_counts_as_sent():
+    client = FakeGameClient(1102, stall=True)
+
+    async def run():
+        targets = open_clients(client)
+        traces = command_queue.submit([team_name("A", with_ack=False)], targets)
+        await until(lambda: traces[0].status() == "sent")
+        return command_queue.channels[client].stats()
+
+    stats = asyncio.run(asyncio.wait_for(run(), 5))
+    assert stats["missed_deadlines"] == 1
+
+def test_stalled_client_does_not_hold_up_the_others(monkeypatch):
+    monkeypatch.setattr(config, 'COMMAND_ACK_TIMEOUT', 5)
+    healthy, stalled = FakeGameClient(1103), FakeGameClient(1104, stall=True)
+
+    async def run():
+        targets = open_clients(healthy, stalled)
+        traces = command_queue.submit([team_name(str(i)) for i in range(3)], targets)
+        await until(lambda: len(healthy.sent) == 3)
+        for _ in range(3):
+            command_queue.acknowledged(healthy, True)
+        return traces
+
+    traces = asyncio.run(asyncio.wait_for(run(), 5))
+    # One client acking is enough
+    assert [t.status() for t in traces] == ["acked"] * 3
+
+def test_degraded_clients_are_not_waited_on_and_their_queue_is_capped(monkeypatch):
+    monkeypatch.setattr(config, 'COMMAND_MAX_IN_FLIGHT', 2)
+    monkeypatch.setattr(config, 'COMMAND_ACK_TIMEOUT', 5)
+    healthy, slow = FakeGameClient(1105), FakeGameClient(1106, stall=True)
+
+    async def run():
+        targets = open_clients(healthy, slow)
+        slow_channel = command_queue.channels[slow]
+        slow_channel.degraded = True
+        traces = command_queue.submit([team_name(str(i)) for i in range(5)], targets)
+        queued = len(slow_channel.queue)
+        await until(lambda: len(healthy.sent) == 2)
+        return traces, queued, slow_channel.stats()["skipped"]
+
+    traces, queued, skipped = asyncio.run(asyncio.wait_for(run(), 5))
+    assert all(trace.clients == 1 for trace in traces)
+    assert (queued, skipped) == (2, 3)
+
+def test_commands_go_only_to_the_targeted_clients():
+    first, second = FakeGameClient(1107), FakeGameClient(1108)
+
+    async def run():
+        targets = open_clients(first, second)
+        token = command_queue.target_clients([targets[1]])
+        try:
+            command_queue.submit([team_name("A", with_ack=False)])
+        finally:
+            command_queue.reset_targets(token)
+        await until(lambda: second.sent)
+        await settle()
+        return command_queue.unknown_clients([targets[0], '127.0.0.1:9'])
+
+    unknown = asyncio.run(asyncio.wait_for(run(), 5))
+    assert first.sent == [] and len(second.sent) == 1
+    assert unknown == ['127.0.0.1:9']
+
+def test_send_request_to_game_reports_whether_anything_was_queued():
+    client = FakeGameClient(1015)
+
+    async def run():
+        targets = open_clients(client)
+        # Connected, but not one of the clients asked for
+        missed = await websocket_server.send_request_to_game(team_name("A"), ['10.9.9.9:1'])
+        sent = await websocket_server.send_request_to_game(team_name("B"), targets)
+        await until(lambda: len(client.sent) == 1)
+        return missed, sent
+
+    assert asyncio.run(run()) == (False, True)
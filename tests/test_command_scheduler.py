@@ -0,0 +1,89 @@
+# test_command_scheduler.py
+import asyncio
+import time
+import pytest
+import command_queue
+import command_scheduler
+import events_pb2
+from command_scheduler import LatestWinsScheduler
+
+@pytest.fixture(autouse=True)
+def fake_queue(monkeypatch):
+    """Records what the schedulers hand to the command queue instead of sending it."""
+    submitted = []
+
+    def submit(request_msgs, clients=None):
+        submitted.append((time.monotonic(), request_msgs[0].changeCam.name, command_queue.current_targets()))
+        return [request_msgs[0].changeCam.name]
+
+    monkeypatch.setattr(command_queue, 'submit', submit)
+    monkeypatch.setattr(command_scheduler, 'schedulers', {})
+    yield submitted
+
+def camera(name):
+    return events_pb2.Request(changeCam=events_pb2.ChangeCamera(name=name))
+
+def test_a_burst_sends_the_first_and_the_latest_command(fake_queue):
+    async def run():
+        scheduler = LatestWinsScheduler('camera', 0.05)
+        futures = [scheduler.submit(camera("a"))]
+        # Goes out right away
+        await asyncio.sleep(0)
+        futures += [scheduler.submit(camera(name)) for name in ("b", "c", "d")]
+        results = await asyncio.gather(*futures)
+        await scheduler.stop()
+        return results, scheduler.stats()
+
+    results, stats = asyncio.run(run())
+    assert [name for _, name, _ in fake_queue] == ["a", "d"]
+    # Replaced commands resolve to None, sent ones to their trace
+    assert results == ["a", None, None, "d"]
+    assert (stats["submitted"], stats["sent"], stats["dropped"]) == (4, 2, 2)
+
+def test_sends_are_spaced_by_the_minimum_interval(fake_queue):
+    async def run():
+        scheduler = LatestWinsScheduler('camera', 0.05)
+        for name in ("a", "b", "c"):
+            await scheduler.submit(camera(name))
+        await scheduler.stop()
+
+    asyncio.run(run())
+    times = [sent_at for sent_at, _, _ in fake_queue]
+    assert len(times) == 3
+    assert all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:]))
+
+def test_stop_resolves_the_pending_command(fake_queue):
+    async def run():
+        scheduler = LatestWinsScheduler('camera', 10)
+        await scheduler.submit(camera("a"))
+        pending = scheduler.submit(camera("b"))
+        await scheduler.stop()
+        return await pending
+
+    assert asyncio.run(run()) is None
+    assert [name for _, name, _ in fake_queue] == ["a"]
+
+def test_commands_for_different_clients_do_not_replace_each_other(fake_queue, monkeypatch):
+    monkeypatch.setitem(command_scheduler.MIN_INTERVALS, command_scheduler.CAMERA, 10)
+
+    def submit_for(clients, name):
+        token = command_queue.target_clients(clients)
+        try:
+            return command_scheduler.submit(command_scheduler.CAMERA, camera(name))
+        finally:
+            command_queue.reset_targets(token)
+
+    async def run():
+        await submit_for(['10.0.0.1:1'], "x1")
+        await submit_for(['10.0.0.1:2'], "y1")
+        # Both wait out the interval; a newer command only replaces the one for the same clients
+        x2, y2, x3 = submit_for(['10.0.0.1:1'], "x2"), submit_for(['10.0.0.1:2'], "y2"), submit_for(['10.0.0.1:1'], "x3")
+        stats = command_scheduler.get_scheduler_stats()
+        await command_scheduler.stop_schedulers()
+        return [await x2, await y2, await x3], stats
+
+    results, stats = asyncio.run(run())
+    assert [(name, targets) for _, name, targets in fake_queue] == [("x1", ('10.0.0.1:1',)), ("y1", ('10.0.0.1:2',))]
+    assert results == [None, None, None]
+    assert stats["camera@10.0.0.1:1"]["dropped"] == 1
+    assert stats["camera@10.0.0.1:2"]["dropped"] == 0
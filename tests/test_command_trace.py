@@ -0,0 +1,24 @@
+# test_command_trace.py
+from collections import deque
+import pytest
+import command_trace
+import events_pb2
+
+@pytest.fixture(autouse=True)
+def no_recent_traces(monkeypatch):
+    monkeypatch.setattr(command_trace, '_recent', deque(maxlen=10))
+
+def pause():
+    return events_pb2.Request(pauseToggle=events_pb2.PauseToggle(), withAck=True)
+
+def chat(text):
+    return events_pb2.Request(customMatch_SendChat=events_pb2.CustomMatch_SendChat(text=text), withAck=True)
+
+def test_recent_traces_are_newest_first_and_limited():
+    traces = [command_trace.begin(request) for request in (pause(), chat("a"), chat("b"))]
+    ids = [t.trace_id for t in traces]
+    assert [t["traceId"] for t in command_trace.recent_traces()] == ids[::-1]
+    assert [t["traceId"] for t in command_trace.recent_traces(2)] == ids[:0:-1]
+    assert command_trace.recent_traces(0) == []
+    assert [t["traceId"] for t in command_trace.recent_traces(1, command='pauseToggle')] == ids[:1]
+    assert command_trace.recent_traces(0, command='pauseToggle') == []
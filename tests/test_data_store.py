@@ -0,0 +1,152 @@
+# test_data_store.py
+import asyncio
+from collections import OrderedDict
+import fakeredis
+import pytest
+import redis.asyncio as redis
+import config
+import data_store
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    pool = fakeredis.aioredis.FakeRedis(server=server).connection_pool
+    monkeypatch.setattr(data_store, 'redis_pool', pool)
+    monkeypatch.setattr(data_store, 'redis_client', redis.Redis(connection_pool=pool))
+    monkeypatch.setattr(data_store, '_cache', OrderedDict())
+    monkeypatch.setattr(data_store, '_versions', {})
+    monkeypatch.setattr(data_store, '_pending_writes', {})
+    monkeypatch.setattr(data_store, '_pending_appends', [])
+    monkeypatch.setattr(data_store, '_pending_since', None)
+    yield server
+
+def test_snapshot_is_one_hash_per_session():
+    async def run():
+        await data_store.update_data_store('rtech.liveapi.MatchSetup', {"map": "mp_rr_tropic"})
+        await data_store.update_data_store('rtech.liveapi.MatchSetup', {"map": "mp_rr_desertlands"}, session='lobby-b')
+        r = await data_store.get_redis_connection()
+        return (await data_store.get_data_store(), await data_store.get_data_store('lobby-b'),
+                sorted(await r.keys('*')))
+
+    primary, other, keys = asyncio.run(run())
+    assert primary == {'rtech.liveapi.MatchSetup': {"map": "mp_rr_tropic"}}
+    assert other == {'rtech.liveapi.MatchSetup': {"map": "mp_rr_desertlands"}}
+    assert keys == [config.REDIS_STATE_KEY.encode(), f"{config.REDIS_STATE_KEY}:lobby-b".encode()]
+
+def test_reads_are_served_from_the_cache_until_invalidated():
+    async def run():
+        await data_store.update_data_store('rtech.liveapi.Init', {"gameVersion": "1"})
+        hits_before = data_store._cache_hits
+        assert await data_store.get_data_by_type('rtech.liveapi.Init') == {"gameVersion": "1"}
+        assert data_store._cache_hits == hits_before + 1
+        # Another process writes the field and announces it
+        r = await data_store.get_redis_connection()
+        await r.hset(config.REDIS_STATE_KEY, 'rtech.liveapi.Init', '{"gameVersion": "2"}')
+        data_store.invalidate_cached((config.REDIS_STATE_KEY, 'rtech.liveapi.Init'))
+        return await data_store.get_data_by_type('rtech.liveapi.Init')
+
+    assert asyncio.run(run()) == {"gameVersion": "2"}
+
+def test_writer_coalesces_writes_to_the_same_field():
+    async def run():
+        await data_store.start_redis_writer()
+        coalesced_before = data_store._writes_coalesced
+        for i in range(5):
+            await data_store.update_data_store('rtech.liveapi.PlayerStatChanged', {"newValue": i})
+        await data_store.update_data_store('rtech.liveapi.PlayerKilled', {"timestamp": 1})
+        assert len(data_store._pending_writes) == 2
+        await data_store.stop_redis_writer()
+        return data_store._writes_coalesced - coalesced_before, await data_store.get_data_store()
+
+    coalesced, snapshot = asyncio.run(run())
+    assert coalesced == 4
+    assert snapshot == {'rtech.liveapi.PlayerStatChanged': {"newValue": 4},
+                        'rtech.liveapi.PlayerKilled': {"timestamp": 1}}
+
+def test_failed_flush_is_retried_and_newer_values_win(monkeypatch):
+    write_batch = data_store._write_batch
+    calls = []
+
+    async def flaky_write_batch(batch, appends=()):
+        calls.append(dict(batch))
+        if len(calls) == 1:
+            raise ConnectionError("Redis went away")
+        await write_batch(batch, appends)
+
+    monkeypatch.setattr(data_store, '_write_batch', flaky_write_batch)
+    monkeypatch.setattr(config, 'REDIS_WRITE_FLUSH_INTERVAL', 0.001)
+
+    async def run():
+        await data_store.start_redis_writer()
+        errors_before, flushes_before = data_store._flush_errors, data_store._flushes
+        await data_store.update_data_store('rtech.liveapi.Init', {"gameVersion": "1"})
+        while not calls:
+            await asyncio.sleep(0.001)
+        # Queued while the failed batch waits for its retry
+        await data_store.update_data_store('rtech.liveapi.Init', {"gameVersion": "2"})
+        while data_store._flushes == flushes_before:
+            await asyncio.sleep(0.001)
+        await data_store.stop_redis_writer()
+        return data_store._flush_errors - errors_before, await data_store.get_data_store()
+
+    errors, snapshot = asyncio.run(asyncio.wait_for(run(), 5))
+    assert errors == 1
+    assert len(calls) == 2
+    assert snapshot == {'rtech.liveapi.Init': {"gameVersion": "2"}}
+    assert data_store.get_writer_stats()["pending"] == 0
+
+def test_writer_stops_even_if_redis_swallows_the_cancel(monkeypatch):
+    written = []
+    started = asyncio.Event()
+
+    async def slow_write_batch(batch, appends=()):
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            # As redis-py can while a pipeline is executing
+            pass
+        written.append(dict(batch))
+
+    monkeypatch.setattr(data_store, '_write_batch', slow_write_batch)
+
+    async def run():
+        await data_store.start_redis_writer()
+        await data_store.update_data_store('rtech.liveapi.Init', {"gameVersion": "1"})
+        await started.wait()
+        stopping = asyncio.ensure_future(data_store.stop_redis_writer())
+        done, _ = await asyncio.wait((stopping,), timeout=1)
+        assert done, "stop_redis_writer() hung"
+
+    asyncio.run(run())
+    assert written == [{(config.REDIS_STATE_KEY, 'rtech.liveapi.Init'): '{"gameVersion": "1"}'}]
+    assert data_store._writer_task is None
+
+def test_invalidation_listener_stops_even_if_redis_swallows_the_cancel(monkeypatch):
+    listening = asyncio.Event()
+    swallowed = []
+
+    async def stubborn_listener():
+        while True:
+            listening.set()
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                if swallowed:
+                    raise
+                # The first cancel is swallowed, as redis-py can while reading from its connection
+                swallowed.append(1)
+
+    monkeypatch.setattr(data_store, '_listen_for_invalidations', stubborn_listener)
+
+    async def run():
+        await data_store.start_cache_invalidation_listener()
+        task = data_store._invalidation_task
+        await listening.wait()
+        stopping = asyncio.ensure_future(data_store.stop_cache_invalidation_listener())
+        done, _ = await asyncio.wait((stopping,), timeout=1)
+        assert done, "stop_cache_invalidation_listener() hung"
+        return task.done() and task.cancelled()
+
+    assert asyncio.run(run()), "the listener was still running after stop_cache_invalidation_listener()"
+    assert swallowed
@@ -0,0 +1,30 @@
+# test_event_envelope.py
+import orjson
+import events_pb2
+from event_envelope import EventEnvelope
+
+def killed():
+    message = events_pb2.PlayerKilled(timestamp=42, weapon="R-301")
+    message.attacker.nucleusHash = 'a'
+    message.victim.nucleusHash = 'v'
+    return message
+
+def test_raw_payload_is_decoded_once_and_shared():
+    envelope = EventEnvelope('rtech.liveapi.PlayerKilled', raw=killed().SerializeToString(),
+                             message_class=events_pb2.PlayerKilled)
+    assert envelope.message is envelope.message
+    assert envelope.message.weapon == "R-301"
+    assert envelope.data is envelope.data
+    assert envelope.json_bytes is envelope.json_bytes
+    assert orjson.loads(envelope.json_bytes) == {"timestamp": "42", "weapon": "R-301",
+                                                 "attacker": {"nucleusHash": "a"}, "victim": {"nucleusHash": "v"}}
+
+def test_nothing_is_built_until_asked_for():
+    envelope = EventEnvelope('rtech.liveapi.PlayerKilled', raw=b'not a message', message_class=events_pb2.PlayerKilled)
+    assert envelope._message is None and envelope._data is None and envelope._json is None
+
+def test_dict_only_events():
+    envelope = EventEnvelope('derived.PlayerOutsideRing', data={"nucleusHash": "a", "distance": 1.5}, session='lobby-a')
+    assert envelope.message is None
+    assert orjson.loads(envelope.json_bytes) == {"nucleusHash": "a", "distance": 1.5}
+    assert envelope.session == 'lobby-a'
@@ -0,0 +1,29 @@
+# test_event_registry.py
+import events_pb2
+import event_registry
+import websocket_server
+
+async def _handler(envelope):
+    pass
+
+def test_table_covers_every_message_type():
+    table = event_registry.build_decoder_table(_handler)
+    expected = {f"type.googleapis.com/rtech.liveapi.{name}" for name in events_pb2.DESCRIPTOR.message_types_by_name}
+    assert set(table) == expected
+    for type_url, entry in table.items():
+        assert type_url == event_registry.TYPE_URL_PREFIX + entry.type_name
+        assert entry.message_class.DESCRIPTOR.full_name == entry.type_name
+
+def test_handler_overrides_apply_to_their_type_only():
+    async def init_handler(envelope):
+        pass
+
+    table = event_registry.build_decoder_table(_handler, {'rtech.liveapi.Init': init_handler})
+    assert table['type.googleapis.com/rtech.liveapi.Init'].handler is init_handler
+    assert table['type.googleapis.com/rtech.liveapi.PlayerKilled'].handler is _handler
+
+def test_server_decodes_every_packed_event():
+    for name in events_pb2.DESCRIPTOR.message_types_by_name:
+        event = events_pb2.LiveAPIEvent()
+        event.gameMessage.Pack(getattr(events_pb2, name)())
+        assert event.gameMessage.type_url in websocket_server.DECODERS
@@ -0,0 +1,47 @@
+# test_health.py
+import asyncio
+import fakeredis
+import redis.asyncio as redis
+import config
+import data_store
+import health
+
+def test_probe_reads_the_stored_state_in_one_round_trip(monkeypatch):
+    pool = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer()).connection_pool
+    monkeypatch.setattr(data_store, 'redis_client', redis.Redis(connection_pool=pool))
+    monitor = health.HealthMonitor()
+
+    async def run():
+        r = await data_store.get_redis_connection()
+        await r.hset(config.REDIS_STATE_KEY, mapping={health.LOBBY_PLAYERS_TYPE: '{}', 'rtech.liveapi.Init': '{}'})
+        await monitor.probe_redis()
+
+    asyncio.run(run())
+    assert monitor.redis_connected and monitor.redis_error is None
+    assert (monitor.stored_types, monitor.stored_lobby, monitor.stored_response) == (2, True, False)
+
+def test_probe_loop_stops_even_if_the_cancel_is_swallowed(monkeypatch):
+    monkeypatch.setattr(config, 'HEALTH_REDIS_PROBE_INTERVAL', 0.001)
+    probes, swallowed = [], []
+
+    async def probe_redis():
+        probes.append(1)
+        try:
+            await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            if swallowed:
+                raise
+            # As redis-py can while the probe's pipeline is executing
+            swallowed.append(1)
+
+    monkeypatch.setattr(health.monitor, 'probe_redis', probe_redis)
+
+    async def run():
+        health.start_health_probe()
+        task = health._probe_task
+        while not probes:
+            await asyncio.sleep(0.001)
+        await health.stop_health_probe()
+        return task.done()
+
+    assert asyncio.run(run()), "probe loop kept running after stop_health_probe()"
@@ -0,0 +1,264 @@
+# test_ingest_pipeline.py
+import asyncio
+import events_pb2
+import ingest_pipeline
+import session_registry
+from combat_ledger import CombatLedger
+from event_envelope import EventEnvelope
+from ingest_pipeline import COALESCE, DROP, LOSSLESS, SinkQueue
+from match_state import MatchState
+
+def stat_changed(nucleus_hash, stat, value, session=session_registry.DEFAULT_SESSION):
+    message = events_pb2.PlayerStatChanged(statName=stat, newValue=value)
+    message.player.nucleusHash = nucleus_hash
+    return EventEnvelope('rtech.liveapi.PlayerStatChanged', message=message, session=session)
+
+def observer_switched(observer, target):
+    message = events_pb2.ObserverSwitched()
+    message.observer.nucleusHash = observer
+    message.target.nucleusHash = target
+    return EventEnvelope('rtech.liveapi.ObserverSwitched', message=message, session=session_registry.DEFAULT_SESSION)
+
+def event(type_name, timestamp=0, session=session_registry.DEFAULT_SESSION):
+    return EventEnvelope(type_name, data={"timestamp": timestamp}, session=session)
+
+async def drain(sink):
+    """Runs the sink's worker until its queue is empty."""
+    sink.start()
+    while sink._slots:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    await sink.stop()
+
+def collecting_sink(received, **kwargs):
+    async def handler(envelope):
+        received.append(envelope)
+    return SinkQueue('test', handler, **kwargs)
+
+def test_drop_policy_discards_when_full():
+    received = []
+
+    async def run():
+        sink = collecting_sink(received, maxsize=2, policies={'rtech.liveapi.Type': DROP})
+        for i in range(3):
+            await sink.offer(event('rtech.liveapi.Type', i))
+        await drain(sink)
+        return sink
+
+    sink = asyncio.run(run())
+    assert [e.data["timestamp"] for e in received] == [0, 1]
+    assert sink.dropped == 1
+
+def test_coalesce_keeps_latest_per_player_and_stat():
+    received = []
+
+    async def run():
+        sink = collecting_sink(received, policies={'rtech.liveapi.PlayerStatChanged': COALESCE})
+        await sink.offer(stat_changed('a', 'kills', 1))
+        await sink.offer(stat_changed('b', 'kills', 1))
+        await sink.offer(stat_changed('a', 'kills', 2))
+        await sink.offer(stat_changed('a', 'damageDealt', 50))
+        await sink.offer(stat_changed('a', 'kills', 3))
+        await drain(sink)
+        return sink
+
+    sink = asyncio.run(run())
+    assert [(e.message.player.nucleusHash, e.message.statName, e.message.newValue) for e in received] == \
+        [('a', 'kills', 3), ('b', 'kills', 1), ('a', 'damageDealt', 50)]
+    assert sink.coalesced == 2
+
+def test_coalesce_is_per_session():
+    received = []
+
+    async def run():
+        sink = collecting_sink(received, policies={'rtech.liveapi.PlayerStatChanged': COALESCE})
+        await sink.offer(stat_changed('a', 'kills', 1, session='lobby-a'))
+        await sink.offer(stat_changed('a', 'kills', 2, session='lobby-b'))
+        await drain(sink)
+
+    asyncio.run(run())
+    assert len(received) == 2
+
+def test_observer_switches_coalesce_per_observer():
+    received = []
+
+    async def run():
+        sink = collecting_sink(received, policies={'rtech.liveapi.ObserverSwitched': COALESCE})
+        await sink.offer(observer_switched('obs1', 'p1'))
+        await sink.offer(observer_switched('obs2', 'p2'))
+        await sink.offer(observer_switched('obs1', 'p3'))
+        await drain(sink)
+
+    asyncio.run(run())
+    assert [(e.message.observer.nucleusHash, e.message.target.nucleusHash) for e in received] == \
+        [('obs1', 'p3'), ('obs2', 'p2')]
+
+def test_lossless_waits_for_room_instead_of_dropping():
+    received = []
+
+    async def run():
+        sink = collecting_sink(received, maxsize=2, policies={'rtech.liveapi.PlayerKilled': LOSSLESS})
+        sink.start()
+        await asyncio.gather(*(sink.offer(event('rtech.liveapi.PlayerKilled', i)) for i in range(10)))
+        while sink._slots:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await sink.stop()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sorted(e.data["timestamp"] for e in received) == list(range(10))
+    assert sink.dropped == 0
+    assert sink.peak_depth <= 2
+
+def test_default_policy_covers_unlisted_types():
+    received = []
+
+    async def run():
+        # As the history sink is registered: nothing listed, every type lossless
+        sink = collecting_sink(received, maxsize=1, policies={}, default_policy=LOSSLESS)
+        sink.start()
+        await asyncio.gather(*(sink.offer(event('rtech.liveapi.WeaponSwitched', i)) for i in range(5)))
+        while sink._slots:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await sink.stop()
+        return sink
+
+    sink = asyncio.run(run())
+    assert len(received) == 5
+    assert sink.dropped == 0 and sink.coalesced == 0
+
+def test_accepts_and_primary_only_filter_events():
+    received = []
+
+    async def run():
+        sink = collecting_sink(received, accepts={'rtech.liveapi.PlayerKilled'}, primary_only=True)
+        primary = session_registry.registry.primary
+        await sink.offer(event('rtech.liveapi.PlayerKilled', 1, session=primary))
+        await sink.offer(event('rtech.liveapi.PlayerDamaged', 2, session=primary))
+        await sink.offer(event('rtech.liveapi.PlayerKilled', 3, session='some-other-lobby'))
+        await drain(sink)
+
+    asyncio.run(run())
+    assert [e.data["timestamp"] for e in received] == [1]
+
+class FakeConnection:
+    def __init__(self, port):
+        self.remote_address = ('10.0.0.1', port)
+
+def damaged(attacker, victim, amount, source):
+    message = events_pb2.PlayerDamaged(timestamp=amount, damageInflicted=amount)
+    message.attacker.nucleusHash, message.attacker.teamId = attacker, 2
+    message.victim.nucleusHash, message.victim.teamId = victim, 3
+    return EventEnvelope('rtech.liveapi.PlayerDamaged', message=message, source=source,
+                         session=session_registry.registry.session_of(source))
+
+def killed(attacker, victim, source):
+    message = events_pb2.PlayerKilled()
+    message.awardedTo.nucleusHash, message.awardedTo.teamId = attacker, 2
+    message.victim.nucleusHash, message.victim.teamId = victim, 3
+    return EventEnvelope('rtech.liveapi.PlayerKilled', message=message, source=source,
+                         session=session_registry.registry.session_of(source))
+
+def test_observers_of_one_lobby_are_counted_once(monkeypatch):
+    monkeypatch.setattr(session_registry, 'registry', session_registry.SessionRegistry())
+    registry = session_registry.registry
+    observers = [FakeConnection(1), FakeConnection(2)]
+    for observer in observers:
+        registry.connect(observer)
+        registry.identify(observer, events_pb2.Init(name="Lobby A"))
+    state, ledger = MatchState(), CombatLedger()
+
+    async def handler(envelope):
+        state.apply(envelope.type_name, envelope.message)
+        ledger.apply(envelope.type_name, envelope.message)
+
+    async def run():
+        sink = SinkQueue('trackers', handler, policies={}, default_policy=LOSSLESS, primary_only=True, source_only=True)
+        # Both observers see the same fight
+        for observer in observers:
+            await sink.offer(damaged('a', 'b', 40, observer))
+            await sink.offer(killed('a', 'b', observer))
+        # The first observer drops out and the second one carries on
+        registry.disconnect(observers[0])
+        await sink.offer(damaged('a', 'c', 25, observers[1]))
+        await drain(sink)
+
+    asyncio.run(run())
+    attacker = state.players['a']
+    assert (attacker.kills, attacker.damage_dealt) == (1, 65)
+    assert state.teams[2].kills == 1
+    assert len(ledger) == 3
+    assert registry.sessions["Lobby-A"].to_dict()["source"] == "10.0.0.1:2"
+
+def test_failing_sink_keeps_going():
+    async def handler(envelope):
+        if envelope.data["timestamp"] == 1:
+            raise ValueError("bad event")
+
+    async def run():
+        sink = SinkQueue('test', handler, policies={}, default_policy=LOSSLESS)
+        for i in range(3):
+            await sink.offer(event('rtech.liveapi.Type', i))
+        await drain(sink)
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.processed == 3
+    assert sink.errors == 1
+
+def test_frames_flow_from_decode_stage_to_every_sink():
+    first, second = [], []
+
+    async def decode(frame, source):
+        await ingest_pipeline.dispatch(event('rtech.liveapi.PlayerKilled', frame))
+
+    async def run():
+        ingest_pipeline.register_sink('first', lambda e: _append(first, e))
+        ingest_pipeline.register_sink('second', lambda e: _append(second, e))
+        await ingest_pipeline.start_pipeline(decode)
+        try:
+            for i in range(20):
+                await ingest_pipeline.submit_frame(i)
+            while len(first) < 20 or len(second) < 20:
+                await asyncio.sleep(0.001)
+            return ingest_pipeline.get_pipeline_stats()
+        finally:
+            await ingest_pipeline.stop_pipeline()
+
+    stats = asyncio.run(asyncio.wait_for(run(), 5))
+    assert [e.data["timestamp"] for e in first] == list(range(20))
+    assert [e.data["timestamp"] for e in second] == list(range(20))
+    assert stats["sinks"]["first"]["processed"] == 20
+
+async def _append(received, envelope):
+    received.append(envelope)
+
+def test_stopped_sink_ends_even_if_its_handler_swallows_the_cancel():
+    received, swallowed = [], []
+
+    async def handler(envelope):
+        received.append(envelope)
+        try:
+            await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            if swallowed:
+                raise
+            # As redis-py can in the middle of a pipeline
+            swallowed.append(1)
+
+    async def run():
+        sink = SinkQueue('test', handler, policies={}, default_policy=LOSSLESS)
+        sink.start()
+        task = sink._task
+        for i in range(3):
+            await sink.offer(event('rtech.liveapi.Type', i))
+        while not received:
+            await asyncio.sleep(0)
+        await sink.stop()
+        return task.done(), len(received)
+
+    done, handled = asyncio.run(run())
+    assert done, "sink worker kept running after stop()"
+    assert handled == 1
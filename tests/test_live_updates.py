@@ -0,0 +1,56 @@
+# test_live_updates.py
+import asyncio
+import pytest
+import config
+import live_updates
+
+@pytest.fixture(autouse=True)
+def clean_feed():
+    yield
+    live_updates._subscribers.clear()
+    live_updates._latest.clear()
+
+def test_slow_subscribers_only_get_the_latest_event_per_topic():
+    async def run():
+        subscriber = live_updates.subscribe()
+        for players in (1, 2, 3):
+            live_updates.publish(live_updates.LOBBY, {"players": players})
+        live_updates.publish(live_updates.SETTINGS, {"mode": "x"})
+        frames = await subscriber.next_frames(1)
+        late = live_updates.subscribe()
+        return frames, await late.next_frames(1), await subscriber.next_frames(0.01)
+
+    frames, late_frames, nothing_new = asyncio.run(run())
+    assert frames == [live_updates.encode(live_updates.LOBBY, {"players": 3}),
+                      live_updates.encode(live_updates.SETTINGS, {"mode": "x"})]
+    # New subscribers start from the latest value of every topic
+    assert late_frames == frames
+    assert nothing_new == []
+
+def test_unchanged_payloads_are_not_pushed_again():
+    async def run():
+        subscriber = live_updates.subscribe()
+        live_updates.publish(live_updates.STATUS, {"ok": True})
+        await subscriber.next_frames(1)
+        live_updates.publish(live_updates.STATUS, {"ok": True})
+        return await subscriber.next_frames(0.01)
+
+    assert asyncio.run(run()) == []
+
+def test_stopping_the_feed_waits_for_the_status_loop(monkeypatch):
+    monkeypatch.setattr(config, 'LIVE_STATUS_INTERVAL', 0.001)
+    calls = []
+
+    async def build_status():
+        calls.append(1)
+        return {"status": "ok"}
+
+    async def run():
+        live_updates.start_status_feed(build_status)
+        task = live_updates._status_task
+        while not calls:
+            await asyncio.sleep(0.001)
+        await live_updates.stop_live_updates()
+        return task.done()
+
+    assert asyncio.run(run()), "status loop kept running after stop_live_updates()"
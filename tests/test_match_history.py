@@ -0,0 +1,126 @@
+# test_match_history.py
+import asyncio
+from collections import OrderedDict
+import fakeredis
+import pytest
+import redis.asyncio as redis
+import config
+import data_store
+import events_pb2
+import match_history
+from event_envelope import EventEnvelope
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    pool = fakeredis.aioredis.FakeRedis(server=server).connection_pool
+    monkeypatch.setattr(data_store, 'redis_pool', pool)
+    monkeypatch.setattr(data_store, 'redis_client', redis.Redis(connection_pool=pool))
+    monkeypatch.setattr(data_store, '_cache', OrderedDict())
+    monkeypatch.setattr(data_store, '_versions', {})
+    monkeypatch.setattr(data_store, '_pending_writes', {})
+    monkeypatch.setattr(data_store, '_pending_appends', [])
+    monkeypatch.setattr(data_store, '_pending_since', None)
+    monkeypatch.setattr(match_history, 'current_matches', {})
+    yield server
+
+def init(timestamp, session='lobby-a'):
+    return EventEnvelope('rtech.liveapi.Init', message=events_pb2.Init(timestamp=timestamp, name="Lobby A"),
+                         session=session)
+
+def match_setup(timestamp, session='lobby-a'):
+    return EventEnvelope('rtech.liveapi.MatchSetup', message=events_pb2.MatchSetup(timestamp=timestamp, serverId="srv"),
+                         session=session)
+
+def killed(timestamp, session='lobby-a'):
+    return EventEnvelope('rtech.liveapi.PlayerKilled', message=events_pb2.PlayerKilled(timestamp=timestamp),
+                         session=session)
+
+def record(*envelopes):
+    async def run():
+        for envelope in envelopes:
+            await match_history.history_sink(envelope)
+    asyncio.run(run())
+
+def test_init_mid_match_does_not_split_the_match():
+    # An observer reconnects halfway through the match and sends its Init
+    record(init(1), match_setup(2), killed(3), init(4), killed(5))
+    assert match_history.current_matches == {'lobby-a': 'srv-2'}
+
+    async def read():
+        return await match_history.list_matches(), await match_history.get_history('srv-2')
+
+    matches, history = asyncio.run(read())
+    assert [m["match_id"] for m in matches] == ['srv-2', 'lobby-a-init-1']
+    assert [e["type"] for e in history["events"]] == [
+        'rtech.liveapi.MatchSetup', 'rtech.liveapi.PlayerKilled', 'rtech.liveapi.Init', 'rtech.liveapi.PlayerKilled']
+
+def test_init_starts_a_match_when_nothing_is_being_recorded():
+    record(init(1), killed(2))
+    assert match_history.current_matches == {'lobby-a': 'lobby-a-init-1'}
+
+def read(*args, **kwargs):
+    return asyncio.run(match_history.get_history(*args, **kwargs))
+
+def timestamps(page):
+    return [int(e["data"]["timestamp"]) for e in page["events"]]
+
+def test_pages_follow_the_cursor_to_the_end():
+    record(match_setup(1), *[killed(t) for t in range(2, 7)])
+    first = read('srv-1', count=4)
+    assert timestamps(first) == [1, 2, 3, 4]
+    second = read('srv-1', count=4, cursor=first["next_cursor"])
+    assert timestamps(second) == [5, 6]
+    assert second["next_cursor"] is None
+
+def test_start_and_end_take_stream_ids_and_ms_timestamps():
+    record(match_setup(1), *[killed(t) for t in range(2, 6)])
+    ids = [e["id"] for e in read('srv-1')["events"]]
+    assert timestamps(read('srv-1', start=ids[1], end=ids[3])) == [2, 3, 4]
+    first_ms, last_ms = ids[0].split('-')[0], ids[-1].split('-')[0]
+    assert timestamps(read('srv-1', start=first_ms, end=last_ms)) == [1, 2, 3, 4, 5]
+    # A timestamp as the end takes in every entry of that millisecond
+    assert len(read('srv-1', end=first_ms)["events"]) == sum(i.startswith(first_ms + '-') for i in ids)
+
+def test_type_filter_scans_past_short_pages():
+    record(match_setup(1), killed(2), init(3), init(4), init(5), killed(6), init(7), killed(8))
+    page = read('srv-1', event_type='PlayerKilled', count=2)
+    assert timestamps(page) == [2, 6]
+    rest = read('srv-1', event_type='rtech.liveapi.PlayerKilled', count=2, cursor=page["next_cursor"])
+    assert timestamps(rest) == [8]
+    assert rest["next_cursor"] is None
+
+@pytest.mark.parametrize('bad', [dict(start='yesterday'), dict(end='1-2-3'), dict(cursor='(1-0'), dict(start='+')])
+def test_malformed_ranges_are_refused(bad):
+    record(match_setup(1))
+    with pytest.raises(ValueError):
+        read('srv-1', **bad)
+
+def test_every_append_keeps_the_first_expiry(monkeypatch):
+    monkeypatch.setattr(config, 'HISTORY_TTL_SECONDS', 100)
+    record(match_setup(1), killed(2))
+
+    async def ttl_after_more_events():
+        r = await data_store.get_redis_connection()
+        await r.expire(match_history.stream_key('srv-1'), 50)
+        await match_history.history_sink(killed(3))
+        return await r.ttl(match_history.stream_key('srv-1'))
+
+    assert 0 < asyncio.run(ttl_after_more_events()) <= 50
+
+def test_expired_and_excess_matches_leave_the_index(monkeypatch):
+    monkeypatch.setattr(config, 'HISTORY_MAX_MATCHES', 2)
+    record(match_setup(1), killed(2), match_setup(3), killed(4))
+
+    async def expire_first_and_start_two_more():
+        r = await data_store.get_redis_connection()
+        await r.delete(match_history.stream_key('srv-1'))
+        await match_history.history_sink(match_setup(5))
+        await match_history.history_sink(killed(6))
+        await match_history.history_sink(match_setup(7))
+        return await match_history.list_matches(), sorted(await r.keys(f"{config.HISTORY_KEY_PREFIX}:srv-*"))
+
+    matches, streams = asyncio.run(expire_first_and_start_two_more())
+    # srv-1 expired; srv-3 was the oldest beyond the cap once srv-7 started
+    assert [m["match_id"] for m in matches] == ['srv-7', 'srv-5']
+    assert streams == [f"{config.HISTORY_KEY_PREFIX}:srv-{n}".encode() for n in (5, 7)]
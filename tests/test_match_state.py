@@ -0,0 +1,88 @@
+# test_match_state.py
+import orjson
+import pytest
+import events_pb2
+from match_state import MatchState
+from roster import roster
+
+def player(i, team=None):
+    return events_pb2.Player(name=f"Player{i}", nucleusHash=f"{i:032x}", teamId=i // 3 + 2 if team is None else team)
+
+def damaged(attacker, victim, amount):
+    message = events_pb2.PlayerDamaged(damageInflicted=amount)
+    message.attacker.CopyFrom(player(attacker))
+    message.victim.CopyFrom(player(victim))
+    return 'rtech.liveapi.PlayerDamaged', message
+
+def killed(attacker, victim):
+    message = events_pb2.PlayerKilled()
+    message.attacker.CopyFrom(player(attacker))
+    message.victim.CopyFrom(player(victim))
+    message.awardedTo.CopyFrom(player(attacker))
+    return 'rtech.liveapi.PlayerKilled', message
+
+def squad_eliminated(team):
+    message = events_pb2.SquadEliminated()
+    for i in range(team * 3, team * 3 + 3):
+        message.players.add().CopyFrom(player(i))
+    return 'rtech.liveapi.SquadEliminated', message
+
+def match_setup():
+    return 'rtech.liveapi.MatchSetup', events_pb2.MatchSetup(map="mp_rr_tropic", serverId="srv")
+
+@pytest.fixture(autouse=True)
+def empty_roster():
+    roster.rebuild({})
+    yield
+    roster.rebuild({})
+
+def replay(state, *events):
+    for type_name, message in events:
+        state.apply(type_name, message)
+
+def test_kills_and_damage_are_tallied_per_player_and_team():
+    state = MatchState()
+    replay(state, match_setup(), damaged(0, 3, 40), damaged(1, 3, 25), killed(0, 3), damaged(3, 0, 10))
+    scoreboard = orjson.loads(state.player_scoreboard_json())
+    top = scoreboard["players"][0]
+    assert (top["name"], top["kills"], top["damageDealt"], top["damageTaken"]) == ("Player0", 1, 40, 10)
+    assert state.players[f"{3:032x}"].deaths == 1
+    assert not state.players[f"{3:032x}"].alive
+    team = state.teams[2]
+    assert (team.kills, team.damage_dealt) == (1, 65)
+    assert state.teams[3].alive_players == 0
+
+def test_placement_counts_teams_in_the_lobby_that_have_not_shown_up_yet():
+    roster.rebuild({"players": [{"name": f"Player{i}", "nucleusHash": f"{i:032x}", "teamId": i // 3 + 2}
+                                for i in range(60)]})
+    state = MatchState()
+    replay(state, match_setup(), damaged(0, 3, 10), squad_eliminated(1), squad_eliminated(0))
+    assert state.team_count == 20
+    assert state.teams[3].placement == 20
+    assert state.teams[2].placement == 19
+
+def test_placement_without_a_roster_uses_the_teams_seen():
+    state = MatchState()
+    replay(state, match_setup(), damaged(0, 3, 10), damaged(6, 9, 10), squad_eliminated(1))
+    assert state.teams[3].placement == 4
+
+def test_match_end_freezes_until_the_next_match_setup():
+    state = MatchState()
+    replay(state, match_setup(), killed(0, 3), ('rtech.liveapi.MatchStateEnd', events_pb2.MatchStateEnd(state="WinnerDetermined")))
+    frozen_version = state.version
+    replay(state, killed(0, 4))
+    assert state.version == frozen_version
+    assert state.players[f"{0:032x}"].kills == 1
+    assert orjson.loads(state.team_scoreboard_json())["frozen"] is True
+    replay(state, match_setup())
+    assert not state.frozen
+    assert state.players == {} and state.teams == {}
+
+def test_scoreboard_is_rendered_once_per_change():
+    state = MatchState()
+    replay(state, match_setup(), damaged(0, 3, 10))
+    first = state.team_scoreboard_json()
+    assert state.team_scoreboard_json() is first
+    replay(state, damaged(0, 3, 10))
+    assert state.team_scoreboard_json() is not first
+    assert orjson.loads(state.team_scoreboard_json())["teams"][0]["damageDealt"] == 20
@@ -0,0 +1,56 @@
+# test_metrics.py
+import pytest
+import metrics
+
+@pytest.fixture(autouse=True)
+def own_registry(monkeypatch):
+    monkeypatch.setattr(metrics, '_registry', [])
+
+def test_histogram_buckets_are_cumulative_up_to_inf():
+    histogram = metrics.Histogram('test_seconds', 'Test latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert metrics.render().splitlines() == [
+        '# HELP test_seconds Test latency',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 3.65',
+        'test_seconds_count 4',
+    ]
+
+def test_labelled_histogram_keeps_labels_before_le():
+    histogram = metrics.Histogram('test_seconds', 'Test latency', ('route',), buckets=(1,))
+    histogram.labels('/batch').observe(2)
+    assert metrics.render().splitlines()[2:] == [
+        'test_seconds_bucket{route="/batch",le="1"} 0',
+        'test_seconds_bucket{route="/batch",le="+Inf"} 1',
+        'test_seconds_sum{route="/batch"} 2.0',
+        'test_seconds_count{route="/batch"} 1',
+    ]
+
+def test_counter_labels_and_escaping():
+    counter = metrics.Counter('test_total', 'Test events', ('client', 'result'))
+    counter.labels('10.0.0.1:1', 'acked').inc()
+    counter.labels('10.0.0.1:1', 'acked').inc(2)
+    counter.labels('back\\slash "quoted"\nline', 'failed').inc()
+    counter.remove('nobody', 'acked')
+    assert metrics.render().splitlines() == [
+        '# HELP test_total Test events',
+        '# TYPE test_total counter',
+        'test_total{client="10.0.0.1:1",result="acked"} 3',
+        'test_total{client="back\\\\slash \\"quoted\\"\\nline",result="failed"} 1',
+    ]
+
+def test_unlabelled_counter_and_collected_gauge():
+    metrics.Counter('test_frames_total', 'Frames').inc(5)
+    metrics.Collected('test_depth', 'Queue depth', ('queue',), lambda: {('frames',): 7})
+    assert metrics.render() == (
+        '# HELP test_frames_total Frames\n'
+        '# TYPE test_frames_total counter\n'
+        'test_frames_total 5\n'
+        '# HELP test_depth Queue depth\n'
+        '# TYPE test_depth gauge\n'
+        'test_depth{queue="frames"} 7\n'
+    )
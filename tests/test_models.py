@@ -0,0 +1,62 @@
+# test_models.py
+import orjson
+import events_pb2
+import match_state
+from models import PlayerRegistry, registry
+
+def wire_player(**fields):
+    """A Player message parsed from bytes, so its strings are fresh objects as off the websocket."""
+    return events_pb2.Player.FromString(events_pb2.Player(**fields).SerializeToString())
+
+def test_one_shared_player_per_nucleus_hash():
+    players = PlayerRegistry()
+    first = players.from_message(wire_player(nucleusHash="ab" * 16, name="Wraith_Main", teamId=2, teamName="Alpha"))
+    again = players.from_message(wire_player(nucleusHash="ab" * 16, name="Wraith_Main", teamId=2, character="wraith"))
+    assert again is first
+    assert first.character == "wraith"
+    assert first.team_name == "Alpha"
+    row = players.lobby_row({"nucleusHash": "ab" * 16, "name": "Wraith_Main", "teamId": 2})
+    assert row.name is first.name and row.nucleus_hash is first.nucleus_hash
+    assert len(players) == 1
+
+def test_identity_strings_are_interned():
+    players = PlayerRegistry()
+    a = players.from_message(wire_player(nucleusHash="a" * 32, name="Player", hardwareName="PC-STEAM", teamId=2))
+    b = players.from_message(wire_player(nucleusHash="b" * 32, name="Player", hardwareName="PC-STEAM", teamId=3))
+    assert a.name is b.name
+    assert a.hardware_name is b.hardware_name
+
+def test_team_moves_update_membership():
+    players = PlayerRegistry()
+    player = players.from_message(wire_player(nucleusHash="c" * 32, name="Mover", teamId=2))
+    players.from_message(wire_player(nucleusHash="c" * 32, name="Mover", teamId=5, teamName="Echo"))
+    assert player.team_id == 5 and player.team_name == "Echo"
+    assert players.team(2).players == {}
+    assert players.team(5).players == {player.key: player}
+
+def test_players_without_a_hash_are_keyed_by_name_but_report_no_hash():
+    players = PlayerRegistry()
+    bot = players.from_message(wire_player(name="Dummy", teamId=2))
+    assert bot.key == "Dummy"
+    assert bot.nucleus_hash == ""
+    assert players.get("Dummy") is bot
+    assert bot.to_dict()["nucleusHash"] == ""
+
+def test_scoreboard_reports_an_empty_hash_for_hashless_players():
+    state = match_state.MatchState()
+    state.apply('rtech.liveapi.MatchSetup', events_pb2.MatchSetup())
+    damaged = events_pb2.PlayerDamaged(damageInflicted=12)
+    damaged.attacker.CopyFrom(wire_player(name="Dummy", teamId=2))
+    damaged.victim.CopyFrom(wire_player(nucleusHash="d" * 32, name="Target", teamId=3))
+    state.apply('rtech.liveapi.PlayerDamaged', damaged)
+    rows = {row["name"]: row for row in orjson.loads(state.player_scoreboard_json())["players"]}
+    assert rows["Dummy"]["nucleusHash"] == ""
+    assert rows["Target"]["nucleusHash"] == "d" * 32
+    assert orjson.loads(state.team_scoreboard_json())["teams"][0]["players"] == ["Dummy"]
+
+def test_match_setup_clears_the_shared_registry():
+    state = match_state.MatchState()
+    registry.from_message(wire_player(nucleusHash="e" * 32, name="Leftover", teamId=2))
+    state.apply('rtech.liveapi.MatchSetup', events_pb2.MatchSetup())
+    assert len(registry) == 0
+    assert registry.teams == {}
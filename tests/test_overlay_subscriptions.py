@@ -0,0 +1,126 @@
+# test_overlay_subscriptions.py
+import asyncio
+import orjson
+import pytest
+import config
+import events_pb2
+import match_state
+import overlay_subscriptions
+from event_envelope import EventEnvelope
+from match_state import MatchState
+from overlay_subscriptions import OverlayHub, Subscriber
+
+class FakeOverlay:
+    def __init__(self):
+        self.remote_address = ('10.0.0.9', 4000)
+        self.closed_with = None
+
+    async def close(self, code, reason):
+        self.closed_with = code
+
+def player(i):
+    return events_pb2.Player(name=f"Player{i}", nucleusHash=f"{i:032x}", teamId=i // 3 + 2)
+
+def damaged(attacker, victim, amount):
+    message = events_pb2.PlayerDamaged(damageInflicted=amount)
+    message.attacker.CopyFrom(player(attacker))
+    message.victim.CopyFrom(player(victim))
+    return 'rtech.liveapi.PlayerDamaged', message
+
+def killed(attacker, victim):
+    message = events_pb2.PlayerKilled(timestamp=attacker * 100 + victim, weapon="R-301")
+    message.attacker.CopyFrom(player(attacker))
+    message.victim.CopyFrom(player(victim))
+    message.awardedTo.CopyFrom(player(attacker))
+    return 'rtech.liveapi.PlayerKilled', message
+
+@pytest.fixture(autouse=True)
+def fresh_hub(monkeypatch):
+    monkeypatch.setattr(overlay_subscriptions, 'hub', OverlayHub())
+    monkeypatch.setattr(match_state, 'state', MatchState())
+    match_state.state.apply('rtech.liveapi.MatchSetup', events_pb2.MatchSetup(map="mp_rr_tropic"))
+
+def subscribe(**request):
+    subscriber = Subscriber(FakeOverlay())
+    overlay_subscriptions.hub.subscribers.add(subscriber)
+    assert overlay_subscriptions._apply_request(subscriber, {"op": "subscribe", **request}) is None
+    return subscriber
+
+def received(subscriber):
+    frames = []
+    while not subscriber.queue.empty():
+        frames.append(orjson.loads(subscriber.queue.get_nowait()))
+    return frames
+
+async def kill_feed(*events):
+    for type_name, message in events:
+        await overlay_subscriptions.overlay_sink(EventEnvelope(type_name, message=message))
+
+def test_subscribe_sends_a_snapshot_then_only_changed_fields():
+    match_state.state.apply(*damaged(0, 3, 40))
+    subscriber = subscribe(topics=["players"])
+    snapshot, = received(subscriber)
+    assert (snapshot["op"], snapshot["topic"]) == ("snapshot", "players")
+    keys = {p["name"]: key for key, p in snapshot["data"].items()}
+    assert snapshot["data"][keys["Player0"]]["damageDealt"] == 40
+
+    match_state.state.apply(*damaged(0, 3, 25))
+    overlay_subscriptions.hub.tick()
+    delta, = received(subscriber)
+    assert (delta["op"], delta["seq"]) == ("delta", snapshot["seq"] + 1)
+    assert delta["data"]["changed"] == {keys["Player0"]: {"damageDealt": 65}, keys["Player3"]: {"damageTaken": 65}}
+    assert delta["data"]["removed"] == []
+    # Nothing changed, nothing sent
+    overlay_subscriptions.hub.tick()
+    assert received(subscriber) == []
+
+def test_player_and_team_filters():
+    for attacker, victim in ((0, 3), (4, 7), (6, 1)):
+        match_state.state.apply(*damaged(attacker, victim, 10))
+    by_player = subscribe(topics=["players", "kills"], players=[f"{0:032x}"])
+    # Team ids may be sent as strings
+    by_team = subscribe(topics=["teams", "kills"], teams=["3"])
+
+    players_snapshot, kills_snapshot = received(by_player)
+    assert [p["name"] for p in players_snapshot["data"].values()] == ["Player0"]
+    assert kills_snapshot["data"] == []
+    teams_snapshot, _ = received(by_team)
+    assert list(teams_snapshot["data"]) == ["3"]
+
+    asyncio.run(kill_feed(killed(0, 3), killed(6, 4), killed(6, 7)))
+    assert [(f["topic"], f["data"]["victim"]["name"]) for f in received(by_player)] == [("kills", "Player3")]
+    # Player3 and Player4 are on team 3, Player6 and Player7 on team 4
+    assert [(f["topic"], f["data"]["victim"]["name"]) for f in received(by_team)] == [
+        ("kills", "Player3"), ("kills", "Player4")]
+
+    # A late subscriber gets the recent kills it is interested in as its snapshot
+    late = subscribe(topics=["kills"], players=[f"{6:032x}"])
+    snapshot, = received(late)
+    assert [e["victim"]["name"] for e in snapshot["data"]] == ["Player4", "Player7"]
+
+def test_bad_requests_are_refused():
+    subscriber = Subscriber(FakeOverlay())
+    apply = overlay_subscriptions._apply_request
+    assert "unknown topics" in apply(subscriber, {"op": "subscribe", "topics": ["weather"]})
+    assert "expected" in apply(subscriber, {"op": "listen", "topics": ["kills"]})
+    assert "players must be" in apply(subscriber, {"op": "subscribe", "topics": ["kills"], "players": "abc"})
+    assert "teams must be" in apply(subscriber, {"op": "subscribe", "topics": ["kills"], "teams": [True]})
+    assert subscriber.topics == set()
+
+def test_slow_consumer_is_disconnected_when_its_buffer_overflows(monkeypatch):
+    monkeypatch.setattr(config, 'OVERLAY_SEND_BUFFER', 3)
+
+    async def run():
+        subscriber = subscribe(topics=["kills"])
+        # Never drained: the snapshot and two kills fill the buffer, the third overflows it
+        await kill_feed(killed(0, 3), killed(0, 4), killed(0, 5), killed(0, 6))
+        await asyncio.sleep(0)
+        return subscriber
+
+    subscriber = asyncio.run(run())
+    hub = overlay_subscriptions.hub
+    assert subscriber.slow
+    assert subscriber not in hub.subscribers
+    assert subscriber.websocket.closed_with == overlay_subscriptions.SLOW_CONSUMER_CLOSE_CODE
+    assert hub.slow_disconnects == 1
+    assert subscriber.queue.qsize() == 3
@@ -0,0 +1,96 @@
+# test_pending_requests.py
+import asyncio
+import pytest
+import pending_requests
+import session_registry
+
+LOBBY = 'rtech.liveapi.CustomMatch_LobbyPlayers'
+
+@pytest.fixture(autouse=True)
+def clear_in_flight():
+    yield
+    pending_requests._in_flight.clear()
+
+def test_concurrent_callers_share_one_request():
+    sent = []
+
+    async def run():
+        callers = [asyncio.create_task(pending_requests.request(LOBBY, lambda: sent.append(1))) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert pending_requests.is_waiting(LOBBY, session_registry.current())
+        pending_requests.resolve(LOBBY, {"players": []}, session_registry.current())
+        return await asyncio.gather(*callers)
+
+    assert asyncio.run(run()) == [{"players": []}] * 5
+    assert sent == [1]
+    assert not pending_requests._in_flight
+
+def test_timeout_lets_the_next_caller_send_again():
+    sent = []
+
+    async def run():
+        assert await pending_requests.request(LOBBY, lambda: sent.append(1), timeout=0.01) is None
+        assert not pending_requests._in_flight
+        again = asyncio.create_task(pending_requests.request(LOBBY, lambda: sent.append(2), timeout=1))
+        await asyncio.sleep(0)
+        pending_requests.resolve(LOBBY, {"ok": True}, session_registry.current())
+        return await again
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert sent == [1, 2]
+
+def test_failed_send_releases_the_request():
+    def send():
+        raise RuntimeError("no game client")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await pending_requests.request(LOBBY, send)
+
+    asyncio.run(run())
+    assert not pending_requests._in_flight
+
+def test_cancelled_owner_releases_the_request():
+    async def run():
+        owner = asyncio.create_task(pending_requests.request(LOBBY, lambda: None))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.gather(owner, return_exceptions=True)
+
+    asyncio.run(run())
+    assert not pending_requests._in_flight
+
+def test_joiners_still_get_the_result_after_the_owner_is_cancelled():
+    sent = []
+
+    async def run():
+        owner = asyncio.create_task(pending_requests.request(LOBBY, lambda: sent.append(1)))
+        joiner = asyncio.create_task(pending_requests.request(LOBBY, lambda: sent.append(2)))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.gather(owner, return_exceptions=True)
+        assert pending_requests.is_waiting(LOBBY, session_registry.current())
+        pending_requests.resolve(LOBBY, {"players": []}, session_registry.current())
+        return await joiner
+
+    assert asyncio.run(run()) == {"players": []}
+    assert sent == [1]
+    assert not pending_requests._in_flight
+
+def test_requests_are_kept_apart_per_session():
+    sent = []
+
+    async def run():
+        token = session_registry.use('lobby-b')
+        try:
+            other = asyncio.create_task(pending_requests.request(LOBBY, lambda: sent.append('b')))
+        finally:
+            session_registry.reset(token)
+        primary = asyncio.create_task(pending_requests.request(LOBBY, lambda: sent.append('primary')))
+        await asyncio.sleep(0)
+        pending_requests.resolve(LOBBY, {"lobby": "b"}, 'lobby-b')
+        pending_requests.resolve(LOBBY, {"lobby": "primary"}, session_registry.registry.primary)
+        return await asyncio.gather(other, primary)
+
+    assert asyncio.run(run()) == [{"lobby": "b"}, {"lobby": "primary"}]
+    assert sent == ['b', 'primary']
@@ -0,0 +1,81 @@
+# test_positions.py
+import asyncio
+import pytest
+import events_pb2
+import positions
+from event_envelope import EventEnvelope
+from positions import PositionTable
+
+def player(name, team, x, y, z=0.0, health=100):
+    message = events_pb2.Player(name=name, nucleusHash=f"hash-{name}", teamId=team, currentHealth=health)
+    message.pos.x, message.pos.y, message.pos.z = x, y, z
+    return message
+
+def filled_table():
+    table = PositionTable(capacity=2)
+    table.update(player("a1", 2, 0, 0))
+    table.update(player("a2", 2, 300, 400))
+    table.update(player("b1", 3, 100, 0))
+    table.update(player("c1", 4, 5000, 0))
+    return table
+
+def test_rows_are_reused_and_the_table_grows():
+    table = filled_table()
+    assert len(table) == 4
+    assert table.update(player("a1", 2, 10, 20, 30, health=42), timestamp=7) == 0
+    assert len(table) == 4
+    assert table.get("hash-a1")["pos"] == [10.0, 20.0, 30.0]
+    assert table.get("hash-a1")["currentHealth"] == 42
+    assert table.get("missing") is None
+    assert table.update(events_pb2.Player()) is None
+
+def test_within_returns_nearest_first():
+    table = filled_table()
+    assert [p["name"] for p in table.within((0, 0, 0), 600)] == ["a1", "b1", "a2"]
+    assert [p["name"] for p in table.within((0, 0, 0), 600, team_id=2)] == ["a1", "a2"]
+    assert table.within((0, 0, 0), 600)[2]["distance"] == pytest.approx(500.0)
+    table.set_alive(player("b1", 3, 0, 0), False)
+    assert [p["name"] for p in table.within((0, 0, 0), 600)] == ["a1", "a2"]
+    assert [p["name"] for p in table.within((0, 0, 0), 600, alive_only=False)] == ["a1", "b1", "a2"]
+
+def test_closest_enemy_skips_teammates_and_the_dead():
+    table = filled_table()
+    assert table.closest_enemy("hash-a1")["name"] == "b1"
+    table.set_alive(player("b1", 3, 0, 0), False)
+    assert table.closest_enemy("hash-a1")["name"] == "c1"
+    table.set_alive(player("c1", 4, 0, 0), False)
+    assert table.closest_enemy("hash-a1") is None
+    assert table.closest_enemy("missing") is None
+
+def test_team_spreads_match_team_spread():
+    table = filled_table()
+    spread = table.team_spread(2)
+    assert spread["centroid"] == [150.0, 200.0, 0.0]
+    assert spread["spread"] == pytest.approx(250.0)
+    assert spread["maxDistance"] == pytest.approx(250.0)
+    spreads = {s["teamId"]: s for s in table.team_spreads()}
+    assert sorted(spreads) == [2, 3, 4]
+    for team_id, entry in spreads.items():
+        assert entry == pytest.approx(table.team_spread(team_id))
+    assert table.team_spread(9) is None
+
+def test_sink_reads_every_player_field_and_resets_on_match_setup():
+    killed = events_pb2.PlayerKilled(timestamp=5)
+    killed.attacker.CopyFrom(player("a1", 2, 0, 0))
+    killed.victim.CopyFrom(player("b1", 3, 100, 0))
+    switched = events_pb2.ObserverSwitched()
+    switched.observer.CopyFrom(player("camera", 1, 0, 0))
+    switched.target.CopyFrom(player("a2", 2, 300, 400))
+
+    async def run():
+        positions.table.reset()
+        await positions.position_sink(EventEnvelope('rtech.liveapi.PlayerKilled', message=killed))
+        await positions.position_sink(EventEnvelope('rtech.liveapi.ObserverSwitched', message=switched))
+        seen = sorted(positions.table.hashes), positions.table.get("hash-b1")["alive"]
+        await positions.position_sink(EventEnvelope('rtech.liveapi.MatchSetup', message=events_pb2.MatchSetup()))
+        return seen
+
+    seen, victim_alive = asyncio.run(run())
+    assert seen == ["hash-a1", "hash-a2", "hash-b1"]
+    assert victim_alive is False
+    assert len(positions.table) == 0
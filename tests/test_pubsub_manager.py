@@ -0,0 +1,86 @@
+# test_pubsub_manager.py
+import asyncio
+import concurrent.futures
+import pytest
+import config
+import pubsub_manager
+
+class StandInPublisher:
+    """Records what the publish loop hands over and acks (or fails) it right away."""
+
+    def __init__(self, fail=False):
+        self.published = []
+        self.fail = fail
+        self.stopped = False
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, **attributes):
+        self.published.append((topic, data, attributes))
+        future = concurrent.futures.Future()
+        if self.fail:
+            future.set_exception(RuntimeError("publish failed"))
+        else:
+            future.set_result(str(len(self.published)))
+        return future
+
+    def stop(self):
+        self.stopped = True
+
+@pytest.fixture(autouse=True)
+def reset_publisher():
+    yield
+    pubsub_manager.publisher = None
+    pubsub_manager._publish_queue = None
+    pubsub_manager._publisher_task = None
+    pubsub_manager._messages_in_flight = 0
+
+def test_publish_before_start_is_refused():
+    assert pubsub_manager.publish_message('{}') is False
+
+def test_messages_are_published_in_batches_with_their_session():
+    client = StandInPublisher()
+    published_before = pubsub_manager.messages_published.value
+
+    async def run():
+        await pubsub_manager.start_publisher(client)
+        for i in range(250):
+            assert pubsub_manager.publish_message(f'{{"n": {i}}}', session='lobby-a' if i % 2 else None)
+        await pubsub_manager.stop_publisher()
+
+    asyncio.run(run())
+    assert len(client.published) == 250
+    assert client.published[0] == ("projects/%s/topics/%s" % (config.PROJECT_ID, config.TOPIC_ID), b'{"n": 0}', {})
+    assert client.published[1][2] == {"session": "lobby-a"}
+    assert [data for _, data, _ in client.published] == [f'{{"n": {i}}}'.encode() for i in range(250)]
+    assert client.stopped
+    assert pubsub_manager.messages_published.value - published_before == 250
+    assert pubsub_manager._messages_in_flight == 0
+
+def test_full_queue_drops_and_counts(monkeypatch):
+    monkeypatch.setattr(config, 'PUBSUB_QUEUE_MAXSIZE', 3)
+    dropped_before = pubsub_manager.messages_dropped.value
+
+    async def run():
+        await pubsub_manager.start_publisher(StandInPublisher())
+        # The publish loop hasn't run yet, so the fourth message finds the queue full
+        results = [pubsub_manager.publish_message(b'x') for _ in range(4)]
+        await pubsub_manager.stop_publisher()
+        return results
+
+    assert asyncio.run(run()) == [True, True, True, False]
+    assert pubsub_manager.messages_dropped.value - dropped_before == 1
+
+def test_failed_publishes_are_counted():
+    errors_before = pubsub_manager.publish_errors.value
+
+    async def run():
+        await pubsub_manager.start_publisher(StandInPublisher(fail=True))
+        pubsub_manager.publish_message(b'x')
+        pubsub_manager.publish_message(b'y')
+        await pubsub_manager.stop_publisher()
+
+    asyncio.run(run())
+    assert pubsub_manager.publish_errors.value - errors_before == 2
+    assert pubsub_manager.get_pubsub_status()["in_flight"] == 0
@@ -0,0 +1,75 @@
+# test_ring.py
+import pytest
+import events_pb2
+import ring
+from positions import PositionTable
+from ring import RingTracker
+
+def player(name, team, x, y):
+    message = events_pb2.Player(name=name, nucleusHash=f"hash-{name}", teamId=team)
+    message.pos.x, message.pos.y, message.pos.z = x, y, 5000.0
+    return message
+
+def start_closing(radius, end_radius, duration, stage=1):
+    message = events_pb2.RingStartClosing(stage=stage, currentRadius=radius, endRadius=end_radius,
+                                          shrinkDuration=duration)
+    message.center.x, message.center.y = 0.0, 0.0
+    return 'rtech.liveapi.RingStartClosing', message
+
+def finished_closing(radius, stage=1):
+    message = events_pb2.RingFinishedClosing(stage=stage, currentRadius=radius)
+    return 'rtech.liveapi.RingFinishedClosing', message
+
+def tracker_with_players():
+    table = PositionTable()
+    table.update(player("inside", 2, 100, 0))
+    table.update(player("edge", 3, 0, 600))
+    table.update(player("far", 4, 900, 0))
+    return table, RingTracker(table)
+
+def test_radius_is_interpolated_while_closing():
+    _, tracker = tracker_with_players()
+    tracker.apply(*start_closing(1000, 500, 100), now=0)
+    assert tracker.radius_at(0) == 1000
+    assert tracker.radius_at(50) == pytest.approx(750)
+    assert tracker.radius_at(500) == 500
+    tracker.apply(*finished_closing(500), now=100)
+    assert not tracker.closing
+    assert tracker.radius_at(1000) == 500
+
+def test_tick_reports_players_leaving_and_coming_back():
+    table, tracker = tracker_with_players()
+    assert tracker.tick(now=0) == ({}, [])
+    tracker.apply(*start_closing(1000, 500, 100), now=0)
+    entered, returned = tracker.tick(now=0)
+    assert entered == {}
+    entered, returned = tracker.tick(now=80)
+    # The height of a player doesn't count, the ring is a cylinder
+    assert entered == {"hash-far": pytest.approx(300.0)}
+    entered, returned = tracker.tick(now=100)
+    assert set(entered) == {"hash-edge"}
+    table.update(player("edge", 3, 0, 100))
+    table.set_alive(player("far", 4, 0, 0), False)
+    entered, returned = tracker.tick(now=100)
+    assert entered == {}
+    assert returned == ["hash-edge"]
+    assert tracker.outside == {}
+
+def test_snapshot_is_reused_until_positions_or_radius_change():
+    table, tracker = tracker_with_players()
+    tracker.apply(*start_closing(1000, 500, 100), now=0)
+    first = tracker.snapshot(now=100)
+    assert [p["name"] for p in first["outside"]] == ["far", "edge"]
+    assert first["closing"] is False
+    assert tracker.snapshot(now=100) is first
+    table.update(player("far", 4, 0, 0))
+    assert [p["name"] for p in tracker.snapshot(now=100)["outside"]] == ["edge"]
+
+def test_derived_events_belong_to_the_primary_session(monkeypatch):
+    _, tracker = tracker_with_players()
+    monkeypatch.setattr(ring, 'tracker', tracker)
+    envelope = ring._derived_event(ring.PLAYER_OUTSIDE_RING, "hash-far", 12.5)
+    assert envelope.type_name == ring.PLAYER_OUTSIDE_RING
+    assert envelope.session == ring.session_registry.registry.primary
+    assert (envelope.data["event"], envelope.data["name"], envelope.data["teamId"], envelope.data["distance"]) == \
+        ("PlayerOutsideRing", "far", 4, 12.5)
@@ -0,0 +1,45 @@
+# test_roster.py
+from roster import PrefixIndex, RosterIndex
+
+LOBBY = {"players": [
+    {"name": "Wraith_Main", "teamId": 2, "nucleusHash": "aa01", "hardwareName": "PC-STEAM"},
+    {"name": "wattson", "teamId": 2, "nucleusHash": "aa02", "hardwareName": "PS4"},
+    {"name": "Bangalore", "teamId": 3, "nucleusHash": "bb01", "hardwareName": "PC-STEAM"},
+    {"name": "Caster", "teamId": 1, "nucleusHash": "cc01", "hardwareName": "PC-STEAM"},
+    {"name": "Pending", "teamId": 0, "hardwareName": "X1"},
+]}
+
+def test_prefix_search_is_case_insensitive_and_sorted():
+    index = PrefixIndex(["beta", "Alpha", "alpine", "Beta", "", "gamma"])
+    assert index.search("al") == ["Alpha", "alpine"]
+    assert index.search("AL", limit=1) == ["Alpha"]
+    assert index.search("be") == ["Beta", "beta"]
+    assert index.search("z") == []
+    assert len(index.search("")) == 5
+
+def test_rebuild_indexes_every_field():
+    roster = RosterIndex()
+    roster.rebuild(LOBBY)
+    assert roster.loaded
+    assert roster.search('name', 'w') == ["wattson", "Wraith_Main"]
+    assert roster.search('name', 'wr') == ["Wraith_Main"]
+    assert roster.search('hardwareName', 'pc') == ["PC-STEAM"]
+    assert roster.search('nucleusHash', 'aa') == ["aa01", "aa02"]
+    assert [p.name for p in roster.team_players(2)] == ["Wraith_Main", "wattson"]
+    assert roster.by_nucleus_hash["bb01"].team_id == 3
+
+def test_playing_team_count_leaves_out_unassigned_and_observers():
+    roster = RosterIndex()
+    roster.rebuild(LOBBY)
+    assert roster.playing_team_count() == 2
+
+def test_rebuild_replaces_the_previous_lobby():
+    roster = RosterIndex()
+    roster.rebuild(LOBBY)
+    version = roster.version
+    roster.rebuild({"players": [{"name": "Solo", "teamId": 5, "nucleusHash": "dd01"}]})
+    assert roster.version == version + 1
+    assert roster.search('name') == ["Solo"]
+    assert roster.team_players(2) == []
+    roster.rebuild({})
+    assert roster.players == [] and roster.playing_team_count() == 0
@@ -0,0 +1,98 @@
+# test_session_registry.py
+import asyncio
+import config
+import command_queue
+import data_store
+import events_pb2
+import session_registry
+from session_registry import DEFAULT_SESSION, SessionRegistry, session_id_for
+
+class FakeConnection:
+    def __init__(self, port):
+        self.remote_address = ('10.0.0.1', port)
+        self.sent = []
+
+    async def send(self, payload):
+        self.sent.append(payload)
+
+def init(name):
+    return events_pb2.Init(name=name, platform="PC", gameVersion="v1")
+
+def test_session_ids_are_safe_for_keys_and_urls():
+    assert session_id_for("Finals Lobby #2") == "Finals-Lobby-2"
+    assert session_id_for("scrims/../day1") == "scrims-..-day1"
+    assert session_id_for("") == DEFAULT_SESSION
+    assert session_id_for("***") == DEFAULT_SESSION
+
+def test_init_moves_a_connection_into_its_named_session():
+    registry = SessionRegistry()
+    observer, second_observer = FakeConnection(1), FakeConnection(2)
+    registry.connect(observer)
+    registry.connect(second_observer)
+    assert registry.session_of(observer) == DEFAULT_SESSION
+    assert registry.identify(observer, init("Lobby A")) == "Lobby-A"
+    registry.identify(second_observer, init("Lobby A"))
+    assert registry.session_of(observer) == "Lobby-A"
+    assert sorted(registry.clients("Lobby-A")) == ["10.0.0.1:1", "10.0.0.1:2"]
+    assert registry.clients(DEFAULT_SESSION) == []
+    registry.disconnect(observer)
+    assert registry.clients("Lobby-A") == ["10.0.0.1:2"]
+    assert registry.sessions["Lobby-A"].to_dict()["platform"] == "PC"
+
+def test_primary_is_the_longest_connected_session_and_sticks(monkeypatch):
+    monkeypatch.setattr(config, 'PRIMARY_SESSION', '')
+    registry = SessionRegistry()
+    first, second = FakeConnection(1), FakeConnection(2)
+    registry.connect(first)
+    registry.identify(first, init("Lobby A"))
+    registry.connect(second)
+    registry.identify(second, init("Lobby B"))
+    assert registry.primary == "Lobby-A"
+    registry.disconnect(first)
+    assert registry.primary == "Lobby-B"
+    # Stays on the last primary while nothing is connected
+    registry.disconnect(second)
+    assert registry.primary == "Lobby-B"
+    assert [s["session"] for s in registry.stats() if s["primary"]] == ["Lobby-B"]
+
+def test_configured_primary_wins(monkeypatch):
+    monkeypatch.setattr(config, 'PRIMARY_SESSION', 'Finals')
+    registry = SessionRegistry()
+    connection = FakeConnection(1)
+    registry.connect(connection)
+    registry.identify(connection, init("Scrims"))
+    assert registry.primary == "Finals"
+
+def test_state_is_namespaced_per_session():
+    assert data_store.state_key(DEFAULT_SESSION) == config.REDIS_STATE_KEY
+    assert data_store.state_key("Lobby-A") == f"{config.REDIS_STATE_KEY}:Lobby-A"
+    token = session_registry.use("Lobby-A")
+    try:
+        assert data_store.state_key() == f"{config.REDIS_STATE_KEY}:Lobby-A"
+    finally:
+        session_registry.reset(token)
+
+def test_commands_go_to_the_current_session_only(monkeypatch):
+    registry = SessionRegistry()
+    monkeypatch.setattr(session_registry, 'registry', registry)
+    lobby_a, lobby_b = FakeConnection(1), FakeConnection(2)
+    request = events_pb2.Request(customMatch_SetReady=events_pb2.CustomMatch_SetReady(isReady=True), withAck=False)
+
+    async def run():
+        for connection, name in ((lobby_a, "Lobby A"), (lobby_b, "Lobby B")):
+            registry.connect(connection)
+            registry.identify(connection, init(name))
+            command_queue.open_channel(connection)
+        token = session_registry.use("Lobby-B")
+        try:
+            traces = command_queue.submit([request])
+        finally:
+            session_registry.reset(token)
+        while traces[0].status() != "sent":
+            await asyncio.sleep(0.001)
+        for connection in (lobby_a, lobby_b):
+            command_queue.close_channel(connection)
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert lobby_a.sent == []
+    assert lobby_b.sent == [request.SerializeToString()]